@@ -0,0 +1,270 @@
+"""
+AdBounty Backend - Advertiser spend rollups
+Per-advertiser payout totals by niche, channel and day, kept up to date on every write
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from ledger import to_nano
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised only where numpy is missing
+    np = None
+
+# Niche reported for payouts not attributed to a known channel
+UNKNOWN_NICHE = "unknown"
+
+NicheOf = Callable[[Optional[int]], str]
+
+
+def is_spend(tx: Mapping) -> bool:
+    """Spend is money released to channel owners: successful payouts"""
+    return tx["tx_type"] == "payout" and tx["status"] == "success"
+
+
+def payout_day(tx: Mapping) -> int:
+    """The UTC day a payout was made, as a date ordinal"""
+    created_at = tx["created_at"]
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    return (created_at or datetime.utcnow()).toordinal()
+
+
+def spend_entries(transactions: Iterable[Mapping], niche_of: NicheOf) -> Dict[tuple, List[int]]:
+    """Sum the spend in `transactions` per (advertiser_id, day ordinal, channel_id, niche)
+    as [spent nanoTON, payouts]; the form the SQL backend stores its rollups in"""
+    entries: Dict[tuple, List[int]] = {}
+    for tx in transactions:
+        if not is_spend(tx):
+            continue
+        channel_id = tx.get("channel_id")
+        key = (tx["from_user"], payout_day(tx), channel_id, niche_of(channel_id))
+        entry = entries.get(key)
+        if entry is None:
+            entries[key] = [to_nano(tx["amount"]), 1]
+        else:
+            entry[0] += to_nano(tx["amount"])
+            entry[1] += 1
+    return entries
+
+
+class DailySeries:
+    """Spend and payout counters bucketed by day: parallel arrays over the days that had payouts.
+
+    Days are kept sorted, so writes in time order append or bump the last
+    bucket, and a date range is two bisects and a slice.
+    """
+
+    __slots__ = ("days", "spent", "payouts")
+
+    def __init__(self, days: array, spent: array, payouts: array):
+        self.days = days
+        self.spent = spent
+        self.payouts = payouts
+
+    def add(self, day: int, spent: int, payouts: int = 1) -> None:
+        days = self.days
+        if not days or day > days[-1]:
+            days.append(day)
+            self.spent.append(spent)
+            self.payouts.append(payouts)
+            return
+        index = len(days) - 1 if day == days[-1] else bisect_left(days, day)
+        if days[index] == day:
+            self.spent[index] += spent
+            self.payouts[index] += payouts
+        else:
+            days.insert(index, day)
+            self.spent.insert(index, spent)
+            self.payouts.insert(index, payouts)
+
+    def _window(self, first: Optional[int], last: Optional[int]) -> Tuple[int, int]:
+        days = self.days
+        lo = 0 if first is None else bisect_left(days, first)
+        hi = len(days) if last is None else bisect_right(days, last)
+        return lo, max(lo, hi)
+
+    def totals(self, first: Optional[int] = None, last: Optional[int] = None) -> Tuple[int, int]:
+        lo, hi = self._window(first, last)
+        return sum(self.spent[lo:hi]), sum(self.payouts[lo:hi])
+
+    def buckets(self, first: Optional[int] = None, last: Optional[int] = None) -> Iterable[Tuple[int, int, int]]:
+        lo, hi = self._window(first, last)
+        return zip(self.days[lo:hi], self.spent[lo:hi], self.payouts[lo:hi])
+
+
+class AdvertiserRollup:
+    __slots__ = ("total", "niches", "channels")
+
+    def __init__(self):
+        self.total: Optional[DailySeries] = None
+        self.niches: Dict[str, DailySeries] = {}
+        self.channels: Dict[Optional[int], DailySeries] = {}
+
+
+def _series_add(series: Optional[DailySeries], day: int, spent: int, payouts: int) -> DailySeries:
+    if series is None:
+        return DailySeries(array("q", [day]), array("q", [spent]), array("q", [payouts]))
+    series.add(day, spent, payouts)
+    return series
+
+
+def _stats(advertiser_id: int, niches, channels, days) -> dict:
+    """Shape per-niche, per-channel and per-day (spent, payouts) totals into the stats response"""
+    spent = sum(totals[0] for totals in days.values())
+    payouts = sum(totals[1] for totals in days.values())
+    by_spend = lambda item: (-item[1][0], str(item[0]))
+    return {
+        "advertiser_id": advertiser_id,
+        "spent": spent,
+        "payouts": payouts,
+        "by_niche": [
+            {"niche": niche, "spent": totals[0], "payouts": totals[1]}
+            for niche, totals in sorted(niches.items(), key=by_spend)
+        ],
+        "by_channel": [
+            {"channel_id": channel_id, "spent": totals[0], "payouts": totals[1]}
+            for channel_id, totals in sorted(channels.items(), key=by_spend)
+        ],
+        "by_day": [
+            {"day": date.fromordinal(day), "spent": totals[0], "payouts": totals[1]}
+            for day, totals in sorted(days.items())
+        ],
+    }
+
+
+def stats_from_entries(
+    advertiser_id: int, entries: Iterable[Tuple[int, Optional[int], str, int, int]]
+) -> dict:
+    """Stats from (day ordinal, channel_id, niche, spent, payouts) rows, as the SQL rollup table holds them"""
+    niches: Dict[str, List[int]] = {}
+    channels: Dict[Optional[int], List[int]] = {}
+    days: Dict[int, List[int]] = {}
+    for day, channel_id, niche, spent, payouts in entries:
+        for totals in (niches.setdefault(niche, [0, 0]), channels.setdefault(channel_id, [0, 0]), days.setdefault(day, [0, 0])):
+            totals[0] += spent
+            totals[1] += payouts
+    return _stats(advertiser_id, niches, channels, days)
+
+
+class SpendRollups:
+    """Per-advertiser spend counters, each a DailySeries: overall, per niche and per channel.
+
+    Every payout bumps one day bucket in each of three series, so a stats
+    request reads an advertiser's counters instead of scanning bounties and
+    transactions, and a date range is a slice of each series. rebuild() recomputes everything
+    from raw transactions in bulk, vectorized with NumPy when it is installed.
+    """
+
+    def __init__(self):
+        self._advertisers: Dict[int, AdvertiserRollup] = {}
+
+    def add(self, advertiser_id: int, day: int, channel_id: Optional[int], niche: str, spent: int, payouts: int = 1) -> None:
+        rollup = self._advertisers.get(advertiser_id)
+        if rollup is None:
+            rollup = self._advertisers[advertiser_id] = AdvertiserRollup()
+        rollup.total = _series_add(rollup.total, day, spent, payouts)
+        rollup.niches[niche] = _series_add(rollup.niches.get(niche), day, spent, payouts)
+        rollup.channels[channel_id] = _series_add(rollup.channels.get(channel_id), day, spent, payouts)
+
+    def add_transaction(self, tx: Mapping, niche_of: NicheOf) -> None:
+        if is_spend(tx):
+            channel_id = tx.get("channel_id")
+            self.add(tx["from_user"], payout_day(tx), channel_id, niche_of(channel_id), to_nano(tx["amount"]))
+
+    def stats(self, advertiser_id: int, since: Optional[date] = None, until: Optional[date] = None) -> dict:
+        """Spend in nanoTON between `since` and `until` (inclusive UTC days; open-ended when None)"""
+        first = since.toordinal() if since is not None else None
+        last = until.toordinal() if until is not None else None
+        rollup = self._advertisers.get(advertiser_id)
+        if rollup is None or rollup.total is None:
+            return _stats(advertiser_id, {}, {}, {})
+
+        def totals(series_by_key):
+            return {key: window for key, series in series_by_key.items() if (window := series.totals(first, last))[1]}
+
+        days = {day: (spent, payouts) for day, spent, payouts in rollup.total.buckets(first, last)}
+        return _stats(advertiser_id, totals(rollup.niches), totals(rollup.channels), days)
+
+    def rebuild(self, transactions: Iterable[Mapping], niche_of: NicheOf) -> None:
+        """Replace every rollup with totals recomputed from `transactions`"""
+        self._advertisers.clear()
+        payouts = [tx for tx in transactions if is_spend(tx)]
+        if np is None or not payouts:
+            for tx in payouts:
+                self.add_transaction(tx, niche_of)
+            return
+
+        # Factorize channels and niches to small ints so every column is an int64 array
+        channel_codes: Dict[Optional[int], int] = {}
+        niche_codes: Dict[str, int] = {}
+        count = len(payouts)
+        advertisers = np.fromiter((tx["from_user"] for tx in payouts), np.int64, count)
+        days = np.fromiter((payout_day(tx) for tx in payouts), np.int64, count)
+        channels = np.fromiter(
+            (channel_codes.setdefault(tx.get("channel_id"), len(channel_codes)) for tx in payouts), np.int64, count
+        )
+        # Amounts go through to_nano, as in add_transaction: scaling the float would round sub-nanoTON
+        # digits and amounts past 2**53 nanoTON differently from the live rollups
+        amounts = np.fromiter((to_nano(tx["amount"]) for tx in payouts), np.int64, count)
+        channel_ids = list(channel_codes)
+        niche_by_channel = np.array(
+            [niche_codes.setdefault(niche_of(channel_id), len(niche_codes)) for channel_id in channel_ids], np.int64
+        )
+        niches = niche_by_channel[channels]
+        niche_names = list(niche_codes)
+
+        rollups = self._advertisers
+        for dimension, codes, names in (("total", None, None), ("niches", niches, niche_names), ("channels", channels, channel_ids)):
+            keys = [advertisers] if codes is None else [advertisers, codes]
+            for advertiser_id, code, series in _group_series(keys, days, amounts):
+                rollup = rollups.get(advertiser_id)
+                if rollup is None:
+                    rollup = rollups[advertiser_id] = AdvertiserRollup()
+                if codes is None:
+                    rollup.total = series
+                else:
+                    getattr(rollup, dimension)[names[code]] = series
+
+    def clear(self) -> None:
+        self._advertisers.clear()
+
+    def __len__(self) -> int:
+        return len(self._advertisers)
+
+
+def _group_series(keys, days, amounts):
+    """Sum `amounts` per (*keys, day) and yield (advertiser_id, dimension code, DailySeries) per key group.
+
+    Rows are sorted once by keys then day and np.add.reduceat sums each run of
+    equal (keys, day) in int64. The runs of one key group are adjacent and in
+    day order, so each DailySeries is three slices of the run arrays.
+    """
+    order = np.lexsort([days] + keys[::-1])
+    days = days[order]
+    keys = [key[order] for key in keys]
+    size = len(days)
+
+    # group_changed marks the first row of each key group, changed the first of each (keys, day) run
+    group_changed = np.zeros(size, dtype=bool)
+    group_changed[0] = True
+    for key in keys:
+        group_changed[1:] |= key[1:] != key[:-1]
+    changed = group_changed.copy()
+    changed[1:] |= days[1:] != days[:-1]
+    starts = np.flatnonzero(changed)
+    run_days = array("q", days[starts].astype(np.int64).tobytes())
+    run_spent = array("q", np.add.reduceat(amounts[order], starts).astype(np.int64).tobytes())
+    run_payouts = array("q", np.diff(np.append(starts, size)).astype(np.int64).tobytes())
+
+    group_starts = np.flatnonzero(group_changed[starts])
+    group_stops = np.append(group_starts[1:], len(starts)).tolist()
+    first_rows = starts[group_starts]
+    advertisers = keys[0][first_rows].tolist()
+    codes = keys[1][first_rows].tolist() if len(keys) > 1 else [None] * len(first_rows)
+    for advertiser_id, code, lo, hi in zip(advertisers, codes, group_starts.tolist(), group_stops):
+        yield advertiser_id, code, DailySeries(run_days[lo:hi], run_spent[lo:hi], run_payouts[lo:hi])
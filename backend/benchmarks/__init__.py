@@ -0,0 +1,4 @@
+"""
+AdBounty Backend - Benchmarks
+Run from the backend directory, e.g. `python -m benchmarks.bench_transactions`
+"""
@@ -0,0 +1,113 @@
+"""
+Benchmark: single-item vs batch creation throughput, driven through the ASGI app
+
+Creates the same number of bounties and verifies the same number of channels
+one request per item and through the batch endpoints at batch sizes 1, 100
+and 10k, and reports items per second for each. Runs against the memory
+backend and a temporary SQLite file.
+
+Usage: python -m benchmarks.bench_batch [--items 10000] [--sizes 1,100,10000]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+import httpx
+
+from main import app, get_storage, rate_limiter
+from sql_storage import SQLStorage
+from storage import MemoryStorage, Storage
+
+
+def bounty_payload(n: int) -> dict:
+    return {
+        "advertiser_id": 1000 + n % 50,
+        "ton_amount": 1.5,
+        "ad_text": f"Ad #{n}",
+        "ad_link": "https://example.com",
+        "target_channels": [-1000 - n % 20],
+        "deadline_days": 7,
+    }
+
+
+def channel_payload(n: int) -> dict:
+    return {
+        "channel_id": -1000 - n,
+        "channel_name": f"Channel {n}",
+        "owner_id": 2000 + n,
+        "subscribers": 1000 + n * 37 % 5000,
+        "niche": ("tech", "finance", "gaming")[n % 3],
+    }
+
+
+async def one_by_one(client: httpx.AsyncClient, kind: str, items: int) -> None:
+    for n in range(items):
+        if kind == "bounties":
+            response = await client.post("/bounties/create", json=bounty_payload(n))
+        else:
+            response = await client.post("/channels/verify", params=channel_payload(n))
+        assert response.status_code == 200, response.text
+
+
+async def batched(client: httpx.AsyncClient, kind: str, items: int, size: int) -> None:
+    path, payload = ("/bounties/create/batch", bounty_payload) if kind == "bounties" else ("/channels/verify/batch", channel_payload)
+    for start in range(0, items, size):
+        response = await client.post(path, json=[payload(n) for n in range(start, min(items, start + size))])
+        assert response.status_code == 200, response.text
+
+
+async def run_backend(make_store, items: int, sizes) -> dict:
+    # Every request comes from one client; the limiter would answer 429 long before the run ends
+    rate_limiter.enabled = False
+    results = {}
+    for kind in ("bounties", "channels"):
+        for size in [None] + sizes:
+            store: Storage = await make_store()
+            app.dependency_overrides[get_storage] = lambda: store
+            try:
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+                    start = time.perf_counter()
+                    if size is None:
+                        await one_by_one(client, kind, items)
+                    else:
+                        await batched(client, kind, items, size)
+                    results[(kind, size)] = items / (time.perf_counter() - start)
+            finally:
+                app.dependency_overrides.clear()
+                await store.close()
+    return results
+
+
+async def main(items: int, sizes) -> None:
+    async def memory():
+        return MemoryStorage()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        counter = iter(range(1000))
+
+        async def sqlite():
+            store = SQLStorage(f"sqlite:///{os.path.join(tmp, f'bench{next(counter)}.db')}")
+            await store.create_schema()
+            return store
+
+        for name, make_store in (("memory", memory), ("sqlite", sqlite)):
+            results = await run_backend(make_store, items, sizes)
+            print(f"[{name}] items={items:,} (items/s)")
+            print(f"{'kind':>10} {'single':>10}" + "".join(f" {'batch ' + str(size):>12}" for size in sizes))
+            for kind in ("bounties", "channels"):
+                row = "".join(f" {results[(kind, size)]:>12,.0f}" for size in sizes)
+                print(f"{kind:>10} {results[(kind, None)]:>10,.0f}{row}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--sizes", default="1,100,10000")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(main(args.items, [int(size) for size in args.sizes.split(",")]))
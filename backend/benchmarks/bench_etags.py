@@ -0,0 +1,67 @@
+"""
+Benchmark: conditional GETs
+Times GET /bounties/{id} and GET /channels/verified through the app with and without a matching
+If-None-Match, so the cost of a 304 (one counter lookup, no store read and no encoding) can be
+compared against a full 200.
+
+Usage: python -m benchmarks.bench_etags [--channels 5000] [--requests 2000]
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+import httpx
+
+from main import app, get_storage, rate_limiter
+from storage import MemoryStorage
+
+
+async def timed(ac: httpx.AsyncClient, url: str, headers: dict, count: int, expected: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        response = await ac.get(url, headers=headers)
+        assert response.status_code == expected, response.status_code
+    return (time.perf_counter() - start) / count * 1e6
+
+
+async def run(channels: int, count: int) -> None:
+    store = MemoryStorage()
+    await store.put_channels([
+        {
+            "channel_id": -1000000 - n,
+            "channel_name": f"Channel {n}",
+            "owner_id": n,
+            "subscribers": n * 10,
+            "niche": "tech",
+            "verified": True,
+            "created_at": None,
+        }
+        for n in range(channels)
+    ])
+    app.dependency_overrides[get_storage] = lambda: store
+    rate_limiter.enabled = False
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as ac:
+            bounty_id = (await ac.post("/bounties/create", json={
+                "advertiser_id": 1, "ton_amount": 1.0, "ad_text": "Bench", "ad_link": "https://example.com",
+                "target_channels": [-1000000],
+            })).json()["bounty"]["bounty_id"]
+            for name, url in (("bounty", f"/bounties/{bounty_id}"), ("verified channels", "/channels/verified?limit=100")):
+                etag = (await ac.get(url)).headers["etag"]
+                full = await timed(ac, url, {}, count, 200)
+                cached = await timed(ac, url, {"If-None-Match": etag}, count, 304)
+                print(f"{name}: 200 in {full:.0f}us, 304 in {cached:.0f}us ({full / cached:.1f}x)")
+    finally:
+        app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    asyncio.run(run(args.channels, args.requests))
@@ -0,0 +1,70 @@
+"""
+Benchmark: memory held while streaming a transaction export
+
+Streams one user's history through the NDJSON and CSV encoders and reports
+tracemalloc's peak for allocations made during the export (the store itself is
+excluded). The peak should stay flat as the history grows.
+
+Usage: python -m benchmarks.bench_export [--sizes 10000,100000,500000]
+"""
+
+import argparse
+import asyncio
+import time
+import tracemalloc
+from datetime import datetime
+
+from exports import TRANSACTION_FIELDS, csv_lines, ndjson_lines
+from ids import new_id
+from storage import MemoryStorage
+
+USER = 1
+
+
+async def fill(store: MemoryStorage, count: int) -> None:
+    now = datetime.utcnow()
+    for n in range(count):
+        await store.add_transaction({
+            "tx_id": new_id("tx"),
+            "from_user": USER,
+            "to_user": 2 + n % 1000,
+            "amount": 1.5,
+            "tx_type": "payout",
+            "status": "success",
+            "bounty_id": new_id("bounty"),
+            "tx_hash": None,
+            "created_at": now,
+        })
+
+
+async def drain(body) -> int:
+    size = 0
+    async for chunk in body:
+        size += len(chunk)
+    return size
+
+
+async def measure(store: MemoryStorage, label: str, make_body) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = await drain(make_body(store.iter_user_transactions(USER)))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:>8} {size / 1e6:>9.1f}MB {elapsed:>7.2f}s  peak {peak / 1024:>8.0f}KiB")
+
+
+async def main(sizes) -> None:
+    for count in sizes:
+        store = MemoryStorage()
+        await fill(store, count)
+        print(f"history of {count:,} transactions")
+        await measure(store, "ndjson", ndjson_lines)
+        await measure(store, "csv", lambda records: csv_lines(records, TRANSACTION_FIELDS))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,500000")
+    args = parser.parse_args()
+    asyncio.run(main([int(s) for s in args.sizes.split(",")]))
@@ -0,0 +1,468 @@
+"""
+Benchmark: traffic mixes over every public endpoint, driven in-process through the ASGI app
+
+Runs each mix through httpx.AsyncClient with an ASGI transport and keeps `--concurrency`
+requests in flight:
+- "miniapp" is read-heavy: channel owners browsing bounties and balances, and polling with ETags.
+- "agency" is write-heavy: advertisers creating bounties, confirming payouts and reading stats.
+It reports each mix's RPS and, per endpoint, its RPS and p50/p95/p99 latency. Latency is measured
+at the client, so it includes time spent queued behind the other in-flight requests. Each run
+starts from a freshly seeded store; with --repeat the latencies of all runs are pooled and RPS is
+the median run. --backend sqlite runs SQLStorage on a new SQLite file per run.
+
+--output writes the results and the regression thresholds as JSON. --baseline compares with such
+a file, using its thresholds, and exits 1 on any regression: a mix's RPS dropped, an endpoint's
+percentile rose, or an endpoint answered errors. Run it on the same machine before and after a
+hot-path change.
+
+Usage: python -m benchmarks.bench_load [--mix miniapp,agency] [--requests 5000] [--concurrency 16]
+       [--repeat 3] [--output load.json] [--baseline load.json] [--backend memory|sqlite]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Set
+
+import httpx
+
+# Relative changes allowed before a run counts as a regression. Latency rises smaller than min_ms,
+# and percentiles of endpoints with fewer than min_count samples, are left to noise.
+THRESHOLDS = {"rps": 0.15, "p50": 0.20, "p95": 0.25, "p99": 0.35, "min_ms": 0.2, "min_count": 100}
+PERCENTILES = ("p50", "p95", "p99")
+
+# Requests per mix, by weight; between them the mixes call every endpoint outside /admin
+MIXES: Dict[str, Dict[str, int]] = {
+    "miniapp": {
+        "GET /channels/{channel_id}/bounties": 25,
+        "GET /bounties/{bounty_id}": 20,
+        "GET /channels/verified": 15,
+        "GET /users/{user_id}/balance": 10,
+        "GET /transactions/{user_id}": 8,
+        "GET /channels/search": 5,
+        "POST /bounties/{bounty_id}/bid": 5,
+        "POST /auth/telegram": 3,
+        "POST /bounties/{bounty_id}/confirm-views": 3,
+        "POST /channels/verify": 2,
+        "POST /bot/post-ad": 2,
+        "GET /health": 1,
+        "GET /metrics": 1,
+        "GET /": 1,
+    },
+    "agency": {
+        "POST /bounties/create": 25,
+        "POST /bounties/{bounty_id}/confirm-views": 15,
+        "GET /advertisers/{advertiser_id}/stats": 15,
+        "GET /bounties/{bounty_id}": 10,
+        "GET /transactions/{user_id}": 10,
+        "GET /channels/search": 10,
+        "POST /channels/verify": 5,
+        "GET /users/{user_id}/balance": 5,
+        "GET /transactions/{user_id}/export": 2,
+        "POST /bounties/create/batch": 2,
+        "POST /channels/verify/batch": 1,
+    },
+}
+
+NICHES = ("tech", "crypto", "gaming", "finance")
+ADVERTISERS = range(1000, 1050)
+OWNERS = range(3000, 3200)
+BATCH = 50
+
+
+class LoadState:
+    """What the seeded store holds, so requests name channels, bounties and users that exist"""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.channel_ids: List[int] = []
+        self.bounty_ids: List[str] = []
+        # Pending or posted bounties; confirm-views takes one out so no bounty is paid twice
+        self.open_ids: List[str] = []
+        # Bounties never posted; post-ad only accepts pending ones
+        self.pending_ids: List[str] = []
+        self.paid: Set[str] = set()
+        self.etags: Dict[str, str] = {}
+        self._next_channel = -1000000
+
+    def new_channel(self) -> dict:
+        self._next_channel -= 1
+        n = -self._next_channel
+        return {
+            "channel_id": self._next_channel,
+            "channel_name": f"Channel {n}",
+            "owner_id": self.rng.choice(OWNERS),
+            "subscribers": n * 37 % 50000,
+            "niche": NICHES[n % len(NICHES)],
+        }
+
+    def new_bounty(self) -> dict:
+        return {
+            "advertiser_id": self.rng.choice(ADVERTISERS),
+            "ton_amount": 1.5,
+            "ad_text": "Launch week: try our product",
+            "ad_link": "https://example.com/landing",
+            "target_channels": [self.rng.choice(self.channel_ids)],
+            "deadline_days": 7,
+        }
+
+    def created(self, response: httpx.Response) -> None:
+        if response.status_code == 200:
+            body = response.json()
+            bounties = [item["bounty"] for item in body["results"]] if "results" in body else [body["bounty"]]
+            for bounty in bounties:
+                self.bounty_ids.append(bounty["bounty_id"])
+                self.open_ids.append(bounty["bounty_id"])
+                self.pending_ids.append(bounty["bounty_id"])
+
+    def take_open(self) -> str:
+        if not self.open_ids:
+            raise RuntimeError("no open bounties left to confirm; raise --seed-bounties")
+        bounty_id = self.open_ids.pop(self.rng.randrange(len(self.open_ids)))
+        self.paid.add(bounty_id)
+        return bounty_id
+
+    def take_pending(self) -> str:
+        while self.pending_ids:
+            bounty_id = self.pending_ids.pop(self.rng.randrange(len(self.pending_ids)))
+            if bounty_id not in self.paid:
+                return bounty_id
+        raise RuntimeError("no pending bounties left to post; raise --seed-bounties")
+
+    def user(self) -> int:
+        return self.rng.choice(ADVERTISERS) if self.rng.random() < 0.5 else self.rng.choice(OWNERS)
+
+
+async def conditional_get(client: httpx.AsyncClient, state: LoadState, key: str, url: str, params=None):
+    """GET the way a polling client does: with the ETag of its last 200, when it has one"""
+    etag = state.etags.get(key)
+    response = await client.get(url, params=params, headers={"If-None-Match": etag} if etag else None)
+    if "ETag" in response.headers:
+        state.etags[key] = response.headers["ETag"]
+    return response
+
+
+async def get_channel_bounties(client, state):
+    return await client.get(f"/channels/{state.rng.choice(state.channel_ids)}/bounties", params={"limit": 20})
+
+
+async def get_bounty(client, state):
+    bounty_id = state.rng.choice(state.bounty_ids)
+    return await conditional_get(client, state, bounty_id, f"/bounties/{bounty_id}")
+
+
+async def get_verified_channels(client, state):
+    sort_by = state.rng.choice(("created_at", "subscribers"))
+    return await conditional_get(client, state, sort_by, "/channels/verified", {"sort_by": sort_by, "limit": 20})
+
+
+async def get_balance(client, state):
+    return await client.get(f"/users/{state.user()}/balance")
+
+
+async def get_transactions(client, state):
+    return await client.get(f"/transactions/{state.user()}", params={"limit": 20})
+
+
+async def search_channels(client, state):
+    return await client.get("/channels/search", params={
+        "niche": state.rng.sample(NICHES, 2),
+        "min_subscribers": state.rng.randrange(0, 20000),
+        "limit": 20,
+    })
+
+
+async def place_bid(client, state):
+    bounty_id = state.rng.choice(state.bounty_ids)
+    return await client.post(f"/bounties/{bounty_id}/bid", json={
+        "bounty_id": bounty_id,
+        "channel_owner_id": state.rng.choice(OWNERS),
+        "channel_id": state.rng.choice(state.channel_ids),
+    })
+
+
+async def telegram_auth(client, state):
+    user_id = state.rng.randrange(100000, 110000)
+    return await client.post("/auth/telegram", params={"telegram_id": user_id, "username": f"user{user_id}"})
+
+
+async def confirm_views(client, state):
+    bounty_id = state.take_open()
+    return await client.post(f"/bounties/{bounty_id}/confirm-views", json={
+        "bounty_id": bounty_id,
+        "channel_owner_id": state.rng.choice(OWNERS),
+    })
+
+
+async def verify_channel(client, state):
+    channel = state.new_channel()
+    response = await client.post("/channels/verify", params=channel)
+    state.channel_ids.append(channel["channel_id"])
+    return response
+
+
+async def post_ad(client, state):
+    # Posted bounties stay confirmable, so this one stays open
+    bounty_id = state.take_pending()
+    return await client.post("/bot/post-ad", params={"bounty_id": bounty_id, "channel_id": state.channel_ids[0]})
+
+
+async def health(client, state):
+    return await client.get("/health")
+
+
+async def metrics(client, state):
+    return await client.get("/metrics")
+
+
+async def root(client, state):
+    return await client.get("/")
+
+
+async def create_bounty(client, state):
+    response = await client.post("/bounties/create", json=state.new_bounty())
+    state.created(response)
+    return response
+
+
+async def advertiser_stats(client, state):
+    return await client.get(f"/advertisers/{state.rng.choice(ADVERTISERS)}/stats")
+
+
+async def export_transactions(client, state):
+    return await client.get(f"/transactions/{state.rng.choice(ADVERTISERS)}/export",
+                            params={"format": state.rng.choice(("ndjson", "csv"))})
+
+
+async def create_bounties_batch(client, state):
+    response = await client.post("/bounties/create/batch", json=[state.new_bounty() for _ in range(BATCH)])
+    state.created(response)
+    return response
+
+
+async def verify_channels_batch(client, state):
+    channels = [state.new_channel() for _ in range(BATCH)]
+    response = await client.post("/channels/verify/batch", json=channels)
+    state.channel_ids.extend(channel["channel_id"] for channel in channels)
+    return response
+
+
+OPERATIONS = {
+    "GET /channels/{channel_id}/bounties": get_channel_bounties,
+    "GET /bounties/{bounty_id}": get_bounty,
+    "GET /channels/verified": get_verified_channels,
+    "GET /users/{user_id}/balance": get_balance,
+    "GET /transactions/{user_id}": get_transactions,
+    "GET /channels/search": search_channels,
+    "POST /bounties/{bounty_id}/bid": place_bid,
+    "POST /auth/telegram": telegram_auth,
+    "POST /bounties/{bounty_id}/confirm-views": confirm_views,
+    "POST /channels/verify": verify_channel,
+    "POST /bot/post-ad": post_ad,
+    "GET /health": health,
+    "GET /metrics": metrics,
+    "GET /": root,
+    "POST /bounties/create": create_bounty,
+    "GET /advertisers/{advertiser_id}/stats": advertiser_stats,
+    "GET /transactions/{user_id}/export": export_transactions,
+    "POST /bounties/create/batch": create_bounties_batch,
+    "POST /channels/verify/batch": verify_channels_batch,
+}
+
+
+async def seed(client: httpx.AsyncClient, state: LoadState, channels: int, bounties: int) -> None:
+    """Channels and bounties through the batch endpoints, then payouts for a quarter of the bounties"""
+    for _ in range(0, channels, BATCH):
+        await verify_channels_batch(client, state)
+    for _ in range(0, bounties, BATCH):
+        response = await create_bounties_batch(client, state)
+        assert response.status_code == 200, response.text
+    for _ in range(bounties // 4):
+        response = await confirm_views(client, state)
+        assert response.status_code == 200, response.text
+
+
+async def run_mix(store, weights: Dict[str, int], args, seed_value: int):
+    """One run of a mix: (seconds, latencies per endpoint, errors per endpoint)"""
+    from main import app, get_storage
+
+    app.dependency_overrides[get_storage] = lambda: store
+    rng = random.Random(seed_value)
+    state = LoadState(rng)
+    latencies: Dict[str, List[float]] = {label: [] for label in weights}
+    errors: Dict[str, int] = {label: 0 for label in weights}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", limits=limits, timeout=None) as client:
+            await seed(client, state, args.seed_channels, args.seed_bounties)
+            # Seeding leaves a full generation 2 behind; collecting it here keeps a 40ms pause from
+            # landing at a different point in each timed run
+            gc.collect()
+            # The whole sequence is drawn up front, so runs with one seed send the same mix
+            labels = iter(rng.choices(list(weights), weights=list(weights.values()), k=args.requests))
+
+            async def worker() -> None:
+                # All workers pull from one iterator, which keeps `concurrency` requests in flight
+                for label in labels:
+                    start = time.perf_counter()
+                    response = await OPERATIONS[label](client, state)
+                    elapsed = time.perf_counter() - start
+                    if response.status_code in (200, 304):
+                        latencies[label].append(elapsed)
+                    else:
+                        errors[label] += 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            seconds = time.perf_counter() - start
+    finally:
+        app.dependency_overrides.clear()
+        await store.close()
+    return seconds, latencies, errors
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def summarize(runs, requests: int) -> dict:
+    seconds = statistics.median(run[0] for run in runs)
+    endpoints = {}
+    for label in runs[0][1]:
+        ordered = sorted(latency for run in runs for latency in run[1][label])
+        count = len(ordered) + sum(run[2][label] for run in runs)
+        entry = {"count": count, "errors": sum(run[2][label] for run in runs), "rps": round(count / len(runs) / seconds, 1)}
+        for name in PERCENTILES:
+            entry[f"{name}_ms"] = round(percentile(ordered, int(name[1:]) / 100) * 1000, 3) if ordered else None
+        endpoints[label] = entry
+    return {
+        "rps": round(requests / seconds, 1),
+        "runs_rps": [round(requests / run[0], 1) for run in runs],
+        "errors": sum(entry["errors"] for entry in endpoints.values()),
+        "endpoints": endpoints,
+    }
+
+
+def compare(results: dict, baseline: dict) -> List[str]:
+    """Regressions of `results` against `baseline`, judged by the baseline's thresholds"""
+    thresholds = {**THRESHOLDS, **baseline.get("thresholds", {})}
+    regressions = []
+    for mix, before in baseline["mixes"].items():
+        after = results["mixes"].get(mix)
+        if after is None:
+            continue
+        if after["rps"] < before["rps"] * (1 - thresholds["rps"]):
+            regressions.append(f"{mix}: {after['rps']:,.0f} rps, was {before['rps']:,.0f}")
+        for label, old in before["endpoints"].items():
+            new = after["endpoints"].get(label)
+            if new is None:
+                continue
+            if new["errors"] > old["errors"]:
+                regressions.append(f"{mix} {label}: {new['errors']} errors, was {old['errors']}")
+            if min(new["count"], old["count"]) < thresholds["min_count"]:
+                continue
+            for name in PERCENTILES:
+                was, now = old[f"{name}_ms"], new[f"{name}_ms"]
+                if was is not None and now is not None and now > was * (1 + thresholds[name]) and now - was > thresholds["min_ms"]:
+                    regressions.append(f"{mix} {label}: {name} {now:.2f}ms, was {was:.2f}ms")
+    return regressions
+
+
+def report(name: str, result: dict, before: Optional[dict]) -> None:
+    change = f" ({result['rps'] / before['rps'] - 1:+.1%})" if before else ""
+    print(f"\n{name}: {result['rps']:,.0f} rps{change}, runs {result['runs_rps']}, {result['errors']} errors")
+    print(f"{'endpoint':<42} {'count':>7} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for label, entry in sorted(result["endpoints"].items(), key=lambda item: -item[1]["count"]):
+        cells = " ".join(
+            f"{entry[f'{p}_ms']:>8.2f}" if entry[f"{p}_ms"] is not None else f"{'-':>8}" for p in PERCENTILES
+        )
+        print(f"{label:<42} {entry['count']:>7,} {entry['rps']:>8,.0f} {cells} {entry['errors']:>7}")
+
+
+async def new_store(backend: str, tmp: str, run: int):
+    from sql_storage import SQLStorage
+    from storage import MemoryStorage
+
+    if backend == "memory":
+        return MemoryStorage()
+    store = SQLStorage(f"sqlite:///{os.path.join(tmp, f'load-{run}.db')}")
+    await store.create_schema()
+    return store
+
+
+async def main(args) -> int:
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "seed_channels": args.seed_channels,
+            "seed_bounties": args.seed_bounties,
+            "backend": args.backend,
+            "python": platform.python_version(),
+        },
+        "thresholds": THRESHOLDS,
+        "mixes": {},
+    }
+    print(f"requests={args.requests:,} concurrency={args.concurrency} repeat={args.repeat} "
+          f"backend={args.backend}")
+    for name in args.mix.split(","):
+        runs = []
+        with tempfile.TemporaryDirectory() as tmp:
+            for run in range(args.repeat):
+                store = await new_store(args.backend, tmp, run)
+                runs.append(await run_mix(store, MIXES[name], args, args.seed + run))
+        results["mixes"][name] = summarize(runs, args.requests)
+        report(name, results["mixes"][name], baseline["mixes"].get(name) if baseline else None)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"\nwrote {args.output}")
+    if baseline is None:
+        return 0
+    regressions = compare(results, baseline)
+    print(f"\n{len(regressions)} regressions against {args.baseline}")
+    for line in regressions:
+        print("  " + line)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mix", default=",".join(MIXES))
+    parser.add_argument("--requests", type=int, default=5000, help="requests per run of each mix")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--seed-channels", type=int, default=500)
+    parser.add_argument("--seed-bounties", type=int, default=2000)
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--backend", choices=("memory", "sqlite"), default="memory")
+    args = parser.parse_args()
+    os.environ.setdefault("ACCESS_LOG", "0")
+    logging.disable(logging.INFO)
+    from main import rate_limiter
+
+    rate_limiter.enabled = False
+    sys.exit(asyncio.run(main(args)))
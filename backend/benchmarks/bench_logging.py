@@ -0,0 +1,123 @@
+"""
+Benchmark: what logging costs the request path
+Times one logger.info call in the calling thread, synchronously through a StreamHandler (what
+logging.basicConfig installed) and through the queued pipeline in logconfig.py. It does this with
+f-string and lazy %s messages, and with the level enabled and disabled. It then times GET
+requests through the app with every request access-logged both ways. --sink-delay-us makes
+each write slower, as when stderr is a pipe to a busy log shipper.
+
+Usage: python -m benchmarks.bench_logging [--calls 100000] [--requests 3000] [--sink-delay-us 0]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import queue
+import tempfile
+import time
+from logging.handlers import QueueListener
+
+import httpx
+
+from logconfig import AccessLog, DeferredQueueHandler, JSONFormatter, RouteSampler
+from metrics import InstrumentationMiddleware
+
+
+class SlowFile:
+    """A file whose writes block for `delay` seconds, like a pipe to a slow reader"""
+
+    def __init__(self, file, delay: float):
+        self.file = file
+        self.delay = delay
+
+    def write(self, text: str) -> None:
+        self.file.write(text)
+        if self.delay:
+            # A blocked write releases the GIL, so sleep rather than spin
+            time.sleep(self.delay)
+
+    def flush(self) -> None:
+        self.file.flush()
+
+
+def make_logger(name: str, queued: bool, stream) -> tuple:
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JSONFormatter())
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    listener = None
+    if queued:
+        records = queue.SimpleQueue()
+        listener = QueueListener(records, handler)
+        listener.start()
+        handler = DeferredQueueHandler(records)
+    logger.handlers[:] = [handler]
+    return logger, listener
+
+
+def time_calls(logger: logging.Logger, calls: int, lazy: bool, level: int = logging.INFO) -> float:
+    bounty_id, owner = "bounty_01HZX3K5Q8", 123456789
+    start = time.perf_counter()
+    if lazy:
+        for _ in range(calls):
+            logger.log(level, "Bid placed: %s on bounty %s", owner, bounty_id)
+    else:
+        for _ in range(calls):
+            logger.log(level, f"Bid placed: {owner} on bounty {bounty_id}")
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+async def time_requests(asgi_app, count: int) -> float:
+    transport = httpx.ASGITransport(app=asgi_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as ac:
+        for _ in range(100):
+            await ac.get("/health")
+        start = time.perf_counter()
+        for _ in range(count):
+            await ac.get("/health")
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main(calls: int, requests: int, sink_delay_us: float) -> None:
+    os.environ.setdefault("ACCESS_LOG", "0")
+    from main import app, rate_limiter
+
+    rate_limiter.enabled = False
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    with tempfile.TemporaryFile("w") as file:
+        sink = SlowFile(file, sink_delay_us / 1e6)
+        print(f"calls={calls:,} requests={requests:,} sink delay={sink_delay_us:.0f}us")
+        for queued in (False, True):
+            name = "queued" if queued else "sync"
+            logger, listener = make_logger(f"bench.{name}", queued, sink)
+            for lazy in (False, True):
+                style = "lazy %s" if lazy else "f-string"
+                enabled = time_calls(logger, calls, lazy)
+                disabled = time_calls(logger, calls, lazy, logging.DEBUG)
+                print(f"{name:>6} {style:>8}: {enabled:6.2f}us per call, {disabled:5.2f}us when the level is off")
+            if listener is not None:
+                listener.stop()
+
+        latencies = {}
+        for queued in (False, True):
+            name = "queued" if queued else "sync"
+            logger, listener = make_logger(f"bench.access.{name}", queued, sink)
+            asgi_app = InstrumentationMiddleware(app, [AccessLog(RouteSampler(), logger).record])
+            latencies[name] = asyncio.run(time_requests(asgi_app, requests))
+            if listener is not None:
+                listener.stop()
+        print(
+            f"GET /health with access log: {latencies['sync']:.1f}us sync, {latencies['queued']:.1f}us queued "
+            f"({latencies['sync'] - latencies['queued']:.1f}us less per request)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--sink-delay-us", type=float, default=0)
+    args = parser.parse_args()
+    main(args.calls, args.requests, args.sink_delay_us)
@@ -0,0 +1,92 @@
+"""
+Benchmark: memory per record in the in-memory stores
+Fills a MemoryStorage with channels, bounties (each with its escrow deposit) and payouts, then
+reports every store's and index's deep size and bytes per item, as /admin/memory does. Use it
+to size instances. It also times the deep-size walk and a tracemalloc snapshot, to show what
+one call to the admin endpoints costs.
+
+Usage: python -m benchmarks.bench_memory [--bounties 100000] [--channels 5000]
+"""
+
+import argparse
+import asyncio
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from ids import new_id
+from memtrace import AllocationTracer, deep_sizes
+from storage import MemoryStorage, deposit_transaction
+
+
+async def fill(store: MemoryStorage, bounties: int, channels: int) -> None:
+    now = datetime.utcnow()
+    await store.put_channels([
+        {
+            "channel_id": -1000000 - n,
+            "channel_name": f"Channel {n}",
+            "owner_id": n,
+            "subscribers": n * 37 % 50000,
+            "niche": ("tech", "crypto", "gaming", "finance")[n % 4],
+            "verified": True,
+            "created_at": now,
+        }
+        for n in range(channels)
+    ])
+    batch = []
+    for n in range(bounties):
+        batch.append({
+            "bounty_id": new_id("bounty"),
+            "advertiser_id": n % 1000,
+            "ton_amount": 1.5,
+            "ad_text": f"Ad number {n} for our product launch",
+            "ad_link": "https://example.com/landing",
+            "target_channels": [-1000000 - n % channels],
+            "status": "pending",
+            "escrow_address": None,
+            "created_at": now,
+            "deadline": now + timedelta(days=7),
+        })
+        if len(batch) == 1000:
+            await store.add_bounties(batch, [deposit_transaction(bounty, now) for bounty in batch])
+            batch = []
+    if batch:
+        await store.add_bounties(batch, [deposit_transaction(bounty, now) for bounty in batch])
+
+
+def main(bounties: int, channels: int) -> None:
+    store = MemoryStorage()
+    asyncio.run(fill(store, bounties, channels))
+    print(f"bounties={bounties:,} channels={channels:,} transactions={len(store.transactions):,}")
+
+    start = time.perf_counter()
+    sizes = deep_sizes(store.memory_structures())
+    elapsed = time.perf_counter() - start
+    for name, entry in sizes.items():
+        per_item = f"{entry['new_bytes'] / entry['items']:8.0f} B/item" if entry["items"] else " " * 15
+        print(f"{name:>22}: {entry['bytes'] / 2**20:8.1f} MiB deep, {entry['new_bytes'] / 2**20:8.1f} MiB new {per_item}")
+    total = sum(entry["new_bytes"] for entry in sizes.values())
+    print(f"{'total':>22}: {total / 2**20:8.1f} MiB, {total / bounties:.0f} B per bounty")
+    print(f"deep-size walk: {elapsed:.2f}s")
+
+    tracer = AllocationTracer()
+    start = time.perf_counter()
+    tracer.start()
+    started = time.perf_counter() - start
+    asyncio.run(fill(store, bounties // 10, channels))
+    start = time.perf_counter()
+    report = tracer.report(limit=5)
+    reported = time.perf_counter() - start
+    tracer.stop()
+    print(f"tracemalloc: start {started:.2f}s, report {reported:.2f}s, {report['tracemalloc_bytes'] / 2**20:.1f} MiB of traces")
+    for entry in report["growth"][:3]:
+        print(f"  +{entry['bytes_diff'] / 2**20:.1f} MiB {entry['where'][0]}")
+    assert not tracemalloc.is_tracing()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bounties", type=int, default=100000)
+    parser.add_argument("--channels", type=int, default=5000)
+    args = parser.parse_args()
+    main(args.bounties, args.channels)
@@ -0,0 +1,89 @@
+"""
+Benchmark: what request metrics cost
+Measures the latency a trivial ASGI app gains when wrapped in InstrumentationMiddleware: bare,
+and recording HTTPMetrics. The layer is shared with the access log. It then times a real
+GET /bounties/{id} and GET /channels/verified through the whole app. Recording metrics must stay
+under 1% of request time. Also times rendering /metrics.
+
+Usage: python -m benchmarks.bench_metrics [--requests 20000]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from metrics import HTTPMetrics, InstrumentationMiddleware
+
+BUDGET = 0.01
+
+
+async def ok_app(scope, receive, send):
+    scope["endpoint"] = ok_app
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def drive(asgi_app, path: str, count: int) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(count):
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"", "headers": [],
+            "client": ("127.0.0.1", 40000), "server": ("test", 80),
+        }
+        await asgi_app(scope, receive, send)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main(count: int) -> None:
+    os.environ.setdefault("ACCESS_LOG", "0")
+    logging.disable(logging.INFO)
+    from main import app, http_metrics, rate_limiter, storage
+
+    rate_limiter.enabled = False
+    # Best of three: the difference is a few microseconds, well inside one run's noise
+    bare = min(asyncio.run(drive(ok_app, "/", count)) for _ in range(3))
+    layer = min(asyncio.run(drive(InstrumentationMiddleware(ok_app, []), "/", count)) for _ in range(3))
+    wrapped = min(asyncio.run(drive(InstrumentationMiddleware(ok_app, [HTTPMetrics().record]), "/", count)) for _ in range(3))
+    overhead = wrapped - layer
+    print(f"requests={count:,}")
+    print(f"instrumentation layer: {layer - bare:.2f}us per request, recording metrics: {overhead:.2f}us")
+
+    async def seed():
+        await storage.put_channels([
+            {"channel_id": -n, "channel_name": f"C{n}", "owner_id": n, "subscribers": n, "niche": "tech",
+             "verified": True, "created_at": None}
+            for n in range(1, 1001)
+        ])
+        await storage.add_bounty({
+            "bounty_id": "bounty_bench", "advertiser_id": 1, "ton_amount": 1.0, "ad_text": "Bench",
+            "ad_link": "https://example.com", "target_channels": [-1], "status": "pending",
+            "escrow_address": None, "created_at": None, "deadline": None,
+        })
+    asyncio.run(seed())
+    for path in ("/bounties/bounty_bench", "/channels/verified"):
+        request = min(asyncio.run(drive(app, path, count // 4)) for _ in range(3))
+        print(
+            f"GET {path}: {request:.1f}us per request, metrics {overhead / request:.2%} of it "
+            f"({(wrapped - bare) / request:.2%} with the layer)"
+        )
+        assert overhead / request < BUDGET
+
+    start = time.perf_counter()
+    text = "\n".join(http_metrics.render(app.routes))
+    print(f"render: {(time.perf_counter() - start) * 1000:.2f}ms for {text.count(chr(10)) + 1} lines")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.requests)
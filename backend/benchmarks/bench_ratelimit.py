@@ -0,0 +1,86 @@
+"""
+Benchmark: per-request cost of the rate limiter
+Measures RateLimiter.check on its own over a realistic spread of users, IPs and routes.
+It also measures the whole middleware, as the latency a trivial ASGI app gains when wrapped
+in RateLimitMiddleware. Both should stay well under the 20us budget.
+
+Usage: python -m benchmarks.bench_ratelimit [--requests 200000] [--users 50000]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from ratelimit import Limit, RateLimiter, RateLimitMiddleware
+
+BUDGET_US = 20.0
+ROUTES = [("GET", "/channels/verified"), ("GET", "/bounties/b"), ("POST", "/bounties/create"), ("POST", "/bounties/b/bid")]
+
+
+def make_scopes(count: int, users: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    scopes = []
+    for _ in range(count):
+        method, path = rng.choice(ROUTES)
+        headers = [(b"host", b"api"), (b"user-agent", b"miniapp/1.0"), (b"accept", b"application/json")]
+        if rng.random() < 0.9:
+            headers.append((b"x-telegram-user-id", str(rng.randrange(users)).encode()))
+        scopes.append({
+            "type": "http",
+            "method": method,
+            "path": path,
+            "headers": headers,
+            "client": (f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}", 40000),
+        })
+    return scopes
+
+
+async def drive(asgi_app, scopes) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for scope in scopes:
+        await asgi_app(scope, receive, send)
+    return time.perf_counter() - start
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+def main(count: int, users: int) -> None:
+    scopes = make_scopes(count, users)
+    # Generous limits so the measured path is the common one: admitted requests
+    limiter = RateLimiter({name: Limit(1000.0, 1000) for name in ("read", "write", "create")})
+
+    start = time.perf_counter()
+    for scope in scopes:
+        limiter.check(scope)
+    check_us = (time.perf_counter() - start) / count * 1e6
+    print(f"requests={count:,} users={users:,} buckets={len(limiter.buckets):,}")
+    print(f"RateLimiter.check: {check_us:.2f}us per request")
+
+    bare = asyncio.run(drive(ok_app, scopes))
+    wrapped = asyncio.run(drive(RateLimitMiddleware(ok_app, limiter), scopes))
+    overhead_us = (wrapped - bare) / count * 1e6
+    print(f"middleware overhead: {overhead_us:.2f}us per request (budget {BUDGET_US:.0f}us)")
+
+    # Rejections skip the app entirely
+    strict = RateLimiter({name: Limit(0.001, 1) for name in ("read", "write", "create")}, ip_factor=1)
+    rejected = asyncio.run(drive(RateLimitMiddleware(ok_app, strict), scopes * 2))
+    print(f"mostly rejected: {rejected / (2 * count) * 1e6:.2f}us per request")
+    assert check_us < BUDGET_US and overhead_us < BUDGET_US
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=50000)
+    args = parser.parse_args()
+    main(args.requests, args.users)
@@ -0,0 +1,89 @@
+"""
+Benchmark: advertiser spend rollups
+Times incremental rollup updates per payout, one /advertisers/{id}/stats read against a scan
+of the same transactions, and a bulk rebuild of every rollup with NumPy and with the
+pure Python fallback.
+
+Usage: python -m benchmarks.bench_rollups [--payouts 1000000] [--advertisers 1000]
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import analytics
+from analytics import SpendRollups
+from ledger import to_nano
+
+NICHES = ["tech", "crypto", "gaming", "finance", "news"]
+
+
+def make_payouts(count: int, advertisers: int, channels: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    return [
+        {
+            "from_user": rng.randrange(advertisers),
+            "amount": rng.randrange(1, 10000) / 100,
+            "tx_type": "payout",
+            "status": "success",
+            "created_at": start + timedelta(minutes=rng.randrange(365 * 24 * 60)),
+            "channel_id": -rng.randrange(1, channels + 1),
+        }
+        for _ in range(count)
+    ]
+
+
+def scan_stats(payouts: list, advertiser_id: int, niche_of) -> dict:
+    niches, channels, days = {}, {}, {}
+    for tx in payouts:
+        if tx["from_user"] != advertiser_id:
+            continue
+        amount = to_nano(tx["amount"])
+        for totals, key in ((niches, niche_of(tx["channel_id"])), (channels, tx["channel_id"]), (days, tx["created_at"].date())):
+            totals[key] = totals.get(key, 0) + amount
+    return {"niches": niches, "channels": channels, "days": days}
+
+
+def main(count: int, advertisers: int, channels: int, repeat: int) -> None:
+    payouts = make_payouts(count, advertisers, channels)
+    niche_of = lambda channel_id: NICHES[(channel_id or 0) % len(NICHES)]
+    print(f"payouts={count:,} advertisers={advertisers:,} channels={channels:,}")
+
+    rollups = SpendRollups()
+    start = time.perf_counter()
+    for tx in payouts:
+        rollups.add_transaction(tx, niche_of)
+    elapsed = time.perf_counter() - start
+    print(f"incremental: {elapsed / count * 1e6:.2f}us per payout")
+
+    start = time.perf_counter()
+    for n in range(repeat):
+        rollups.stats(n % advertisers)
+    indexed = (time.perf_counter() - start) / repeat * 1000
+    start = time.perf_counter()
+    scan_stats(payouts, 0, niche_of)
+    scanned = (time.perf_counter() - start) * 1000
+    print(f"stats: {indexed:.3f}ms from rollups, {scanned:.1f}ms scanning transactions")
+
+    expected = rollups.stats(0)
+    for name, numpy in (("numpy", analytics.np), ("python", None)):
+        if name == "numpy" and numpy is None:
+            print("numpy rebuild: skipped, numpy is not installed")
+            continue
+        analytics.np = numpy
+        start = time.perf_counter()
+        rollups.rebuild(payouts, niche_of)
+        print(f"{name} rebuild: {time.perf_counter() - start:.2f}s")
+        assert rollups.stats(0) == expected
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payouts", type=int, default=1000000)
+    parser.add_argument("--advertisers", type=int, default=1000)
+    parser.add_argument("--channels", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+    main(args.payouts, args.advertisers, args.channels, args.repeat)
@@ -0,0 +1,90 @@
+"""
+Benchmark: /channels/search latency over a large channel set
+
+Bulk-loads ChannelSearchIndex with synthetic channels (skewed niches, log-normal
+subscriber counts) and times representative facet queries for one 50-row page,
+next to a plain scan-and-sort over the same channels.
+
+Usage: python -m benchmarks.bench_search [--channels 500000]
+"""
+
+import argparse
+import random
+import time
+
+from indexes import ChannelSearchIndex
+
+NICHES = ["tech", "crypto", "gaming", "finance", "news", "travel", "food", "music", "sport", "art"]
+# Zipf-like: the first niches hold most channels
+NICHE_WEIGHTS = [1 / (rank + 1) for rank in range(len(NICHES))]
+PAGE = 50
+
+QUERIES = {
+    "niche": dict(niches=["tech"]),
+    "rare niche": dict(niches=["art"]),
+    "two niches + range": dict(niches=["crypto", "finance"], min_subscribers=5000, max_subscribers=50000),
+    "narrow range": dict(min_subscribers=100000, max_subscribers=120000),
+    "range + verified": dict(min_subscribers=1000, verified=True),
+    "rare niche + range": dict(niches=["art"], min_subscribers=20000, max_subscribers=30000, verified=True),
+}
+
+
+def make_channels(count: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    return [
+        {
+            "channel_id": -1000000000000 - n,
+            "niche": rng.choices(NICHES, NICHE_WEIGHTS)[0],
+            "subscribers": int(rng.lognormvariate(8.5, 1.8)),
+            "verified": rng.random() < 0.7,
+        }
+        for n in range(count)
+    ]
+
+
+def scan(channels, niches=None, min_subscribers=None, max_subscribers=None, verified=None):
+    matches = [
+        ch for ch in channels
+        if (not niches or ch["niche"] in niches)
+        and (min_subscribers is None or ch["subscribers"] >= min_subscribers)
+        and (max_subscribers is None or ch["subscribers"] <= max_subscribers)
+        and (verified is None or ch["verified"] == verified)
+    ]
+    matches.sort(key=lambda ch: (-ch["subscribers"], ch["channel_id"]))
+    return matches[:PAGE], len(matches)
+
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main(count: int, repeat: int) -> None:
+    channels = make_channels(count)
+    index = ChannelSearchIndex()
+    start = time.perf_counter()
+    index.load(channels)
+    print(f"channels={count:,} bulk load {time.perf_counter() - start:.2f}s")
+
+    print(f"{'query':>22} {'matches':>9} {'index ms':>9} {'scan ms':>9}")
+    for name, query in QUERIES.items():
+        ids, total = index.search(limit=PAGE, **query)
+        assert [ch["channel_id"] for ch in scan(channels, **query)[0]] == ids
+        indexed = timed(lambda: index.search(limit=PAGE, **query), repeat)
+        scanned = timed(lambda: scan(channels, **query), 1)
+        print(f"{name:>22} {total:>9,} {indexed:>9.2f} {scanned:>9.1f}")
+
+    start = time.perf_counter()
+    for n in range(1000):
+        index.add({"channel_id": n, "niche": "tech", "subscribers": n * 10, "verified": True})
+    print(f"incremental add: {(time.perf_counter() - start):.3f}ms per channel")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=500000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.channels, args.repeat)
@@ -0,0 +1,130 @@
+"""
+Benchmark: response encoding cost per endpoint
+
+Encodes each endpoint's typical response body the way FastAPI did before
+(jsonable_encoder, then JSONResponse) and through FastJSONResponse, on cold
+records and on records whose encoding is already cached.
+
+Usage: python -m benchmarks.bench_serialization [--number 2000]
+"""
+
+import argparse
+import timeit
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from ids import new_id
+from records import BountyRecord, ChannelRecord, TransactionRecord
+from serialization import FastJSONResponse, orjson
+
+PAGE = 50
+
+
+def bounty() -> dict:
+    now = datetime.utcnow()
+    return {
+        "bounty_id": new_id("bounty"),
+        "advertiser_id": 123456789,
+        "ton_amount": 10.5,
+        "ad_text": "Check out our new product!",
+        "ad_link": "https://example.com",
+        "target_channels": [-1001234567890, -1001234567891],
+        "status": "pending",
+        "escrow_address": None,
+        "created_at": now,
+        "deadline": now + timedelta(days=7),
+    }
+
+
+def channel(n: int) -> dict:
+    return {
+        "channel_id": -1001234567890 - n,
+        "channel_name": f"Channel {n}",
+        "subscribers": 10000 + n,
+        "niche": "tech",
+        "verified": True,
+        "owner_id": 987654321,
+        "created_at": datetime.utcnow(),
+    }
+
+
+def transaction() -> dict:
+    return {
+        "tx_id": new_id("tx"),
+        "from_user": 123456789,
+        "to_user": 987654321,
+        "amount": 10.5,
+        "tx_type": "payout",
+        "status": "success",
+        "bounty_id": new_id("bounty"),
+        "tx_hash": None,
+        "created_at": datetime.utcnow(),
+    }
+
+
+def bodies(make_record):
+    """Response bodies per endpoint; make_record turns a stored dict into what the store hands back"""
+    return {
+        "POST /bounties/create": lambda: {"status": "success", "message": "Bounty created", "bounty": bounty()},
+        "GET /bounties/{id}": lambda: {"status": "success", "bounty": make_record(BountyRecord, BOUNTY)},
+        "POST /confirm-views": lambda: {
+            "status": "success",
+            "message": "Views confirmed, payout released",
+            "bounty": make_record(BountyRecord, BOUNTY),
+            "transaction": transaction(),
+        },
+        "GET /channels/verified": lambda: {
+            "status": "success",
+            "count": 10000,
+            "channels": [make_record(ChannelRecord, ch) for ch in CHANNELS],
+            "next_cursor": "WyIyMDI0LTAxLTAxIl0",
+        },
+        "GET /transactions/{id}": lambda: {
+            "status": "success",
+            "count": 10000,
+            "transactions": [make_record(TransactionRecord, tx) for tx in TRANSACTIONS],
+            "next_cursor": None,
+        },
+    }
+
+
+BOUNTY = bounty()
+CHANNELS = [channel(n) for n in range(PAGE)]
+TRANSACTIONS = [transaction() for _ in range(PAGE)]
+
+
+def main(number: int) -> None:
+    cached = {}
+
+    def warm(cls, data):
+        key = id(data)
+        if key not in cached:
+            cached[key] = cls.from_dict(data)
+            cached[key].encoded()
+        return cached[key]
+
+    def cold(cls, data):
+        return cls.from_dict(data)
+
+    print(f"encoder={'orjson' if orjson is not None else 'json'}  (us per response, body built outside the timer)")
+    print(f"{'endpoint':>24} {'fastapi':>9} {'fast':>9} {'cached':>9} {'speedup':>8}")
+    cold_bodies, warm_bodies = bodies(cold), bodies(warm)
+    for name in cold_bodies:
+        body = cold_bodies[name]()
+        warm_body = warm_bodies[name]()
+        before = timeit.timeit(lambda: JSONResponse(jsonable_encoder(body)).body, number=number) / number * 1e6
+        # Cold records re-encode every time; build fresh ones per call outside the timer
+        fresh = [cold_bodies[name]() for _ in range(number)]
+        it = iter(fresh)
+        after = timeit.timeit(lambda: FastJSONResponse(next(it)).body, number=number) / number * 1e6
+        warm_after = timeit.timeit(lambda: FastJSONResponse(warm_body).body, number=number) / number * 1e6
+        print(f"{name:>24} {before:>9.1f} {after:>9.1f} {warm_after:>9.1f} {before / warm_after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+    main(args.number)
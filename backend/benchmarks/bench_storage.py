@@ -0,0 +1,110 @@
+"""
+Benchmark: in-memory storage vs the SQL backend, driven through the ASGI app
+
+Runs the same request sequence against each backend with the storage
+dependency overridden, and reports requests per second per endpoint.
+Set DATABASE_URL to benchmark Postgres; by default a temporary SQLite file is used.
+
+Usage: python -m benchmarks.bench_storage [--requests 500] [--database-url URL]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+import httpx
+
+from main import app, get_storage, rate_limiter
+from sql_storage import SQLStorage
+from storage import MemoryStorage, Storage
+
+
+def bounty_payload(n: int) -> dict:
+    return {
+        "advertiser_id": 1000 + n % 50,
+        "ton_amount": 1.5,
+        "ad_text": f"Ad #{n}",
+        "ad_link": "https://example.com",
+        "target_channels": [-1000 - n % 20],
+        "deadline_days": 7,
+    }
+
+
+async def timed(label: str, results: dict, calls):
+    start = time.perf_counter()
+    for call in calls:
+        response = await call
+        assert response.status_code == 200, response.text
+    elapsed = time.perf_counter() - start
+    results[label] = len(calls) / elapsed
+
+
+async def run_backend(store: Storage, requests: int) -> dict:
+    app.dependency_overrides[get_storage] = lambda: store
+    # Every request comes from one client; the limiter would answer 429 long before the run ends
+    rate_limiter.enabled = False
+    results: dict = {}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await timed("POST /channels/verify", results, [
+                client.post("/channels/verify", params={
+                    "channel_id": -1000 - n,
+                    "channel_name": f"Channel {n}",
+                    "owner_id": 2000 + n,
+                    "subscribers": 1000 + n * 37 % 5000,
+                    "niche": ("tech", "finance", "gaming")[n % 3],
+                })
+                for n in range(requests)
+            ])
+            bounty_ids = []
+            start = time.perf_counter()
+            for n in range(requests):
+                response = await client.post("/bounties/create", json=bounty_payload(n))
+                bounty_ids.append(response.json()["bounty"]["bounty_id"])
+            results["POST /bounties/create"] = requests / (time.perf_counter() - start)
+
+            await timed("GET /bounties/{id}", results, [client.get(f"/bounties/{b}") for b in bounty_ids])
+            await timed("POST /bounties/{id}/confirm-views", results, [
+                client.post(f"/bounties/{b}/confirm-views", json={"bounty_id": b, "channel_owner_id": 3000 + n % 50})
+                for n, b in enumerate(bounty_ids)
+            ])
+            await timed("GET /transactions/{user}", results, [
+                client.get(f"/transactions/{1000 + n % 50}") for n in range(requests)
+            ])
+            await timed("GET /channels/verified?limit=20", results, [
+                client.get("/channels/verified", params={"sort_by": "subscribers", "limit": 20})
+                for _ in range(requests)
+            ])
+    finally:
+        app.dependency_overrides.clear()
+        await store.close()
+    return results
+
+
+async def main(requests: int, database_url: str) -> None:
+    memory = await run_backend(MemoryStorage(), requests)
+
+    sql = SQLStorage(database_url)
+    await sql.create_schema()
+    sql_results = await run_backend(sql, requests)
+
+    print(f"{'endpoint':<36} {'memory rps':>12} {'sql rps':>12} {'ratio':>7}")
+    for label, memory_rps in memory.items():
+        sql_rps = sql_results[label]
+        print(f"{label:<36} {memory_rps:>12,.0f} {sql_rps:>12,.0f} {memory_rps / sql_rps:>6.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        asyncio.run(main(args.requests, url))
@@ -0,0 +1,97 @@
+"""
+Benchmark: per-user transaction history lookup as the store grows
+
+Fills the in-memory transaction store with synthetic payouts between a pool of users and times
+GET /transactions/{user_id} for a user whose own history stays the same size.
+Latency should stay flat while the store grows to 1M+ records. A second table
+times keyset pages deep into one heavy user's history against page 1.
+
+Usage: python -m benchmarks.bench_transactions [--sizes 10000,100000,1000000]
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+import main
+from pagination import encode_cursor
+from storage import MemoryStorage
+
+PROBE_USER = 1
+PROBE_HISTORY = 50
+HEAVY_USER = 0
+HEAVY_HISTORY = 200_000
+USER_POOL = 100_000
+
+
+def make_tx(n: int, from_user: int, to_user: int, now: datetime) -> dict:
+    return {
+        "tx_id": f"tx_{n + 1}",
+        "from_user": from_user,
+        "to_user": to_user,
+        "amount": 1.0,
+        "tx_type": "payout",
+        "status": "success",
+        "bounty_id": None,
+        "tx_hash": None,
+        "created_at": now,
+    }
+
+
+async def fill(store: MemoryStorage, start: int, stop: int) -> None:
+    """Add background traffic that never involves PROBE_USER"""
+    now = datetime.utcnow()
+    for n in range(start, stop):
+        await store.add_transaction(make_tx(n, 2 + n % USER_POOL, 2 + (n * 7) % USER_POOL, now))
+
+
+async def time_lookup(store: MemoryStorage, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await main.get_transactions(PROBE_USER, limit=PROBE_HISTORY, cursor=None, store=store)
+    return (time.perf_counter() - start) / rounds
+
+
+async def time_pages(store: MemoryStorage, rounds: int) -> None:
+    now = datetime.utcnow()
+    base = 10 ** 9
+    for n in range(HEAVY_HISTORY):
+        await store.add_transaction(make_tx(base + n, HEAVY_USER, 2 + n % USER_POOL, now))
+    ids = store.transactions_by_user.ids_for_user(HEAVY_USER)
+
+    print(f"\n{'page at':>12} {'latency':>12}")
+    for fraction in (0.0, 0.5, 0.99):
+        cursor = encode_cursor((ids[int(len(ids) * fraction) - 1],)) if fraction else None
+        start = time.perf_counter()
+        for _ in range(rounds):
+            await main.get_transactions(HEAVY_USER, limit=PROBE_HISTORY, cursor=cursor, store=store)
+        per_call = (time.perf_counter() - start) / rounds
+        print(f"{fraction:>11.0%} {per_call * 1e6:>10.1f}µs")
+
+
+async def run(sizes, rounds: int) -> None:
+    store = MemoryStorage()
+
+    now = datetime.utcnow()
+    for n in range(PROBE_HISTORY):
+        await store.add_transaction(make_tx(n, PROBE_USER, 2 + n, now))
+
+    filled = PROBE_HISTORY
+    print(f"{'store size':>12} {'user txs':>9} {'lookup':>12}")
+    for size in sizes:
+        await fill(store, filled, size)
+        filled = size
+        history = len(store.transactions_by_user.ids_for_user(PROBE_USER))
+        per_call = await time_lookup(store, rounds)
+        print(f"{size:>12,} {history:>9} {per_call * 1e6:>10.1f}µs")
+
+    await time_pages(store, rounds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run([int(s) for s in args.sizes.split(",")], args.rounds))
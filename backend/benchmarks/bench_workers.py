@@ -0,0 +1,166 @@
+"""
+Benchmark: requests per second as the number of uvicorn workers grows
+
+Starts `uvicorn main:app --workers N` in shared-state mode (SQL backend on one
+SQLite file in WAL mode), seeds it, then drives a read-heavy mix over real
+HTTP from several client processes and reports RPS per worker count.
+Scaling is bounded by the cores available to the server and the load generator.
+
+Usage: python -m benchmarks.bench_workers [--workers 1,2,4] [--duration 10]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from sql_storage import SQLStorage
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def _client(base_url: str, duration: float, concurrency: int, bounty_ids, result) -> None:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        deadline = time.perf_counter() + duration
+        done = 0
+        errors = 0
+
+        async def worker() -> None:
+            nonlocal done, errors
+            rng = random.Random()
+            while time.perf_counter() < deadline:
+                roll = rng.random()
+                if roll < 0.5:
+                    response = await client.get(f"/bounties/{rng.choice(bounty_ids)}")
+                elif roll < 0.8:
+                    response = await client.get("/channels/verified", params={"limit": 20})
+                elif roll < 0.95:
+                    response = await client.get(f"/transactions/{rng.randrange(1000, 1050)}")
+                else:
+                    response = await client.post("/bounties/create", json={
+                        "advertiser_id": rng.randrange(1000, 1050),
+                        "ton_amount": 1.0,
+                        "ad_text": "Load test",
+                        "ad_link": "https://example.com",
+                        "target_channels": [-1000],
+                    })
+                if response.status_code == 200:
+                    done += 1
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        result.put((done, errors))
+
+
+def _client_process(base_url, duration, concurrency, bounty_ids, result) -> None:
+    asyncio.run(_client(base_url, duration, concurrency, bounty_ids, result))
+
+
+def _wait_healthy(base_url: str, timeout: float = 30) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/health").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server did not become healthy")
+
+
+async def _seed(base_url: str) -> list:
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        for n in range(200):
+            await client.post("/channels/verify", params={
+                "channel_id": -1000 - n,
+                "channel_name": f"Channel {n}",
+                "owner_id": 2000 + n,
+                "subscribers": 1000 + n,
+                "niche": "tech",
+            })
+        bounty_ids = []
+        for n in range(200):
+            response = await client.post("/bounties/create", json={
+                "advertiser_id": 1000 + n % 50,
+                "ton_amount": 1.0,
+                "ad_text": "Seed",
+                "ad_link": "https://example.com",
+                "target_channels": [-1000 - n],
+            })
+            bounty_id = response.json()["bounty"]["bounty_id"]
+            bounty_ids.append(bounty_id)
+            if n % 2:
+                await client.post(f"/bounties/{bounty_id}/confirm-views",
+                                  json={"bounty_id": bounty_id, "channel_owner_id": 3000 + n})
+        return bounty_ids
+
+
+def run_once(workers: int, port: int, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{os.path.join(tmp, 'shared.db')}"
+        storage = SQLStorage(database_url)
+        asyncio.run(storage.create_schema())
+        asyncio.run(storage.close())
+
+        # All clients share 127.0.0.1, so one IP bucket would cap the whole run
+        env = dict(
+            os.environ, STORAGE_BACKEND="sql", DATABASE_URL=database_url, WEB_CONCURRENCY=str(workers),
+            RATE_LIMIT_ENABLED="0",
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers),
+             "--log-level", "warning", "--no-access-log"],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            _wait_healthy(base_url)
+            bounty_ids = asyncio.run(_seed(base_url))
+
+            result = multiprocessing.Queue()
+            clients = [
+                multiprocessing.Process(
+                    target=_client_process,
+                    args=(base_url, args.duration, args.concurrency, bounty_ids, result),
+                )
+                for _ in range(args.clients)
+            ]
+            for proc in clients:
+                proc.start()
+            totals = [result.get() for _ in clients]
+            for proc in clients:
+                proc.join()
+        finally:
+            server.terminate()
+            server.wait()
+
+    done = sum(t[0] for t in totals)
+    errors = sum(t[1] for t in totals)
+    return done / args.duration, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=max(2, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--concurrency", type=int, default=32, help="in-flight requests per client process")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f"cpus={os.cpu_count()} clients={args.clients}x{args.concurrency}")
+    print(f"{'workers':>8} {'rps':>12} {'errors':>8} {'scaling':>9}")
+    baseline = None
+    for n, workers in enumerate(int(w) for w in args.workers.split(",")):
+        rps, errors = run_once(workers, args.port + n, args)
+        baseline = baseline or rps
+        print(f"{workers:>8} {rps:>12,.0f} {errors:>8} {rps / baseline:>8.2f}x")
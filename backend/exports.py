@@ -0,0 +1,51 @@
+"""
+AdBounty Backend - Streaming exports
+Encode records chunk by chunk for StreamingResponse so memory stays flat whatever the history size
+"""
+
+import csv
+import io
+from datetime import datetime
+from typing import AsyncIterator, List, Mapping
+
+from serialization import dumps
+
+TRANSACTION_FIELDS = [
+    "tx_id", "from_user", "to_user", "amount", "tx_type", "status", "bounty_id", "tx_hash", "created_at",
+    "channel_id",
+]
+
+# Rows are buffered into chunks of this many before yielding, so each write to
+# the socket carries a useful amount of data without growing with the export
+ROWS_PER_CHUNK = 200
+
+
+async def ndjson_lines(records: AsyncIterator[Mapping]) -> AsyncIterator[bytes]:
+    """One JSON object per line"""
+    chunk: List[bytes] = []
+    async for record in records:
+        encoded = getattr(record, "encoded", None)
+        chunk.append(encoded() if encoded is not None else dumps(record))
+        if len(chunk) >= ROWS_PER_CHUNK:
+            yield b"\n".join(chunk) + b"\n"
+            chunk.clear()
+    if chunk:
+        yield b"\n".join(chunk) + b"\n"
+
+
+async def csv_lines(records: AsyncIterator[Mapping], fields: List[str]) -> AsyncIterator[bytes]:
+    """A header row followed by one row per record"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+    writer.writeheader()
+    rows = 0
+    async for record in records:
+        writer.writerow({k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in record.items()})
+        rows += 1
+        if rows >= ROWS_PER_CHUNK:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            rows = 0
+    if buffer.tell():
+        yield buffer.getvalue().encode()
@@ -0,0 +1,188 @@
+"""
+AdBounty Backend - Idempotency-Key support for POST endpoints
+Retried requests get the first response replayed instead of repeating the work
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ratelimit import USER_HEADER
+
+HEADER = b"idempotency-key"
+REPLAYED_HEADER = (b"idempotent-replayed", b"true")
+
+# (status, headers, body) as sent by the app
+StoredResponse = Tuple[int, List[Tuple[bytes, bytes]], bytes]
+
+
+class IdempotencyCache:
+    """LRU of responses keyed by (Idempotency-Key, path, caller), each expiring after `ttl` seconds.
+
+    Bounded by entry count and by the total size of the cached response
+    bodies; a response larger than `max_bytes` on its own is not cached.
+    Lookups and inserts are O(1); expired entries are dropped when looked up or
+    when they reach the cold end of the LRU.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 86400.0, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.cached_bytes = 0
+        # key -> (expires_at, request fingerprint, response)
+        self._entries: "OrderedDict[tuple, Tuple[float, bytes, StoredResponse]]" = OrderedDict()
+
+    def get(self, key: tuple, now: Optional[float] = None) -> Optional[Tuple[bytes, StoredResponse]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= (now if now is not None else time.monotonic()):
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1], entry[2]
+
+    def put(self, key: tuple, fingerprint: bytes, response: StoredResponse, now: Optional[float] = None) -> None:
+        now = now if now is not None else time.monotonic()
+        if key in self._entries:
+            self._drop(key)
+        if len(response[2]) > self.max_bytes:
+            return
+        self._entries[key] = (now + self.ttl, fingerprint, response)
+        self.cached_bytes += len(response[2])
+        entries = self._entries
+        while entries:
+            oldest_key, (expires_at, _, _) = next(iter(entries.items()))
+            if len(entries) <= self.max_entries and self.cached_bytes <= self.max_bytes and expires_at > now:
+                break
+            self._drop(oldest_key)
+
+    def _drop(self, key: tuple) -> None:
+        self.cached_bytes -= len(self._entries.pop(key)[2][2])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware honouring an Idempotency-Key header on every POST.
+
+    The first request with a key runs normally and its response is cached
+    unless it is a server error. Retries with the same key and the same request
+    (query string and body) get that response back with an Idempotent-Replayed
+    header. A retry arriving while the first is still running waits for it
+    instead of running the handler a second time. Reusing a key for a different
+    request is rejected with 422. The cache is per process.
+
+    Keys are scoped to the caller: the X-Telegram-User-Id header when present,
+    otherwise the client IP from `client_ip` (the peer address by default), so
+    two callers picking the same key never see each other's responses.
+    """
+
+    def __init__(
+        self,
+        app,
+        max_entries: int = 10000,
+        ttl: float = 86400.0,
+        max_bytes: int = 64 * 1024 * 1024,
+        client_ip: Optional[Callable[[dict], str]] = None,
+    ):
+        self.app = app
+        self.cache = IdempotencyCache(max_entries, ttl, max_bytes)
+        self.client_ip = client_ip or _peer_ip
+        self._in_flight: Dict[tuple, asyncio.Future] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+        value = user = None
+        for name, header in scope["headers"]:
+            if name == HEADER:
+                value = header
+            elif name == USER_HEADER:
+                user = header
+        if value is None:
+            return await self.app(scope, receive, send)
+        # User ids stay bytes and IPs str, so the two kinds of caller never collide
+        key = (value, scope["path"], user if user is not None else self.client_ip(scope))
+
+        body = await self._read_body(receive)
+        fingerprint = hashlib.blake2b(scope.get("query_string", b"") + b"\0" + body, digest_size=16).digest()
+
+        while True:
+            cached = self.cache.get(key)
+            if cached is not None:
+                stored_fingerprint, response = cached
+                if stored_fingerprint != fingerprint:
+                    return await self._send(send, _KEY_REUSED)
+                return await self._send(send, response, replayed=True)
+            pending = self._in_flight.get(key)
+            if pending is None:
+                break
+            # Same key still being processed: wait, then look again
+            await asyncio.shield(pending)
+
+        future = self._in_flight[key] = asyncio.get_running_loop().create_future()
+        try:
+            response = await self._run(scope, body, send)
+            if response is not None and response[0] < 500:
+                self.cache.put(key, fingerprint, response)
+        finally:
+            del self._in_flight[key]
+            future.set_result(None)
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    async def _run(self, scope, body: bytes, send) -> Optional[StoredResponse]:
+        """Run the app on the buffered body, passing the response through while recording it"""
+        delivered = False
+
+        async def replay_receive():
+            nonlocal delivered
+            if not delivered:
+                delivered = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return {"type": "http.disconnect"}
+
+        status, headers, chunks = 500, [], []
+
+        async def recording_send(message):
+            nonlocal status, headers
+            if message["type"] == "http.response.start":
+                status, headers = message["status"], list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, replay_receive, recording_send)
+        return status, headers, b"".join(chunks)
+
+    @staticmethod
+    async def _send(send, response: StoredResponse, replayed: bool = False) -> None:
+        status, headers, body = response
+        if replayed:
+            headers = headers + [REPLAYED_HEADER]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+def _peer_ip(scope) -> str:
+    client = scope.get("client")
+    return client[0] if client else ""
+
+
+_KEY_REUSED: StoredResponse = (
+    422,
+    [(b"content-type", b"application/json")],
+    b'{"detail":"Idempotency-Key was already used for a different request"}',
+)
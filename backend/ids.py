@@ -0,0 +1,81 @@
+"""
+AdBounty Backend - Record id generation
+ULID-style ids: time-ordered, k-sortable as plain strings, and safe to mint in many processes at once
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+# Crockford base32: no I, L, O or U, and ASCII order matches numeric order
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_DECODE = {c: i for i, c in enumerate(_ALPHABET)}
+
+_TIME_BITS = 48
+_RANDOM_BITS = 80
+_ENCODED_LENGTH = 26  # ceil(128 / 5)
+
+
+def _encode(value: int) -> str:
+    chars = []
+    for _ in range(_ENCODED_LENGTH):
+        chars.append(_ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+class IdGenerator:
+    """Mints 128-bit ids: 48 bits of millisecond timestamp followed by 80 random bits.
+
+    Workers never coordinate; 80 random bits per millisecond make collisions
+    negligible. Within one process ids minted in the same millisecond increment
+    the random part, so they stay strictly ordered.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._last_random = 0
+
+    def _reset(self) -> None:
+        # A forked worker must not continue the parent's random sequence
+        self._last_ms = -1
+
+    def next_value(self) -> int:
+        with self._lock:
+            now_ms = time.time_ns() // 1_000_000
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._last_random = int.from_bytes(os.urandom(10), "big")
+            else:
+                # Same millisecond (or the clock stepped back): stay monotonic
+                self._last_random += 1
+                if self._last_random >> _RANDOM_BITS:
+                    self._last_ms += 1
+                    self._last_random = int.from_bytes(os.urandom(10), "big")
+            return (self._last_ms << _RANDOM_BITS) | self._last_random
+
+    def new_id(self, prefix: str) -> str:
+        return f"{prefix}_{_encode(self.next_value())}"
+
+
+_generator = IdGenerator()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_generator._reset)
+
+
+def new_id(prefix: str) -> str:
+    """Return a new id such as `bounty_01HQ3K4Z8M...`; later ids sort after earlier ones"""
+    return _generator.new_id(prefix)
+
+
+def id_timestamp(record_id: str) -> datetime:
+    """Recover the UTC creation time embedded in an id"""
+    encoded = record_id.rpartition("_")[2]
+    if len(encoded) != _ENCODED_LENGTH:
+        raise ValueError(f"Not a generated id: {record_id}")
+    value = 0
+    for char in encoded.upper():
+        value = (value << 5) | _DECODE[char]
+    return datetime.fromtimestamp((value >> _RANDOM_BITS) / 1000, tz=timezone.utc)
@@ -0,0 +1,544 @@
+"""
+AdBounty Backend - Secondary indexes over the in-memory stores
+Keeps lookups proportional to the size of the answer instead of the size of the store
+"""
+
+import heapq
+import re
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+class TransactionIndex:
+    """Maps a user id to the ids of every transaction they sent or received.
+
+    Ids are time-ordered, so each per-user list is kept sorted (appends in the
+    common case) and a page after a cursor id is a bisect plus a slice.
+    """
+
+    def __init__(self):
+        self._by_user: Dict[int, List[str]] = {}
+
+    def add(self, tx: dict) -> None:
+        """Register a transaction that was just written to the store"""
+        tx_id = tx["tx_id"]
+        from_user = tx["from_user"]
+        to_user = tx["to_user"]
+
+        self._insert(from_user, tx_id)
+        if to_user != from_user:
+            self._insert(to_user, tx_id)
+
+    def _insert(self, user_id: int, tx_id: str) -> None:
+        ids = self._by_user.get(user_id)
+        if ids is None:
+            self._by_user[user_id] = [tx_id]
+        elif tx_id > ids[-1]:
+            ids.append(tx_id)
+        else:
+            # Concurrent requests can finish slightly out of id order
+            insort(ids, tx_id)
+
+    def ids_for_user(self, user_id: int, after: Optional[str] = None, limit: Optional[int] = None) -> List[str]:
+        """Return the user's transaction ids, oldest first, starting after the `after` id"""
+        ids = self._by_user.get(user_id, [])
+        start = bisect_right(ids, after) if after is not None else 0
+        return ids[start:] if limit is None else ids[start:start + limit]
+
+    def count(self, user_id: int) -> int:
+        return len(self._by_user.get(user_id, ()))
+
+    def clear(self) -> None:
+        self._by_user.clear()
+
+    def __len__(self) -> int:
+        return len(self._by_user)
+
+
+class OpenBountyIndex:
+    """Maps a channel id to the open bounties that target it, for the channel owner feed.
+
+    Only pending bounties are held; a status change removes a bounty from every
+    channel it targets. Bounty ids are time-ordered, so each per-channel list is
+    kept sorted like TransactionIndex. Bounties past their deadline are hidden
+    lazily the first time a read for that channel sees the earliest deadline pass;
+    they stay known to deadlines() until the expiry scheduler settles them.
+    """
+
+    def __init__(self):
+        self._by_channel: Dict[int, List[str]] = {}
+        # bounty_id -> (deadline, target channel ids) for removal and expiry
+        self._entries: Dict[str, Tuple[Optional[datetime], Tuple[int, ...]]] = {}
+        # channel_id -> earliest deadline among its bounties (absent: none can expire)
+        self._next_expiry: Dict[int, datetime] = {}
+
+    def add(self, bounty) -> None:
+        """Insert or refresh a bounty from its current state"""
+        bounty_id = bounty["bounty_id"]
+        self.remove(bounty_id)
+        if bounty["status"] != "pending":
+            return
+        deadline = bounty.get("deadline")
+        channel_ids = tuple(dict.fromkeys(bounty.get("target_channels") or ()))
+        self._entries[bounty_id] = (deadline, channel_ids)
+        for channel_id in channel_ids:
+            ids = self._by_channel.setdefault(channel_id, [])
+            if not ids or ids[-1] < bounty_id:
+                ids.append(bounty_id)
+            else:
+                insort(ids, bounty_id)
+            if deadline is not None:
+                current = self._next_expiry.get(channel_id)
+                if current is None or deadline < current:
+                    self._next_expiry[channel_id] = deadline
+
+    def remove(self, bounty_id: str) -> None:
+        self.remove_many((bounty_id,))
+
+    def remove_many(self, bounty_ids: Iterable[str]) -> None:
+        """Drop several bounties, filtering each touched channel list once rather than once per bounty"""
+        gone_by_channel: Dict[int, List[str]] = {}
+        for bounty_id in bounty_ids:
+            entry = self._entries.pop(bounty_id, None)
+            if entry is not None:
+                for channel_id in entry[1]:
+                    gone_by_channel.setdefault(channel_id, []).append(bounty_id)
+
+        for channel_id, gone in gone_by_channel.items():
+            ids = self._by_channel.get(channel_id)
+            if ids is None:
+                continue
+            if len(gone) <= 8:
+                for bounty_id in gone:
+                    pos = bisect_left(ids, bounty_id)
+                    if pos < len(ids) and ids[pos] == bounty_id:  # absent once hidden by _purge
+                        del ids[pos]
+            else:
+                gone_set = set(gone)
+                ids[:] = [b for b in ids if b not in gone_set]
+            if not ids:
+                del self._by_channel[channel_id]
+                self._next_expiry.pop(channel_id, None)
+
+    def _purge(self, channel_id: int, now: datetime) -> None:
+        """Drop a channel's bounties whose deadline has passed from its list"""
+        next_expiry = self._next_expiry.get(channel_id)
+        if next_expiry is None or next_expiry > now:
+            return
+        entries = self._entries
+        live = [b for b in self._by_channel[channel_id] if entries[b][0] is None or entries[b][0] > now]
+        deadlines = [entries[b][0] for b in live if entries[b][0] is not None]
+        if live:
+            self._by_channel[channel_id] = live
+        else:
+            del self._by_channel[channel_id]
+        if deadlines:
+            self._next_expiry[channel_id] = min(deadlines)
+        else:
+            self._next_expiry.pop(channel_id, None)
+
+    def deadlines(self) -> Iterator[Tuple[datetime, str]]:
+        """(deadline, bounty_id) for every pending bounty that has a deadline"""
+        for bounty_id, (deadline, _) in self._entries.items():
+            if deadline is not None:
+                yield deadline, bounty_id
+
+    def ids_for_channel(
+        self,
+        channel_id: int,
+        after: Optional[str] = None,
+        limit: Optional[int] = None,
+        now: Optional[datetime] = None,
+    ) -> Tuple[List[str], int]:
+        """Open bounty ids for a channel after the `after` id, oldest first, and how many there are"""
+        self._purge(channel_id, now or datetime.utcnow())
+        ids = self._by_channel.get(channel_id, [])
+        start = bisect_right(ids, after) if after is not None else 0
+        page = ids[start:] if limit is None else ids[start:start + limit]
+        return page, len(ids)
+
+    def clear(self) -> None:
+        self._by_channel.clear()
+        self._entries.clear()
+        self._next_expiry.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def channel_sort_key(channel: dict, order: str) -> tuple:
+    """The key a channel sorts by in one of the VerifiedChannelIndex orders"""
+    return VerifiedChannelIndex.ORDERS[order](channel)
+
+
+class _SortedKeys:
+    """A list of sort keys kept ordered with bisect; the last key element is the record id"""
+
+    def __init__(self):
+        self.keys: List[tuple] = []
+
+    def add(self, key: tuple) -> None:
+        insort(self.keys, key)
+
+    def remove(self, key: tuple) -> None:
+        pos = bisect_left(self.keys, key)
+        if pos < len(self.keys) and self.keys[pos] == key:
+            del self.keys[pos]
+
+    def ids(self, limit: Optional[int] = None, after: Optional[tuple] = None) -> List:
+        start = bisect_right(self.keys, after) if after is not None else 0
+        keys = self.keys[start:] if limit is None else self.keys[start:start + limit]
+        return [key[-1] for key in keys]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class VerifiedChannelIndex:
+    """The set of verified channels, presorted in every order the API serves.
+
+    Each order is kept globally and per niche, so a listing is a slice of an
+    already sorted list rather than a scan and sort of channels_db.
+    """
+
+    ORDERS: Dict[str, Callable[[dict], tuple]] = {
+        "subscribers": lambda ch: (-ch["subscribers"], ch["channel_id"]),
+        "created_at": lambda ch: (ch["created_at"], ch["channel_id"]),
+    }
+
+    def __init__(self):
+        self._all: Dict[str, _SortedKeys] = {order: _SortedKeys() for order in self.ORDERS}
+        self._by_niche: Dict[str, Dict[str, _SortedKeys]] = {}
+        # channel_id -> (niche, {order: key}) so a re-verification can drop stale keys
+        self._entries: Dict[int, Tuple[str, Dict[str, tuple]]] = {}
+
+    def add(self, channel: dict) -> None:
+        """Insert or refresh a channel; unverified channels are dropped from the index"""
+        channel_id = channel["channel_id"]
+        self.remove(channel_id)
+        if not channel.get("verified"):
+            return
+
+        niche = channel["niche"]
+        keys = {order: key_fn(channel) for order, key_fn in self.ORDERS.items()}
+        buckets = self._by_niche.get(niche)
+        if buckets is None:
+            buckets = self._by_niche[niche] = {order: _SortedKeys() for order in self.ORDERS}
+        for order, key in keys.items():
+            self._all[order].add(key)
+            buckets[order].add(key)
+        self._entries[channel_id] = (niche, keys)
+
+    def remove(self, channel_id: int) -> None:
+        entry = self._entries.pop(channel_id, None)
+        if entry is None:
+            return
+        niche, keys = entry
+        buckets = self._by_niche[niche]
+        for order, key in keys.items():
+            self._all[order].remove(key)
+            buckets[order].remove(key)
+        if not len(buckets[next(iter(self.ORDERS))]):
+            del self._by_niche[niche]
+
+    def ids(
+        self,
+        order: str = "created_at",
+        niche: Optional[str] = None,
+        limit: Optional[int] = None,
+        after: Optional[tuple] = None,
+    ) -> List[int]:
+        """Return verified channel ids in the requested order, optionally for one niche.
+
+        `after` is the sort key of the last channel already served (keyset pagination).
+        """
+        if order not in self.ORDERS:
+            raise ValueError(f"Unknown order: {order}")
+        if niche is None:
+            view = self._all[order]
+        else:
+            buckets = self._by_niche.get(niche)
+            if buckets is None:
+                return []
+            view = buckets[order]
+        return view.ids(limit, after)
+
+    def count(self, niche: Optional[str] = None) -> int:
+        if niche is None:
+            return len(self._entries)
+        buckets = self._by_niche.get(niche)
+        return len(buckets[next(iter(self.ORDERS))]) if buckets else 0
+
+    def clear(self) -> None:
+        for view in self._all.values():
+            view.keys.clear()
+        self._by_niche.clear()
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Lower bounds of the subscriber buckets, each with its own bitmap: ten per decade
+# (Renard R10 steps) keeps the partial buckets at the ends of a range small
+SUBSCRIBER_BUCKETS = (0,) + tuple(
+    m * 10 ** e for e in range(0, 9) for m in (10, 12, 16, 20, 25, 32, 40, 50, 63, 80)
+)
+
+# Bit positions set in each byte value, for turning a bitmap back into slots
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+_NONZERO = re.compile(b"[^\x00]")
+
+
+def _bitmap(slots: Iterable[int], size: int) -> int:
+    """Bitset of `slots`, built in a bytearray rather than by OR-ing one big int per slot"""
+    buf = bytearray((size + 7) >> 3)
+    for slot in slots:
+        buf[slot >> 3] |= 1 << (slot & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _slots_of(bitmap: int) -> List[int]:
+    """Positions of the set bits; zero bytes are skipped by the regex engine"""
+    raw = bitmap.to_bytes((bitmap.bit_length() + 7) >> 3, "little")
+    slots = []
+    for match in _NONZERO.finditer(raw):
+        base = match.start() << 3
+        slots.extend(base + bit for bit in _BYTE_BITS[raw[match.start()]])
+    return slots
+
+
+class ChannelSearchIndex:
+    """Facet bitmaps over every channel, for /channels/search.
+
+    Each channel owns a bit position (its slot). Every facet value - a niche,
+    a subscriber bucket, the verified flag - is a Python int used as a bitset
+    of the slots that have it, so a query is a few big-int ANDs and ORs.
+    A subscriber range ORs the buckets it fully covers and adds the partial
+    buckets at either end from a subscriber-sorted array, which also yields
+    the results in the "subscribers" order of VerifiedChannelIndex.
+    """
+
+    def __init__(self):
+        self._slots: Dict[int, int] = {}
+        # slot -> (niche, verified, sort key) as currently indexed
+        self._entries: List[Tuple[str, bool, tuple]] = []
+        self._niches: Dict[str, int] = {}
+        self._buckets: List[int] = [0] * len(SUBSCRIBER_BUCKETS)
+        self._verified = 0
+        # (-subscribers, channel_id, slot), ascending: the most subscribed first
+        self._by_subscribers: List[tuple] = []
+
+    @staticmethod
+    def _bucket(subscribers: int) -> int:
+        return max(bisect_right(SUBSCRIBER_BUCKETS, subscribers) - 1, 0)
+
+    def add(self, channel: dict) -> None:
+        """Insert or refresh a channel"""
+        channel_id = channel["channel_id"]
+        slot = self._slots.get(channel_id)
+        if slot is None:
+            slot = self._slots[channel_id] = len(self._entries)
+            self._entries.append(None)
+        else:
+            self._unset(slot)
+
+        bit = 1 << slot
+        niche, verified, subscribers = channel["niche"], bool(channel.get("verified")), channel["subscribers"]
+        self._niches[niche] = self._niches.get(niche, 0) | bit
+        self._buckets[self._bucket(subscribers)] |= bit
+        if verified:
+            self._verified |= bit
+        key = (-subscribers, channel_id, slot)
+        insort(self._by_subscribers, key)
+        self._entries[slot] = (niche, verified, key)
+
+    def add_many(self, channels: Iterable[dict]) -> None:
+        """Insert or refresh several channels, rewriting each touched bitmap once instead of once per channel"""
+        # The last copy of a channel repeated in the batch wins, as with successive add() calls
+        latest = {channel["channel_id"]: channel for channel in channels}
+        if len(latest) <= 8:
+            for channel in latest.values():
+                self.add(channel)
+            return
+
+        cleared: List[int] = []
+        set_niches: Dict[str, List[int]] = {}
+        set_buckets: Dict[int, List[int]] = {}
+        set_verified: List[int] = []
+        stale: set = set()
+        keys: List[tuple] = []
+        for channel_id, channel in latest.items():
+            slot = self._slots.get(channel_id)
+            if slot is None:
+                slot = self._slots[channel_id] = len(self._entries)
+                self._entries.append(None)
+            else:
+                cleared.append(slot)
+                stale.add(self._entries[slot][2])
+            niche, verified, subscribers = channel["niche"], bool(channel.get("verified")), channel["subscribers"]
+            set_niches.setdefault(niche, []).append(slot)
+            set_buckets.setdefault(self._bucket(subscribers), []).append(slot)
+            if verified:
+                set_verified.append(slot)
+            key = (-subscribers, channel_id, slot)
+            keys.append(key)
+            self._entries[slot] = (niche, verified, key)
+
+        size = len(self._entries)
+        if cleared:
+            # Refreshed channels leave every facet first; clearing a facet that never held them is a no-op
+            keep = ~_bitmap(cleared, size)
+            self._niches = {niche: bits & keep for niche, bits in self._niches.items() if bits & keep}
+            self._buckets = [bits & keep for bits in self._buckets]
+            self._verified &= keep
+            self._by_subscribers = [key for key in self._by_subscribers if key not in stale]
+        for niche, slots in set_niches.items():
+            self._niches[niche] = self._niches.get(niche, 0) | _bitmap(slots, size)
+        for bucket, slots in set_buckets.items():
+            self._buckets[bucket] |= _bitmap(slots, size)
+        if set_verified:
+            self._verified |= _bitmap(set_verified, size)
+        # Two sorted runs: timsort merges them in one linear pass
+        keys.sort()
+        self._by_subscribers += keys
+        self._by_subscribers.sort()
+
+    def _unset(self, slot: int) -> None:
+        niche, verified, key = self._entries[slot]
+        mask = ~(1 << slot)
+        self._niches[niche] &= mask
+        if not self._niches[niche]:
+            del self._niches[niche]
+        self._buckets[self._bucket(-key[0])] &= mask
+        if verified:
+            self._verified &= mask
+        pos = bisect_left(self._by_subscribers, key)
+        del self._by_subscribers[pos]
+
+    def load(self, channels: Iterable[dict]) -> None:
+        """Bulk (re)build: one bytearray per facet instead of a big-int update per channel"""
+        self.clear()
+        niches: Dict[str, List[int]] = {}
+        buckets: List[List[int]] = [[] for _ in SUBSCRIBER_BUCKETS]
+        verified: List[int] = []
+        for slot, channel in enumerate(channels):
+            channel_id, niche, subscribers = channel["channel_id"], channel["niche"], channel["subscribers"]
+            self._slots[channel_id] = slot
+            key = (-subscribers, channel_id, slot)
+            self._entries.append((niche, bool(channel.get("verified")), key))
+            self._by_subscribers.append(key)
+            niches.setdefault(niche, []).append(slot)
+            buckets[self._bucket(subscribers)].append(slot)
+            if channel.get("verified"):
+                verified.append(slot)
+        size = len(self._entries)
+        self._by_subscribers.sort()
+        self._niches = {niche: _bitmap(slots, size) for niche, slots in niches.items()}
+        self._buckets = [_bitmap(slots, size) for slots in buckets]
+        self._verified = _bitmap(verified, size)
+
+    def _positions(self, min_subscribers: Optional[int], max_subscribers: Optional[int]) -> Tuple[int, int]:
+        """The slice of _by_subscribers holding subscriber counts within [min, max]"""
+        order = self._by_subscribers
+        start = bisect_left(order, (-max_subscribers,)) if max_subscribers is not None else 0
+        end = bisect_left(order, (-min_subscribers + 1,)) if min_subscribers is not None else len(order)
+        return start, max(start, end)
+
+    def _range_bitmap(self, min_subscribers: Optional[int], max_subscribers: Optional[int]) -> int:
+        low = min_subscribers if min_subscribers is not None else 0
+        last = self._bucket(max_subscribers) if max_subscribers is not None else len(SUBSCRIBER_BUCKETS) - 1
+        size = len(self._entries)
+        order = self._by_subscribers
+        bits = 0
+        for bucket in range(self._bucket(low), last + 1):
+            bucket_low = SUBSCRIBER_BUCKETS[bucket]
+            bucket_high = SUBSCRIBER_BUCKETS[bucket + 1] - 1 if bucket + 1 < len(SUBSCRIBER_BUCKETS) else None
+            in_low = max(low, bucket_low)
+            in_high = bucket_high if max_subscribers is None else (
+                max_subscribers if bucket_high is None else min(max_subscribers, bucket_high)
+            )
+            if in_low == bucket_low and in_high == bucket_high:
+                bits |= self._buckets[bucket]
+                continue
+            # A partial bucket: set the in-range slots, or clear the out-of-range ones
+            # from the bucket's bitmap, whichever touches fewer channels
+            bucket_start, bucket_stop = self._positions(bucket_low, bucket_high)
+            start, stop = self._positions(in_low, in_high)
+            if stop - start <= (bucket_stop - bucket_start) - (stop - start):
+                bits |= _bitmap((key[2] for key in order[start:stop]), size)
+            else:
+                outside = order[bucket_start:start] + order[stop:bucket_stop]
+                bits |= self._buckets[bucket] & ~_bitmap((key[2] for key in outside), size)
+        return bits
+
+    def search(
+        self,
+        niches: Optional[Sequence[str]] = None,
+        min_subscribers: Optional[int] = None,
+        max_subscribers: Optional[int] = None,
+        verified: Optional[bool] = None,
+        limit: Optional[int] = None,
+        after: Optional[tuple] = None,
+    ) -> Tuple[List[int], int]:
+        """Return matching channel ids, most subscribed first, and how many match in total.
+
+        Facets that are None are not filtered on; `niches` matches any of them.
+        `after` is the "subscribers" sort key of the last channel already served.
+        """
+        order = self._by_subscribers
+        start, stop = self._positions(min_subscribers, max_subscribers)
+
+        mask = None
+        if niches:
+            mask = 0
+            for niche in niches:
+                mask |= self._niches.get(niche, 0)
+        if verified is not None:
+            flag = self._verified if verified else self._verified ^ ((1 << len(self._entries)) - 1)
+            mask = flag if mask is None else mask & flag
+        if mask is not None and (min_subscribers is not None or max_subscribers is not None):
+            mask &= self._range_bitmap(min_subscribers, max_subscribers)
+
+        first = max(start, bisect_right(order, tuple(after) + (float("inf"),))) if after is not None else start
+        if mask is None:
+            # Only a subscriber range (or nothing): the answer is a slice of the sorted array
+            keys = order[first:stop] if limit is None else order[first:min(stop, first + limit)]
+            return [key[1] for key in keys], stop - start
+
+        total = mask.bit_count()
+        if not total:
+            return [], 0
+        # Walking the sorted array costs about limit / selectivity steps; collecting
+        # every match costs about `total`. Take whichever is cheaper.
+        if limit is not None and limit * (stop - start) < total * total:
+            raw = mask.to_bytes((len(self._entries) + 7) >> 3, "little")
+            ids = []
+            for pos in range(first, stop):
+                key = order[pos]
+                slot = key[2]
+                if raw[slot >> 3] >> (slot & 7) & 1:
+                    ids.append(key[1])
+                    if len(ids) == limit:
+                        break
+            return ids, total
+
+        entries = self._entries
+        keys = [entries[slot][2] for slot in _slots_of(mask)]
+        if after is not None:
+            bound = tuple(after) + (float("inf"),)
+            keys = [key for key in keys if key > bound]
+        keys = heapq.nsmallest(limit, keys) if limit is not None else sorted(keys)
+        return [key[1] for key in keys], total
+
+    def clear(self) -> None:
+        self._slots.clear()
+        self._entries.clear()
+        self._niches.clear()
+        self._buckets = [0] * len(SUBSCRIBER_BUCKETS)
+        self._verified = 0
+        self._by_subscribers.clear()
+
+    def __len__(self) -> int:
+        return len(self._slots)
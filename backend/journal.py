@@ -0,0 +1,243 @@
+"""
+AdBounty Backend - Write-ahead journal and snapshots for the in-memory stores
+Mutations are appended to segment files with group-committed fsyncs; snapshots bound replay time
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import struct
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_FRAME = struct.Struct("<I")
+_SEGMENT_PREFIX = "journal-"
+_SEGMENT_SUFFIX = ".log"
+_SNAPSHOT_NAME = "snapshot.pickle"
+
+Op = Tuple[Any, ...]
+Replay = Callable[[Any, Iterator[Op]], Any]
+
+# Compaction runs in a fresh interpreter: forking the server would copy its threads' locks mid-use
+_SPAWN = multiprocessing.get_context("spawn")
+
+
+def _segment_name(seq: int) -> str:
+    return f"{_SEGMENT_PREFIX}{seq:08d}{_SEGMENT_SUFFIX}"
+
+
+class Journal:
+    """Append-only mutation log with batched fsync and periodic compaction into snapshots.
+
+    Callers `await append(op)`; every op queued while the previous fsync was in
+    flight is written as one frame and made durable by a single fsync.
+    """
+
+    def __init__(self, directory: str, snapshot_interval: float = 300.0):
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self._seq = 0
+        self._file = None
+        self._pending: List[Op] = []
+        self._waiters: List[asyncio.Future] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._snapshotter: Optional[asyncio.Task] = None
+        self._replay: Optional[Replay] = None
+        self._since_snapshot = 0
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._snapshot_lock: Optional[asyncio.Lock] = None
+
+    # Recovery
+
+    def _segments(self) -> List[int]:
+        seqs = []
+        for name in os.listdir(self.directory):
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX):
+                seqs.append(int(name[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)]))
+        return sorted(seqs)
+
+    def _read_segment(self, seq: int) -> Iterator[List[Op]]:
+        path = os.path.join(self.directory, _segment_name(seq))
+        with open(path, "rb") as f:
+            data = f.read()
+        offset = 0
+        while offset + _FRAME.size <= len(data):
+            (length,) = _FRAME.unpack_from(data, offset)
+            end = offset + _FRAME.size + length
+            if end > len(data):
+                break
+            yield pickle.loads(data[offset + _FRAME.size:end])
+            offset = end
+        if offset != len(data):
+            # A crash mid-write leaves a torn frame; it was never acknowledged
+            logger.warning("Truncating torn journal tail in %s at byte %d", path, offset)
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+
+    def _load_snapshot(self) -> Tuple[int, Any]:
+        """(first segment not covered by the snapshot, snapshot state), or (0, None) without one"""
+        snapshot_path = os.path.join(self.directory, _SNAPSHOT_NAME)
+        if not os.path.exists(snapshot_path):
+            return 0, None
+        with open(snapshot_path, "rb") as f:
+            return pickle.load(f)
+
+    def _ops(self, seqs: List[int]) -> Iterator[Op]:
+        for seq in seqs:
+            for frame in self._read_segment(seq):
+                # Replayed ops count towards the next compaction
+                self._since_snapshot += len(frame)
+                yield from frame
+
+    def recover(self) -> Tuple[Any, Iterator[Op]]:
+        """Return the latest snapshot state (or None) and an iterator over the ops logged after it"""
+        os.makedirs(self.directory, exist_ok=True)
+        first_seq, state = self._load_snapshot()
+        seqs = [seq for seq in self._segments() if seq >= first_seq]
+        # Keep appending to the newest segment; its torn tail (if any) is truncated during replay
+        self._seq = seqs[-1] if seqs else first_seq
+        return state, self._ops(seqs)
+
+    # Writing
+
+    async def start(self, replay: Replay) -> None:
+        """Open the current segment and start the group-commit writer and snapshot tasks.
+
+        `replay(state, ops)` returns the picklable state of the stores after
+        applying `ops` to a snapshot's `state` (None when there is no snapshot).
+        Snapshots call it in a spawned process, so it must be a module-level
+        function.
+        """
+        self._replay = replay
+        self._file = open(os.path.join(self.directory, _segment_name(self._seq)), "ab")
+        self._wakeup = asyncio.Event()
+        self._write_lock = asyncio.Lock()
+        self._snapshot_lock = asyncio.Lock()
+        self._writer = asyncio.create_task(self._write_loop())
+        if self.snapshot_interval > 0:
+            self._snapshotter = asyncio.create_task(self._snapshot_loop())
+
+    def append(self, op: Op) -> "asyncio.Future":
+        """Queue one mutation; the returned future resolves once it is fsynced"""
+        waiter = asyncio.get_running_loop().create_future()
+        self._pending.append(op)
+        self._waiters.append(waiter)
+        self._wakeup.set()
+        return waiter
+
+    async def _write_loop(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            async with self._write_lock:
+                await self._drain()
+
+    async def _drain(self) -> None:
+        """Write every queued op as one frame per pass; caller holds _write_lock"""
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            ops, self._pending = self._pending, []
+            waiters, self._waiters = self._waiters, []
+            payload = pickle.dumps(ops, protocol=pickle.HIGHEST_PROTOCOL)
+            try:
+                await loop.run_in_executor(None, self._write_frame, self._file, payload)
+            except Exception as e:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                continue
+            self._since_snapshot += len(ops)
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    @staticmethod
+    def _write_frame(file, payload: bytes) -> None:
+        file.write(_FRAME.pack(len(payload)) + payload)
+        file.flush()
+        os.fsync(file.fileno())
+
+    async def flush(self) -> None:
+        """Write and fsync everything appended so far"""
+        async with self._write_lock:
+            await self._drain()
+
+    # Snapshots
+
+    async def _snapshot_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            if self._since_snapshot:
+                try:
+                    await self.snapshot()
+                except Exception as e:
+                    logger.error("Snapshot failed: %s", e)
+
+    async def snapshot(self) -> None:
+        """Compact the stores into a snapshot and drop the journal segments it covers.
+
+        The live stores are never read. Rotating to a new segment fixes what the
+        snapshot covers. A spawned process then loads the previous snapshot,
+        replays the closed segments and writes the result, so neither the loop
+        nor the server's threads are involved. That process holds a second copy
+        of the state while it runs.
+        """
+        async with self._snapshot_lock:
+            await self._snapshot()
+
+    async def _snapshot(self) -> None:
+        async with self._write_lock:
+            await self._drain()
+            # Every op appended so far is durable in a segment <= covered; later ones go to the new segment
+            covered = self._seq
+            self._file.close()
+            self._seq += 1
+            self._file = open(os.path.join(self.directory, _segment_name(self._seq)), "ab")
+            self._since_snapshot = 0
+
+        process = _SPAWN.Process(
+            target=_compact, args=(self.directory, covered, self._replay), name="journal-snapshot", daemon=True
+        )
+        process.start()
+        await asyncio.get_running_loop().run_in_executor(None, process.join)
+        if process.exitcode != 0:
+            # The segments stay, so the next snapshot covers them
+            raise RuntimeError(f"snapshot process exited with status {process.exitcode}")
+
+        for seq in self._segments():
+            if seq <= covered:
+                os.remove(os.path.join(self.directory, _segment_name(seq)))
+
+    def _write_snapshot(self, next_seq: int, state: Any) -> None:
+        path = os.path.join(self.directory, _SNAPSHOT_NAME)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((next_seq, state), f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    async def close(self, snapshot: bool = True) -> None:
+        """Flush pending writes, optionally compact, and stop the background tasks"""
+        if self._file is None:
+            return
+        await self.flush()
+        for task in (self._snapshotter, self._writer):
+            if task is not None:
+                task.cancel()
+        if snapshot and self._since_snapshot:
+            await self.snapshot()
+        self._file.close()
+        self._file = None
+
+
+def _compact(directory: str, covered: int, replay: Replay) -> None:
+    """Snapshot process: the previous snapshot plus segments up to `covered`, written as the new snapshot"""
+    journal = Journal(directory)
+    first_seq, state = journal._load_snapshot()
+    seqs = [seq for seq in journal._segments() if first_seq <= seq <= covered]
+    journal._write_snapshot(covered + 1, replay(state, journal._ops(seqs)))
@@ -0,0 +1,76 @@
+"""
+AdBounty Backend - Per-user balance ledger
+Running totals in integer nanoTON, updated with every transaction so a balance is one lookup
+"""
+
+from decimal import Decimal
+from typing import Dict, Iterable, List, Mapping
+
+NANO_PER_TON = 10**9
+
+# Order of the totals in a ledger entry
+BALANCE_FIELDS = ("deposited", "escrowed", "earned", "refunded")
+
+
+def to_nano(amount) -> int:
+    """TON (float, str or Decimal) to integer nanoTON, rounding half-even at the ninth decimal.
+
+    Going through str(amount) keeps floats like 0.1 exact instead of 99999999.99...
+    """
+    return int((Decimal(str(amount)) * NANO_PER_TON).to_integral_value())
+
+
+def balance_deltas(transactions: Iterable[Mapping]) -> Dict[int, List[int]]:
+    """Net change to each user's totals from `transactions`, as {user_id: [deposited, escrowed, earned, refunded]}.
+
+    A deposit moves funds into the advertiser's escrow; a payout releases escrow
+    to the channel owner's earnings; a refund returns escrow to the advertiser.
+    Only successful transactions move money.
+    """
+    deltas: Dict[int, List[int]] = {}
+    for tx in transactions:
+        if tx["status"] != "success":
+            continue
+        amount = to_nano(tx["amount"])
+        tx_type = tx["tx_type"]
+        payer = deltas.setdefault(tx["from_user"], [0, 0, 0, 0])
+        if tx_type == "deposit":
+            payer[0] += amount
+            payer[1] += amount
+        elif tx_type == "payout":
+            payer[1] -= amount
+            deltas.setdefault(tx["to_user"], [0, 0, 0, 0])[2] += amount
+        elif tx_type == "refund":
+            payer[1] -= amount
+            payer[3] += amount
+    return deltas
+
+
+def balance_of(user_id: int, totals) -> dict:
+    return {"user_id": user_id, **dict(zip(BALANCE_FIELDS, totals))}
+
+
+class BalanceLedger:
+    """In-memory running totals per user, applied alongside each stored transaction"""
+
+    def __init__(self):
+        self._totals: Dict[int, List[int]] = {}
+
+    def apply(self, transactions: Iterable[Mapping]) -> None:
+        totals = self._totals
+        for user_id, delta in balance_deltas(transactions).items():
+            current = totals.get(user_id)
+            if current is None:
+                totals[user_id] = delta
+            else:
+                for field, change in enumerate(delta):
+                    current[field] += change
+
+    def get(self, user_id: int) -> dict:
+        return balance_of(user_id, self._totals.get(user_id, (0, 0, 0, 0)))
+
+    def clear(self) -> None:
+        self._totals.clear()
+
+    def __len__(self) -> int:
+        return len(self._totals)
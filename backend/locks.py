@@ -0,0 +1,31 @@
+"""
+AdBounty Backend - Striped asyncio locks
+A fixed pool of locks shared out by key hash, so per-key locking needs no per-key state
+"""
+
+import asyncio
+from typing import Hashable, List, Optional
+
+
+class StripedLock:
+    """Maps each key to one of `stripes` asyncio locks.
+
+    Requests on the same key always share a lock. Different keys only contend
+    when they hash to the same stripe, with probability about 1/stripes. Memory
+    stays fixed no matter how many keys are seen. The locks serialize work
+    within one process only; cross-process safety comes from the store's
+    compare-and-set.
+    """
+
+    def __init__(self, stripes: int = 1024):
+        self.stripes = stripes
+        self._locks: List[asyncio.Lock] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __call__(self, key: Hashable) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # asyncio locks belong to the loop that first waits on them
+            self._locks = [asyncio.Lock() for _ in range(self.stripes)]
+            self._loop = loop
+        return self._locks[hash(key) % self.stripes]
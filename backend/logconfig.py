@@ -0,0 +1,145 @@
+"""
+AdBounty Backend - Logging pipeline
+Handlers only enqueue log records; a background thread formats them and writes JSON lines
+"""
+
+import atexit
+import logging
+import os
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from serialization import dumps
+
+# LogRecord attributes that are not `extra` fields
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+# Access log sample rates per "METHOD /route/{template}"; routes not listed log every request
+DEFAULT_SAMPLE_RATES: Dict[str, float] = {
+    "GET /channels/verified": 0.1,
+    "GET /channels/search": 0.1,
+    "GET /channels/{channel_id}/bounties": 0.1,
+    "GET /bounties/{bounty_id}": 0.1,
+}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, msg, any `extra` fields and the traceback"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return dumps(entry).decode()
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Enqueues records as they are, so the message is only formatted by the listener thread.
+
+    The stdlib QueueHandler formats every record in the caller's thread so it
+    can be pickled. Our queue never leaves the process. Callers must pass log
+    arguments that are not mutated later; ids and numbers always qualify.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def configure_logging(level: str = "INFO", json_lines: bool = True, stream=None) -> QueueListener:
+    """Route every log record through a queue to a listener thread that writes to `stream` (stderr)"""
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JSONFormatter() if json_lines else logging.Formatter(logging.BASIC_FORMAT))
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(DeferredQueueHandler(records))
+    root.setLevel(level)
+    listener = QueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+    # Flush whatever is still queued when the process exits
+    atexit.register(listener.stop)
+    return listener
+
+
+def configure_from_env() -> QueueListener:
+    return configure_logging(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        json_lines=os.getenv("LOG_FORMAT", "json") == "json",
+    )
+
+
+class RouteSampler:
+    """Keeps one access log record in every 1/rate per route, counting rather than drawing random numbers"""
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None):
+        self._every: Dict[str, int] = {
+            route: max(1, round(1 / rate)) if rate > 0 else 0 for route, rate in (rates or {}).items()
+        }
+        self._seen: Dict[str, int] = {}
+
+    @classmethod
+    def parse(cls, value: str) -> "RouteSampler":
+        """"GET /bounties/{bounty_id}=0.01,GET /channels/verified=0.1" on top of DEFAULT_SAMPLE_RATES"""
+        rates = dict(DEFAULT_SAMPLE_RATES)
+        for item in filter(None, (part.strip() for part in value.split(","))):
+            route, rate = item.rsplit("=", 1)
+            rates[route.strip()] = float(rate)
+        return cls(rates)
+
+    def keep(self, route: str) -> bool:
+        every = self._every.get(route)
+        if every is None or every == 1:
+            return True
+        if every == 0:
+            return False
+        seen = self._seen.get(route, 0) + 1
+        self._seen[route] = seen % every
+        return seen == every
+
+
+class AccessLog:
+    """Logs one record per request (method, path, route, status, duration), sampled per route.
+
+    Fed by metrics.InstrumentationMiddleware, which times each request once for
+    every observer. The route template comes from the endpoint the router
+    matched, so every /bounties/{bounty_id} request shares one sample rate.
+    Requests that matched no route are logged under "METHOD -". Failed requests
+    (status >= 500) are always logged.
+    """
+
+    def __init__(self, sampler: Optional[RouteSampler] = None, logger: Optional[logging.Logger] = None):
+        self.sampler = sampler or RouteSampler(DEFAULT_SAMPLE_RATES)
+        self.logger = logger or logging.getLogger("access")
+        self._templates: Optional[Dict[object, str]] = None
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return scope["method"] + " -"
+        if self._templates is None:
+            self._templates = {
+                route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")
+            }
+        return scope["method"] + " " + self._templates.get(endpoint, "-")
+
+    def record(self, scope, status: int, seconds: float) -> None:
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        route = self._route(scope)
+        if status >= 500 or self.sampler.keep(route):
+            duration_ms = seconds * 1000
+            self.logger.info(
+                "%s %s %d %.1fms", scope["method"], scope["path"], status, duration_ms,
+                extra={"route": route, "status": status, "duration_ms": round(duration_ms, 3)},
+            )
@@ -3,28 +3,86 @@ AdBounty Backend - FastAPI Application
 Handles bounty creation, channel verification, escrow management, and bot integration
 """
 
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Body, Header, Query, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, List
-from datetime import datetime, timedelta
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import Any, Dict, Optional, List, Literal
+from datetime import date, datetime, timedelta
+from contextlib import asynccontextmanager
+import asyncio
 import os
+import resource
+import secrets
 from dotenv import load_dotenv
 import logging
 
+from exports import TRANSACTION_FIELDS, csv_lines, ndjson_lines
+from idempotency import IdempotencyMiddleware
+from ids import new_id
+from indexes import channel_sort_key
+from locks import StripedLock
+from logconfig import AccessLog, RouteSampler, configure_from_env
+from memtrace import GROUP_BY, AllocationTracer, deep_sizes
+from metrics import CONTENT_TYPE, HTTPMetrics, InstrumentationMiddleware, LoopLagMonitor, gauge
+from pagination import DEFAULT_LIMIT, MAX_LIMIT, decode_cursor, page_of
+from profiling import MAX_SECONDS, ProfilerMiddleware, SamplingProfiler
+from ratelimit import RateLimiter, RateLimitMiddleware
+from scheduler import ExpiryScheduler
+from serialization import FastJSONResponse
+from storage import StatusConflict, Storage, create_storage, deposit_transaction
+from versions import CHANNELS, etag_matches
+
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Log records are queued and written as JSON lines by a background thread (LOG_LEVEL, LOG_FORMAT)
+configure_from_env()
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the storage backend and start bounty expiry and the loop lag probe on startup; stop them on shutdown"""
+    await storage.open()
+    await scheduler.start()
+    await loop_lag.start()
+    yield
+    profiler.stop()
+    await loop_lag.close()
+    await scheduler.close()
+    await storage.close()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="AdBounty API",
     description="Telegram Mini App for Ad Marketplace with TON Escrow",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
+)
+
+# Admin endpoints (/admin/...) exist only when ADMIN_TOKEN is set; callers send it as X-Admin-Token
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Sampled profiling of live requests; without admin endpoints it cannot be started, so it is not installed
+profiler = SamplingProfiler()
+if ADMIN_TOKEN:
+    app.add_middleware(ProfilerMiddleware, profiler=profiler)
+
+# Per-user and per-IP token buckets; over-limit requests get 429 before any work is done
+rate_limiter = RateLimiter.from_env()
+
+# Replay the first response for retried POSTs carrying an Idempotency-Key,
+# scoped to the caller as the rate limiter identifies it
+app.add_middleware(
+    IdempotencyMiddleware,
+    max_entries=int(os.getenv("IDEMPOTENCY_MAX_KEYS", 10000)),
+    ttl=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", 86400)),
+    max_bytes=int(os.getenv("IDEMPOTENCY_MAX_BYTES", 64 * 1024 * 1024)),
+    client_ip=rate_limiter.client_ip,
 )
 
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -34,6 +92,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route request counts and latency histograms, served with store sizes and loop lag on /metrics,
+# and one access log record per request, sampled per route for the polled reads (ACCESS_LOG, LOG_SAMPLE)
+http_metrics = HTTPMetrics()
+loop_lag = LoopLagMonitor()
+request_observers = [http_metrics.record]
+if os.getenv("ACCESS_LOG", "1") == "1":
+    request_observers.append(AccessLog(RouteSampler.parse(os.getenv("LOG_SAMPLE", ""))).record)
+app.add_middleware(InstrumentationMiddleware, observers=request_observers)
+
 # ============================================================================
 # Data Models
 # ============================================================================
@@ -75,6 +142,24 @@ class Channel(BaseModel):
             }
         }
 
+class VerifyChannelRequest(BaseModel):
+    channel_id: int
+    channel_name: str
+    owner_id: int
+    subscribers: int
+    niche: str
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "channel_id": -1001234567890,
+                "channel_name": "Tech News",
+                "owner_id": 123456789,
+                "subscribers": 50000,
+                "niche": "technology"
+            }
+        }
+
 class CreateBountyRequest(BaseModel):
     advertiser_id: int
     ton_amount: float
@@ -102,7 +187,7 @@ class Bounty(BaseModel):
     ad_text: str
     ad_link: str
     target_channels: List[int]
-    status: str  # pending, posted, confirmed, completed, cancelled
+    status: str  # pending, posted, confirmed, completed, cancelled, expired
     escrow_address: Optional[str] = None
     created_at: datetime = None
     deadline: datetime = None
@@ -110,7 +195,7 @@ class Bounty(BaseModel):
     class Config:
         json_schema_extra = {
             "example": {
-                "bounty_id": "bounty_123",
+                "bounty_id": "bounty_01HPZ3M4XK9Q7V2B8C5D6E7F8G",
                 "advertiser_id": 123456789,
                 "ton_amount": 10.5,
                 "ad_text": "Check out our new product!",
@@ -131,7 +216,7 @@ class BidRequest(BaseModel):
     class Config:
         json_schema_extra = {
             "example": {
-                "bounty_id": "bounty_123",
+                "bounty_id": "bounty_01HPZ3M4XK9Q7V2B8C5D6E7F8G",
                 "channel_owner_id": 987654321,
                 "channel_id": -1001234567890
             }
@@ -140,13 +225,15 @@ class BidRequest(BaseModel):
 class ConfirmViewsRequest(BaseModel):
     bounty_id: str
     channel_owner_id: int
+    channel_id: Optional[int] = None  # the channel the ad ran on; needed when the bounty targets several
     proof_url: Optional[str] = None
     
     class Config:
         json_schema_extra = {
             "example": {
-                "bounty_id": "bounty_123",
+                "bounty_id": "bounty_01HPZ3M4XK9Q7V2B8C5D6E7F8G",
                 "channel_owner_id": 987654321,
+                "channel_id": -1001234567890,
                 "proof_url": "https://example.com/proof.jpg"
             }
         }
@@ -161,31 +248,55 @@ class Transaction(BaseModel):
     bounty_id: Optional[str] = None
     tx_hash: Optional[str] = None
     created_at: datetime = None
+    channel_id: Optional[int] = None
     
     class Config:
         json_schema_extra = {
             "example": {
-                "tx_id": "tx_123",
+                "tx_id": "tx_01HPZ3M5AT4R6W8Y0Z2B4D6F8H",
                 "from_user": 123456789,
                 "to_user": 987654321,
                 "amount": 10.5,
                 "tx_type": "payout",
                 "status": "success",
-                "bounty_id": "bounty_123",
+                "bounty_id": "bounty_01HPZ3M4XK9Q7V2B8C5D6E7F8G",
                 "tx_hash": "0x123abc...",
-                "created_at": "2024-02-11T00:00:00"
+                "created_at": "2024-02-11T00:00:00",
+                "channel_id": -1001234567890
             }
         }
 
 # ============================================================================
-# In-memory storage (replace with database in production)
+# Storage (in-memory by default, SQL when STORAGE_BACKEND=sql)
 # ============================================================================
 
-users_db = {}
-channels_db = {}
-bounties_db = {}
-bids_db = {}
-transactions_db = {}
+# Largest array accepted by the batch endpoints
+MAX_BATCH_SIZE = 10000
+# Bounty statuses from which views can be confirmed and paid out
+CONFIRMABLE_STATUSES = ("pending", "posted")
+# Stores reported by /metrics
+METRIC_TABLES = ("users", "channels", "bounties", "bids", "transactions")
+
+storage = create_storage()
+scheduler = ExpiryScheduler(storage)
+# Serializes payouts per bounty; unrelated bounties almost never share a stripe
+bounty_locks = StripedLock()
+# tracemalloc sessions for /admin/memory/trace
+allocations = AllocationTracer()
+
+
+async def get_storage() -> Storage:
+    """FastAPI dependency returning the configured storage backend"""
+    return storage
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(default=None)) -> None:
+    """FastAPI dependency guarding /admin endpoints: 404 when they are disabled, 403 without the token"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
 
 # ============================================================================
 # Endpoints
@@ -200,50 +311,107 @@ async def health_check():
         "service": "AdBounty API"
     }
 
+@app.get("/metrics")
+async def get_metrics(store: Storage = Depends(get_storage)):
+    """Request, store and event loop metrics in the Prometheus text format"""
+    sizes = [({"store": table}, await store.count(table)) for table in METRIC_TABLES]
+    lines = http_metrics.render(app.routes)
+    lines += gauge("adbounty_store_records", "Records per store", sizes)
+    lines += loop_lag.render()
+    return Response("\n".join(lines) + "\n", media_type=CONTENT_TYPE)
+
 @app.post("/auth/telegram")
-async def telegram_auth(telegram_id: int, username: str):
+async def telegram_auth(telegram_id: int, username: str, store: Storage = Depends(get_storage)):
     """Authenticate user via Telegram"""
     try:
-        if telegram_id in users_db:
-            return {
+        existing = await store.get_user(telegram_id)
+        if existing is not None:
+            return FastJSONResponse({
                 "status": "success",
                 "message": "User already exists",
-                "user": users_db[telegram_id]
-            }
+                "user": existing
+            })
         
         user = User(
             telegram_id=telegram_id,
             username=username,
             created_at=datetime.utcnow()
         )
-        users_db[telegram_id] = user.model_dump()
+        user_data = user.model_dump()
+        await store.add_user(user_data)
         
-        logger.info(f"User authenticated: {telegram_id}")
-        return {
+        logger.info("User authenticated: %s", telegram_id)
+        return FastJSONResponse({
             "status": "success",
             "message": "User authenticated",
-            "user": user.model_dump()
-        }
+            "user": user_data
+        })
     except Exception as e:
-        logger.error(f"Auth error: {str(e)}")
+        logger.error("Auth error: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/channels/verified")
-async def get_verified_channels():
-    """Get list of verified channels"""
+async def get_verified_channels(
+    sort_by: Literal["created_at", "subscribers"] = "created_at",
+    niche: Optional[str] = None,
+    limit: int = Query(default=DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(default=None),
+    store: Storage = Depends(get_storage),
+):
+    """Get list of verified channels, one keyset page at a time"""
     try:
-        verified = [ch for ch in channels_db.values() if ch.get("verified")]
-        return {
+        # Read the version before the data: a write in between only costs an extra 200
+        etag = store.versions.etag(CHANNELS) if store.versions is not None else None
+        if etag is not None and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        after = decode_cursor(cursor) if cursor else None
+        rows, total = await store.list_verified_channels(sort_by, niche, limit + 1, after)
+        verified, next_cursor = page_of(rows, limit, lambda ch: channel_sort_key(ch, sort_by))
+        return FastJSONResponse({
             "status": "success",
-            "count": len(verified),
-            "channels": verified
-        }
+            "count": total,
+            "channels": verified,
+            "next_cursor": next_cursor
+        }, headers={"ETag": etag} if etag else None)
     except Exception as e:
-        logger.error(f"Error fetching channels: {str(e)}")
+        logger.error("Error fetching channels: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/channels/search")
+async def search_channels(
+    niche: Optional[List[str]] = Query(default=None),
+    min_subscribers: Optional[int] = Query(default=None, ge=0),
+    max_subscribers: Optional[int] = Query(default=None, ge=0),
+    verified: Optional[bool] = True,
+    limit: int = Query(default=DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = None,
+    store: Storage = Depends(get_storage),
+):
+    """Find channels by niche (any of several), subscriber range and verification, most subscribed first"""
+    try:
+        after = decode_cursor(cursor) if cursor else None
+        rows, total = await store.search_channels(niche, min_subscribers, max_subscribers, verified, limit + 1, after)
+        channels, next_cursor = page_of(rows, limit, lambda ch: channel_sort_key(ch, "subscribers"))
+        return FastJSONResponse({
+            "status": "success",
+            "count": total,
+            "channels": channels,
+            "next_cursor": next_cursor
+        })
+    except Exception as e:
+        logger.error("Error searching channels: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/channels/verify")
-async def verify_channel(channel_id: int, channel_name: str, owner_id: int, subscribers: int, niche: str):
+async def verify_channel(
+    channel_id: int,
+    channel_name: str,
+    owner_id: int,
+    subscribers: int,
+    niche: str,
+    store: Storage = Depends(get_storage),
+):
     """Verify a Telegram channel"""
     try:
         channel = Channel(
@@ -255,23 +423,46 @@ async def verify_channel(channel_id: int, channel_name: str, owner_id: int, subs
             owner_id=owner_id,
             created_at=datetime.utcnow()
         )
-        channels_db[channel_id] = channel.model_dump()
+        channel_data = channel.model_dump()
+        await store.put_channel(channel_data)
         
-        logger.info(f"Channel verified: {channel_id}")
-        return {
+        logger.info("Channel verified: %s", channel_id)
+        return FastJSONResponse({
             "status": "success",
             "message": "Channel verified",
-            "channel": channel.model_dump()
-        }
+            "channel": channel_data
+        })
     except Exception as e:
-        logger.error(f"Channel verification error: {str(e)}")
+        logger.error("Channel verification error: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/channels/{channel_id}/bounties")
+async def get_channel_bounties(
+    channel_id: int,
+    limit: int = Query(default=DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = None,
+    store: Storage = Depends(get_storage),
+):
+    """Open bounties targeting a channel (pending, deadline not passed), oldest first"""
+    try:
+        after = decode_cursor(cursor)[0] if cursor else None
+        rows, total = await store.list_channel_bounties(channel_id, limit + 1, after)
+        open_bounties, next_cursor = page_of(rows, limit, lambda bounty: (bounty["bounty_id"],))
+        return FastJSONResponse({
+            "status": "success",
+            "count": total,
+            "bounties": open_bounties,
+            "next_cursor": next_cursor
+        })
+    except Exception as e:
+        logger.error("Error fetching channel bounties: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/bounties/create")
-async def create_bounty(request: CreateBountyRequest):
+async def create_bounty(request: CreateBountyRequest, store: Storage = Depends(get_storage)):
     """Create a new bounty"""
     try:
-        bounty_id = f"bounty_{len(bounties_db) + 1}"
+        bounty_id = new_id("bounty")
         deadline = datetime.utcnow() + timedelta(days=request.deadline_days)
         
         bounty = Bounty(
@@ -285,43 +476,151 @@ async def create_bounty(request: CreateBountyRequest):
             created_at=datetime.utcnow(),
             deadline=deadline
         )
-        bounties_db[bounty_id] = bounty.model_dump()
+        bounty_data = bounty.model_dump()
+        # The budget goes into escrow together with the bounty
+        deposit = deposit_transaction(bounty_data, bounty.created_at)
+        await store.add_bounty(bounty_data, deposit)
+        scheduler.schedule(bounty_id, deadline)
         
-        logger.info(f"Bounty created: {bounty_id}")
-        return {
+        logger.info("Bounty created: %s", bounty_id)
+        return FastJSONResponse({
             "status": "success",
             "message": "Bounty created",
-            "bounty": bounty.model_dump()
-        }
+            "bounty": bounty_data,
+            "transaction": deposit
+        })
     except Exception as e:
-        logger.error(f"Bounty creation error: {str(e)}")
+        logger.error("Bounty creation error: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+def validate_batch(model, items: List[Dict[str, Any]]) -> list:
+    """Validate every item of a batch in one pass; any failure rejects the batch with per-item errors"""
+    if not 1 <= len(items) <= MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch must hold 1 to {MAX_BATCH_SIZE} items")
+    parsed, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            parsed.append(model.model_validate(item))
+        except ValidationError as e:
+            errors.append({"index": index, "status": "error", "errors": e.errors(include_url=False, include_context=False)})
+    if errors:
+        # All or nothing: report every bad item and store none
+        raise HTTPException(status_code=400, detail={"message": f"{len(errors)} invalid items", "results": errors})
+    return parsed
+
+@app.post("/channels/verify/batch")
+async def verify_channels_batch(
+    items: List[Dict[str, Any]] = Body(...),
+    store: Storage = Depends(get_storage),
+):
+    """Verify many channels in one request; every item is stored or none is"""
+    try:
+        requests = validate_batch(VerifyChannelRequest, items)
+        now = datetime.utcnow()
+        channels = [
+            {
+                "channel_id": request.channel_id,
+                "channel_name": request.channel_name,
+                "subscribers": request.subscribers,
+                "niche": request.niche,
+                "verified": True,
+                "owner_id": request.owner_id,
+                "created_at": now
+            }
+            for request in requests
+        ]
+        await store.put_channels(channels)
+        
+        logger.info("Channels verified in batch: %s", len(channels))
+        return FastJSONResponse({
+            "status": "success",
+            "count": len(channels),
+            "results": [{"index": index, "status": "verified", "channel": channel} for index, channel in enumerate(channels)]
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Batch channel verification error: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/bounties/create/batch")
+async def create_bounties_batch(
+    items: List[Dict[str, Any]] = Body(...),
+    store: Storage = Depends(get_storage),
+):
+    """Create many bounties in one request; every item is stored or none is"""
+    try:
+        requests = validate_batch(CreateBountyRequest, items)
+        now = datetime.utcnow()
+        bounties = [
+            {
+                "bounty_id": new_id("bounty"),
+                "advertiser_id": request.advertiser_id,
+                "ton_amount": request.ton_amount,
+                "ad_text": request.ad_text,
+                "ad_link": request.ad_link,
+                "target_channels": request.target_channels,
+                "status": "pending",
+                "escrow_address": None,
+                "created_at": now,
+                "deadline": now + timedelta(days=request.deadline_days)
+            }
+            for request in requests
+        ]
+        deposits = [deposit_transaction(bounty, now) for bounty in bounties]
+        await store.add_bounties(bounties, deposits)
+        for bounty in bounties:
+            scheduler.schedule(bounty["bounty_id"], bounty["deadline"])
+        
+        logger.info("Bounties created in batch: %s", len(bounties))
+        return FastJSONResponse({
+            "status": "success",
+            "count": len(bounties),
+            "results": [{"index": index, "status": "created", "bounty": bounty} for index, bounty in enumerate(bounties)]
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Batch bounty creation error: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/bounties/{bounty_id}")
-async def get_bounty(bounty_id: str):
-    """Get bounty details"""
+async def get_bounty(
+    bounty_id: str,
+    if_none_match: Optional[str] = Header(default=None),
+    store: Storage = Depends(get_storage),
+):
+    """Get bounty details; answers 304 when If-None-Match carries the current ETag"""
     try:
-        if bounty_id not in bounties_db:
+        # Only a 200 hands out an ETag, so a match means the bounty exists. A bounty with no write
+        # seen by this process gets neither: its ETag would be "<epoch>-0", which any other key with
+        # no writes (including a bounty that does not exist) shares
+        key = ("bounty", bounty_id)
+        etag = store.versions.etag(key) if store.versions is not None and store.versions.get(key) else None
+        if etag is not None and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        bounty = await store.get_bounty(bounty_id)
+        if bounty is None:
             raise HTTPException(status_code=404, detail="Bounty not found")
         
-        return {
+        return FastJSONResponse({
             "status": "success",
-            "bounty": bounties_db[bounty_id]
-        }
+            "bounty": bounty
+        }, headers={"ETag": etag} if etag else None)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error fetching bounty: {str(e)}")
+        logger.error("Error fetching bounty: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/bounties/{bounty_id}/bid")
-async def place_bid(bounty_id: str, request: BidRequest):
+async def place_bid(bounty_id: str, request: BidRequest, store: Storage = Depends(get_storage)):
     """Place a bid on a bounty"""
     try:
-        if bounty_id not in bounties_db:
+        if await store.get_bounty(bounty_id) is None:
             raise HTTPException(status_code=404, detail="Bounty not found")
         
-        bid_id = f"bid_{len(bids_db) + 1}"
+        bid_id = new_id("bid")
         bid = {
             "bid_id": bid_id,
             "bounty_id": bounty_id,
@@ -330,102 +629,250 @@ async def place_bid(bounty_id: str, request: BidRequest):
             "status": "pending",
             "created_at": datetime.utcnow().isoformat()
         }
-        bids_db[bid_id] = bid
+        await store.add_bid(bid)
         
-        logger.info(f"Bid placed: {bid_id} on bounty {bounty_id}")
-        return {
+        logger.info("Bid placed: %s on bounty %s", bid_id, bounty_id)
+        return FastJSONResponse({
             "status": "success",
             "message": "Bid placed",
             "bid": bid
-        }
+        })
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Bid placement error: {str(e)}")
+        logger.error("Bid placement error: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/bounties/{bounty_id}/confirm-views")
-async def confirm_views(bounty_id: str, request: ConfirmViewsRequest):
-    """Confirm views and trigger payout"""
+async def confirm_views(bounty_id: str, request: ConfirmViewsRequest, store: Storage = Depends(get_storage)):
+    """Confirm views and trigger payout; a bounty pays out at most once"""
     try:
-        if bounty_id not in bounties_db:
-            raise HTTPException(status_code=404, detail="Bounty not found")
-        
-        bounty = bounties_db[bounty_id]
+        async with bounty_locks(bounty_id):
+            bounty = await store.get_bounty(bounty_id)
+            if bounty is None:
+                raise HTTPException(status_code=404, detail="Bounty not found")
+            current_status = bounty["status"]
+            if current_status not in CONFIRMABLE_STATUSES:
+                raise HTTPException(status_code=409, detail=f"Bounty is already {current_status}")
+            # A pending bounty past its deadline is the expiry scheduler's to refund, even if its batch
+            # has not reached it yet; posted bounties are never expired, so they stay payable
+            deadline = bounty["deadline"]
+            if current_status == "pending" and deadline is not None and deadline <= datetime.utcnow():
+                raise HTTPException(status_code=409, detail="Bounty deadline has passed")
+            
+            # Attribute the payout to a channel for advertiser stats
+            target_channels = list(bounty["target_channels"] or ())
+            channel_id = request.channel_id
+            if channel_id is None and len(target_channels) == 1:
+                channel_id = target_channels[0]
+            elif channel_id is not None and target_channels and channel_id not in target_channels:
+                raise HTTPException(status_code=400, detail="Channel is not targeted by this bounty")
+            
+            # Create transaction record
+            tx_id = new_id("tx")
+            transaction = Transaction(
+                tx_id=tx_id,
+                from_user=bounty["advertiser_id"],
+                to_user=request.channel_owner_id,
+                amount=bounty["ton_amount"],
+                tx_type="payout",
+                status="success",
+                bounty_id=bounty_id,
+                created_at=datetime.utcnow(),
+                channel_id=channel_id
+            )
+            
+            # Update bounty status and record the payout together, only if no one
+            # (another worker, the expiry scheduler) changed the status since we read it
+            transaction_data = transaction.model_dump()
+            bounty = await store.set_bounty_status(bounty_id, "confirmed", transaction_data, expected=current_status)
         
-        # Update bounty status
-        bounty["status"] = "confirmed"
-        bounties_db[bounty_id] = bounty
-        
-        # Create transaction record
-        tx_id = f"tx_{len(transactions_db) + 1}"
-        transaction = Transaction(
-            tx_id=tx_id,
-            from_user=bounty["advertiser_id"],
-            to_user=request.channel_owner_id,
-            amount=bounty["ton_amount"],
-            tx_type="payout",
-            status="success",
-            bounty_id=bounty_id,
-            created_at=datetime.utcnow()
-        )
-        transactions_db[tx_id] = transaction.model_dump()
-        
-        logger.info(f"Views confirmed for bounty {bounty_id}, payout triggered")
-        return {
+        logger.info("Views confirmed for bounty %s, payout triggered", bounty_id)
+        return FastJSONResponse({
             "status": "success",
             "message": "Views confirmed, payout released",
             "bounty": bounty,
-            "transaction": transaction.model_dump()
-        }
+            "transaction": transaction_data
+        })
     except HTTPException:
         raise
+    except StatusConflict as e:
+        raise HTTPException(status_code=409, detail=f"Bounty is already {e.current}")
     except Exception as e:
-        logger.error(f"Confirm views error: {str(e)}")
+        logger.error("Confirm views error: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/transactions/{user_id}")
-async def get_transactions(user_id: int):
-    """Get transaction history for a user"""
+async def get_transactions(
+    user_id: int,
+    limit: int = Query(default=DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: Optional[str] = None,
+    store: Storage = Depends(get_storage),
+):
+    """Get transaction history for a user, oldest first, one keyset page at a time"""
     try:
-        user_txs = [tx for tx in transactions_db.values() 
-                    if tx.get("from_user") == user_id or tx.get("to_user") == user_id]
+        after = decode_cursor(cursor)[0] if cursor else None
+        rows, total = await store.list_user_transactions(user_id, limit + 1, after)
+        user_txs, next_cursor = page_of(rows, limit, lambda tx: (tx["tx_id"],))
         
-        return {
+        return FastJSONResponse({
             "status": "success",
-            "count": len(user_txs),
-            "transactions": user_txs
-        }
+            "count": total,
+            "transactions": user_txs,
+            "next_cursor": next_cursor
+        })
     except Exception as e:
-        logger.error(f"Error fetching transactions: {str(e)}")
+        logger.error("Error fetching transactions: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/transactions/{user_id}/export")
+async def export_transactions(
+    user_id: int,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    store: Storage = Depends(get_storage),
+):
+    """Stream a user's full transaction history as NDJSON or CSV"""
+    records = store.iter_user_transactions(user_id)
+    if format == "csv":
+        body, media_type = csv_lines(records, TRANSACTION_FIELDS), "text/csv"
+    else:
+        body, media_type = ndjson_lines(records), "application/x-ndjson"
+    
+    logger.info("Exporting transactions for user %s as %s", user_id, format)
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="transactions_{user_id}.{format}"'}
+    )
+
 @app.post("/bot/post-ad")
-async def post_ad(bounty_id: str, channel_id: int):
-    """Trigger bot to post ad to channel (called by backend job)"""
+async def post_ad(bounty_id: str, channel_id: int, store: Storage = Depends(get_storage)):
+    """Trigger bot to post ad to channel (called by backend job); only a pending bounty can be posted"""
     try:
-        if bounty_id not in bounties_db:
-            raise HTTPException(status_code=404, detail="Bounty not found")
+        # Compare-and-set: a confirmed or expired bounty must not become confirmable again
+        async with bounty_locks(bounty_id):
+            if await store.set_bounty_status(bounty_id, "posted", expected="pending") is None:
+                raise HTTPException(status_code=404, detail="Bounty not found")
         
-        bounty = bounties_db[bounty_id]
-        
-        # Update bounty status to posted
-        bounty["status"] = "posted"
-        bounties_db[bounty_id] = bounty
-        
-        logger.info(f"Ad posted to channel {channel_id} for bounty {bounty_id}")
-        return {
+        logger.info("Ad posted to channel %s for bounty %s", channel_id, bounty_id)
+        return FastJSONResponse({
             "status": "success",
             "message": "Ad posted to channel",
             "bounty_id": bounty_id,
             "channel_id": channel_id
-        }
+        })
     except HTTPException:
         raise
+    except StatusConflict as e:
+        raise HTTPException(status_code=409, detail=f"Bounty is already {e.current}")
     except Exception as e:
-        logger.error(f"Post ad error: {str(e)}")
+        logger.error("Post ad error: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/advertisers/{advertiser_id}/stats")
+async def get_advertiser_stats(
+    advertiser_id: int,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    store: Storage = Depends(get_storage),
+):
+    """Get an advertiser's payout spend by niche, channel and day (UTC), in nanoTON"""
+    try:
+        stats = await store.get_advertiser_stats(advertiser_id, since, until)
+        return FastJSONResponse({
+            "status": "success",
+            "unit": "nanoTON",
+            "stats": stats
+        })
+    except Exception as e:
+        logger.error("Error fetching advertiser stats: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/users/{user_id}/balance")
+async def get_balance(user_id: int, store: Storage = Depends(get_storage)):
+    """Get a user's running totals from the balance ledger, in nanoTON"""
+    try:
+        balance = await store.get_balance(user_id)
+        return FastJSONResponse({
+            "status": "success",
+            "unit": "nanoTON",
+            "balance": balance
+        })
+    except Exception as e:
+        logger.error("Error fetching balance: %s", e)
+        raise HTTPException(status_code=400, detail=str(e))
+
+# ============================================================================
+# Admin Endpoints
+# ============================================================================
+
+@app.post("/admin/profile/start", dependencies=[Depends(require_admin)])
+async def start_profile(
+    seconds: float = Query(default=30.0, gt=0, le=MAX_SECONDS),
+    every: int = Query(default=1, ge=1),
+    interval_ms: float = Query(default=5.0, ge=1.0),
+):
+    """Profile one request in `every` for `seconds`; every=1 samples the whole event loop"""
+    if ProfilerMiddleware not in (middleware.cls for middleware in app.user_middleware):
+        raise HTTPException(status_code=409, detail="Profiler middleware is not installed")
+    profiler.start(seconds, every=every, interval=interval_ms / 1000)
+    logger.info("Profiling started: every %s requests for %ss", every, seconds)
+    return FastJSONResponse({"status": "success", "profile": profiler.status()})
+
+@app.post("/admin/profile/stop", dependencies=[Depends(require_admin)])
+async def stop_profile():
+    """End the running profiling session; its stacks stay available"""
+    profiler.stop()
+    return FastJSONResponse({"status": "success", "profile": profiler.status()})
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def get_profile(format: Literal["collapsed", "status"] = "collapsed"):
+    """Stacks of the current or last session as collapsed text (flamegraph.pl, speedscope), or its status"""
+    if format == "status":
+        return FastJSONResponse({"status": "success", "profile": profiler.status()})
+    return Response(profiler.collapsed(app.routes), media_type="text/plain; charset=utf-8")
+
+@app.get("/admin/memory", dependencies=[Depends(require_admin)])
+async def get_memory(store: Storage = Depends(get_storage)):
+    """Deep size of every in-memory store, index and long-lived cache, and the process's peak RSS"""
+    structures = dict(store.memory_structures())
+    structures["rate_limit_buckets"] = rate_limiter.buckets
+    structures["http_metrics"] = http_metrics
+    # The walk is plain Python; in a thread the loop keeps serving requests between GIL switches
+    sizes = await asyncio.to_thread(deep_sizes, structures)
+    return FastJSONResponse({
+        "status": "success",
+        "structures": sizes,
+        "total_bytes": sum(entry["new_bytes"] for entry in sizes.values()),
+        # ru_maxrss is in KiB on Linux
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    })
+
+@app.post("/admin/memory/trace/start", dependencies=[Depends(require_admin)])
+async def start_memory_trace(frames: int = Query(default=1, ge=1, le=64)):
+    """Start tracemalloc (slows every allocation) and take the baseline snapshot"""
+    await asyncio.to_thread(allocations.start, frames)
+    logger.info("tracemalloc started with %s frames", frames)
+    return FastJSONResponse({"status": "success", "tracing": True})
+
+@app.get("/admin/memory/trace", dependencies=[Depends(require_admin)])
+async def get_memory_trace(
+    group_by: Literal[GROUP_BY] = "lineno",
+    limit: int = Query(default=25, ge=1, le=500),
+    reset: bool = False,
+):
+    """Top allocation sites and growth since the baseline; reset=true makes this snapshot the new baseline"""
+    if not allocations.tracing:
+        raise HTTPException(status_code=409, detail="tracemalloc is not running")
+    report = await asyncio.to_thread(allocations.report, group_by, limit, reset)
+    return FastJSONResponse({"status": "success", "trace": report})
+
+@app.post("/admin/memory/trace/stop", dependencies=[Depends(require_admin)])
+async def stop_memory_trace():
+    """Stop tracemalloc and drop its traces"""
+    allocations.stop()
+    return FastJSONResponse({"status": "success", "tracing": False})
+
 @app.get("/")
 async def root():
     """Root endpoint with API documentation"""
@@ -438,8 +885,14 @@ async def root():
             "health": "/health",
             "auth": "/auth/telegram",
             "channels": "/channels/verified",
+            "channel_search": "/channels/search",
+            "channel_bounties": "/channels/{channel_id}/bounties",
             "bounties": "/bounties/create",
-            "transactions": "/transactions/{user_id}"
+            "transactions": "/transactions/{user_id}",
+            "balance": "/users/{user_id}/balance",
+            "advertiser_stats": "/advertisers/{advertiser_id}/stats",
+            "export": "/transactions/{user_id}/export",
+            "metrics": "/metrics"
         }
     }
 
@@ -0,0 +1,153 @@
+"""
+AdBounty Backend - Memory attribution
+Deep sizes of the in-memory stores and indexes, and tracemalloc snapshots diffed against a baseline
+"""
+
+import sys
+import tracemalloc
+from array import array
+from datetime import date, datetime, timedelta
+from types import BuiltinFunctionType, CodeType, FrameType, FunctionType, MethodType, ModuleType
+from typing import Dict, Mapping, Optional, Set, Tuple
+
+# Sized by getsizeof alone: nothing inside them is a separate Python object
+_ATOMIC = (str, bytes, bytearray, int, float, complex, bool, type(None), range, datetime, date, timedelta, array)
+# Shared program state rather than data; reaching one means a structure points at code, not at records
+_OPAQUE = (type, ModuleType, FunctionType, BuiltinFunctionType, MethodType, FrameType, CodeType)
+GROUP_BY = ("lineno", "filename", "traceback")
+
+
+def _slot_names(cls) -> Tuple[str, ...]:
+    names = []
+    for klass in cls.__mro__:
+        slots = klass.__dict__.get("__slots__", ())
+        names.extend((slots,) if isinstance(slots, str) else slots)
+    return tuple(name for name in names if name not in ("__dict__", "__weakref__"))
+
+
+def deep_size(obj, seen: Optional[Set[int]] = None) -> Tuple[int, int]:
+    """(bytes, objects) reachable from `obj` through containers, __dict__ and __slots__.
+
+    Objects already in `seen` are not counted again, so passing one set across
+    calls attributes shared objects to the first structure that reaches them.
+    Containers are copied with list() before walking, which the GIL makes
+    atomic. This lets the walk run in a worker thread while handlers keep
+    writing.
+    """
+    seen = set() if seen is None else seen
+    slots: Dict[type, Tuple[str, ...]] = {}
+    size = count = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _OPAQUE):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        count += 1
+        if isinstance(obj, _ATOMIC):
+            continue
+        if isinstance(obj, dict):
+            for key, value in list(obj.items()):
+                stack.append(key)
+                stack.append(value)
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(list(obj))
+        else:
+            cls = type(obj)
+            names = slots.get(cls)
+            if names is None:
+                names = slots[cls] = _slot_names(cls)
+            stack.extend(getattr(obj, name, None) for name in names)
+            instance_dict = getattr(obj, "__dict__", None)
+            if isinstance(instance_dict, dict):
+                stack.append(instance_dict)
+    return size, count
+
+
+def deep_sizes(structures: Mapping[str, object]) -> dict:
+    """Per structure its deep size on its own, and the bytes it adds to those listed before it.
+
+    "new_bytes" sums to the total: list stores before indexes so index entries
+    that point at stored records are not charged for them.
+    """
+    report = {}
+    shared: Set[int] = set()
+    for name, obj in structures.items():
+        size, count = deep_size(obj)
+        new_bytes, _ = deep_size(obj, shared)
+        report[name] = {
+            "items": len(obj) if hasattr(obj, "__len__") else None,
+            "bytes": size,
+            "objects": count,
+            "new_bytes": new_bytes,
+        }
+    return report
+
+
+def _frames(traceback: tracemalloc.Traceback) -> list:
+    return [f"{frame.filename}:{frame.lineno}" for frame in traceback]
+
+
+class AllocationTracer:
+    """tracemalloc sessions: start() records a baseline; report() diffs a fresh snapshot against it.
+
+    Tracing slows every allocation and keeps a record per live block, so it is
+    only on between start() and stop().
+    """
+
+    def __init__(self):
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing() and self.baseline is not None
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    def start(self, frames: int = 1) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.baseline = self._snapshot()
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+        self.baseline = None
+
+    def report(self, group_by: str = "lineno", limit: int = 25, reset: bool = False) -> dict:
+        """Largest allocation sites now, and the ones that grew most since the baseline (or the last reset)"""
+        if not self.tracing:
+            raise RuntimeError("tracemalloc is not tracing")
+        if group_by not in GROUP_BY:
+            raise ValueError(f"group_by must be one of {', '.join(GROUP_BY)}")
+        snapshot = self._snapshot()
+        growth = [
+            stat for stat in snapshot.compare_to(self.baseline, group_by) if stat.size_diff or stat.count_diff
+        ][:limit]
+        top = snapshot.statistics(group_by)[:limit]
+        traced, peak = tracemalloc.get_traced_memory()
+        if reset:
+            self.baseline = snapshot
+        return {
+            "traced_bytes": traced,
+            "peak_bytes": peak,
+            "tracemalloc_bytes": tracemalloc.get_tracemalloc_memory(),
+            "top": [{"where": _frames(stat.traceback), "bytes": stat.size, "blocks": stat.count} for stat in top],
+            "growth": [
+                {
+                    "where": _frames(stat.traceback),
+                    "bytes": stat.size,
+                    "bytes_diff": stat.size_diff,
+                    "blocks": stat.count,
+                    "blocks_diff": stat.count_diff,
+                }
+                for stat in growth
+            ],
+        }
@@ -0,0 +1,192 @@
+"""
+AdBounty Backend - Metrics
+Per-route request counters and latency histograms, store sizes and event loop lag in Prometheus text format
+"""
+
+import asyncio
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+# Called after every HTTP request with its ASGI scope, response status and duration in seconds
+Observer = Callable[[dict, int, float], None]
+
+
+def _labels(labels: Mapping[str, object]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        f'{name}="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def gauge(name: str, help_text: str, samples: Iterable[Tuple[Mapping[str, object], float]]) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    lines.extend(f"{name}{_labels(labels)} {_number(value)}" for labels, value in samples)
+    return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram: one count per bucket (the last is +Inf) and the sum of observations"""
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        # bisect_left puts a value equal to a bound in that bound's bucket, as `le` requires
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def samples(self, name: str, labels: Mapping[str, object]) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + ("+Inf",), self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(self.sum)}")
+        lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return lines
+
+
+class RouteSeries(Histogram):
+    """A route's latency histogram plus its request count per status"""
+
+    __slots__ = ("statuses",)
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        super().__init__(bounds)
+        self.statuses: Dict[int, int] = {}
+
+
+class HTTPMetrics:
+    """Request counts by route and status, and a latency histogram per route.
+
+    Series are keyed by (method, the endpoint function the router matched) and
+    only named by route template when rendered, so recording a request is one
+    dict lookup and a bisect. Every update runs on the event loop thread
+    without awaiting, so no locks are needed.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.series: Dict[tuple, RouteSeries] = {}
+
+    def observe(self, method: str, endpoint, status: int, seconds: float) -> None:
+        series = self.series.get((method, endpoint))
+        if series is None:
+            series = self.series[(method, endpoint)] = RouteSeries(self.buckets)
+        statuses = series.statuses
+        statuses[status] = statuses.get(status, 0) + 1
+        series.counts[bisect_left(self.buckets, seconds)] += 1
+        series.sum += seconds
+
+    def record(self, scope, status: int, seconds: float) -> None:
+        self.observe(scope["method"], scope.get("endpoint"), status, seconds)
+
+    def render(self, routes) -> List[str]:
+        """Text exposition lines; `routes` (app.routes) names the endpoints, unmatched requests are route "-" """
+        paths = {route.endpoint: route.path for route in routes if hasattr(route, "endpoint")}
+        named = sorted(
+            (((paths.get(endpoint, "-"), method), series) for (method, endpoint), series in self.series.items()),
+            key=lambda item: item[0],
+        )
+        name = "adbounty_http_requests_total"
+        lines = [f"# HELP {name} Requests handled, by route and status", f"# TYPE {name} counter"]
+        for (route, method), series in named:
+            for status, count in sorted(series.statuses.items()):
+                lines.append(f"{name}{_labels({'method': method, 'route': route, 'status': status})} {count}")
+        name = "adbounty_http_request_duration_seconds"
+        lines += [f"# HELP {name} Request latency by route", f"# TYPE {name} histogram"]
+        for (route, method), series in named:
+            lines += series.samples(name, {"method": method, "route": route})
+        return lines
+
+
+class InstrumentationMiddleware:
+    """Times every HTTP request once and hands its status and duration to each observer.
+
+    An ASGI layer and its send wrapper cost more than recording a request, so
+    metrics and the access log share this one layer instead of wrapping the
+    app twice.
+    """
+
+    def __init__(self, app, observers: Sequence[Observer]):
+        self.app = app
+        self.observers = tuple(observers)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        # A plain function handing back send's awaitable saves a coroutine frame per message
+        def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            return send(message)
+
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            seconds = perf_counter() - start
+            for observe in self.observers:
+                observe(scope, status, seconds)
+
+
+class LoopLagMonitor:
+    """Measures event loop lag: how late a sleep of `interval` wakes up.
+
+    Anything blocking the loop (a slow synchronous call, a long CPU-bound
+    stretch between awaits) delays every request by the same amount.
+    """
+
+    def __init__(self, interval: float = 0.25):
+        self.interval = interval
+        self.lag = 0.0
+        self.histogram = Histogram(LAG_BUCKETS)
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - start - self.interval)
+            self.histogram.observe(self.lag)
+
+    def render(self) -> List[str]:
+        lines = gauge("adbounty_event_loop_lag_seconds", "Lag of the latest event loop probe", [({}, self.lag)])
+        name = "adbounty_event_loop_probe_lag_seconds"
+        lines += [f"# HELP {name} Event loop lag of every probe", f"# TYPE {name} histogram"]
+        return lines + self.histogram.samples(name, {})
@@ -0,0 +1,31 @@
+"""transaction keyset indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 13:05:41.518230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_transactions_from_user_tx_id', 'transactions', ['from_user', 'tx_id'], unique=False)
+    op.create_index('ix_transactions_to_user_tx_id', 'transactions', ['to_user', 'tx_id'], unique=False)
+    op.drop_index('ix_transactions_from_user_created_at', table_name='transactions')
+    op.drop_index('ix_transactions_to_user_created_at', table_name='transactions')
+
+
+def downgrade() -> None:
+    op.create_index('ix_transactions_to_user_created_at', 'transactions', ['to_user', 'created_at', 'tx_id'], unique=False)
+    op.create_index('ix_transactions_from_user_created_at', 'transactions', ['from_user', 'created_at', 'tx_id'], unique=False)
+    op.drop_index('ix_transactions_to_user_tx_id', table_name='transactions')
+    op.drop_index('ix_transactions_from_user_tx_id', table_name='transactions')
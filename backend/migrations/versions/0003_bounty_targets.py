@@ -0,0 +1,42 @@
+"""bounty targets
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 14:02:17.204113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bounty_targets = op.create_table('bounty_targets',
+    sa.Column('channel_id', sa.BigInteger(), autoincrement=False, nullable=False),
+    sa.Column('bounty_id', sa.String(length=64), nullable=False),
+    sa.ForeignKeyConstraint(['bounty_id'], ['bounties.bounty_id'], ),
+    sa.PrimaryKeyConstraint('channel_id', 'bounty_id')
+    )
+
+    # Backfill from the JSON column
+    bounties = sa.table('bounties', sa.column('bounty_id', sa.String), sa.column('target_channels', sa.JSON))
+    rows = op.get_bind().execute(sa.select(bounties.c.bounty_id, bounties.c.target_channels))
+    targets = [
+        {'channel_id': channel_id, 'bounty_id': bounty_id}
+        for bounty_id, channel_ids in rows
+        for channel_id in dict.fromkeys(channel_ids or ())
+    ]
+    if targets:
+        op.bulk_insert(bounty_targets, targets)
+
+
+def downgrade() -> None:
+    op.drop_table('bounty_targets')
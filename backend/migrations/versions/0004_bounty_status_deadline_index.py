@@ -0,0 +1,25 @@
+"""bounty status deadline index
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 15:11:48.660127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_bounties_status_deadline', 'bounties', ['status', 'deadline'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_bounties_status_deadline', table_name='bounties')
@@ -0,0 +1,46 @@
+"""balances
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 16:40:12.518304
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from ledger import balance_deltas, balance_of
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    balances = op.create_table('balances',
+    sa.Column('user_id', sa.BigInteger(), autoincrement=False, nullable=False),
+    sa.Column('deposited', sa.BigInteger(), nullable=False),
+    sa.Column('escrowed', sa.BigInteger(), nullable=False),
+    sa.Column('earned', sa.BigInteger(), nullable=False),
+    sa.Column('refunded', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+    # Backfill by replaying the existing transactions once
+    transactions = sa.table(
+        'transactions',
+        sa.column('from_user', sa.BigInteger), sa.column('to_user', sa.BigInteger), sa.column('amount', sa.Float),
+        sa.column('tx_type', sa.String), sa.column('status', sa.String),
+    )
+    rows = op.get_bind().execute(sa.select(transactions))
+    totals = balance_deltas(row._mapping for row in rows)
+    if totals:
+        op.bulk_insert(balances, [balance_of(user_id, delta) for user_id, delta in totals.items()])
+
+
+def downgrade() -> None:
+    op.drop_table('balances')
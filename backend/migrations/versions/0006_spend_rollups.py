@@ -0,0 +1,56 @@
+"""spend rollups
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 17:52:36.004781
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from analytics import UNKNOWN_NICHE, spend_entries
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('transactions', sa.Column('channel_id', sa.BigInteger(), nullable=True))
+    spend_rollups = op.create_table('spend_rollups',
+    sa.Column('advertiser_id', sa.BigInteger(), autoincrement=False, nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('channel_id', sa.BigInteger(), autoincrement=False, nullable=False),
+    sa.Column('niche', sa.String(length=64), nullable=False),
+    sa.Column('spent', sa.BigInteger(), nullable=False),
+    sa.Column('payouts', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('advertiser_id', 'day', 'channel_id', 'niche')
+    )
+
+    # Backfill from existing payouts; they predate channel attribution, so all land on channel 0
+    transactions = sa.table(
+        'transactions',
+        sa.column('from_user', sa.BigInteger), sa.column('amount', sa.Float), sa.column('tx_type', sa.String),
+        sa.column('status', sa.String), sa.column('created_at', sa.DateTime),
+    )
+    rows = op.get_bind().execute(
+        sa.select(transactions).where(transactions.c.tx_type == 'payout', transactions.c.status == 'success')
+    )
+    entries = spend_entries((row._mapping for row in rows), lambda channel_id: UNKNOWN_NICHE)
+    if entries:
+        op.bulk_insert(spend_rollups, [
+            {'advertiser_id': advertiser_id, 'day': date.fromordinal(day), 'channel_id': 0, 'niche': niche,
+             'spent': spent, 'payouts': payouts}
+            for (advertiser_id, day, _, niche), (spent, payouts) in entries.items()
+        ])
+
+
+def downgrade() -> None:
+    op.drop_table('spend_rollups')
+    op.drop_column('transactions', 'channel_id')
@@ -0,0 +1,128 @@
+"""
+AdBounty Backend - SQLAlchemy schema
+Shared by the SQL storage backend and the Alembic migrations
+"""
+
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import JSON, BigInteger, Boolean, Date, DateTime, Float, ForeignKey, Index, Integer, String, Text
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class UserRow(Base):
+    __tablename__ = "users"
+
+    telegram_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    username: Mapped[str] = mapped_column(String(255))
+    wallet_address: Mapped[Optional[str]] = mapped_column(String(128))
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+
+
+class ChannelRow(Base):
+    __tablename__ = "channels"
+    __table_args__ = (
+        Index("ix_channels_verified_subscribers", "verified", "subscribers", "channel_id"),
+        Index("ix_channels_verified_created_at", "verified", "created_at", "channel_id"),
+        Index("ix_channels_niche_verified", "niche", "verified"),
+    )
+
+    channel_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    channel_name: Mapped[str] = mapped_column(String(255))
+    subscribers: Mapped[int] = mapped_column(Integer)
+    niche: Mapped[str] = mapped_column(String(64))
+    verified: Mapped[bool] = mapped_column(Boolean)
+    owner_id: Mapped[int] = mapped_column(BigInteger)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+
+
+class BountyRow(Base):
+    __tablename__ = "bounties"
+    __table_args__ = (
+        # Seeds the expiry scheduler with pending deadlines without a table scan
+        Index("ix_bounties_status_deadline", "status", "deadline"),
+    )
+
+    bounty_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    advertiser_id: Mapped[int] = mapped_column(BigInteger, index=True)
+    ton_amount: Mapped[float] = mapped_column(Float)
+    ad_text: Mapped[str] = mapped_column(Text)
+    ad_link: Mapped[str] = mapped_column(Text)
+    target_channels: Mapped[List[int]] = mapped_column(JSON)
+    status: Mapped[str] = mapped_column(String(16))
+    escrow_address: Mapped[Optional[str]] = mapped_column(String(128))
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    deadline: Mapped[Optional[datetime]] = mapped_column(DateTime)
+
+
+class BountyTargetRow(Base):
+    """One row per (channel, bounty) pair: target_channels as an indexable relation for channel feeds"""
+
+    __tablename__ = "bounty_targets"
+
+    channel_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    bounty_id: Mapped[str] = mapped_column(String(64), ForeignKey("bounties.bounty_id"), primary_key=True)
+
+
+class BidRow(Base):
+    __tablename__ = "bids"
+
+    bid_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    bounty_id: Mapped[str] = mapped_column(String(64), ForeignKey("bounties.bounty_id"), index=True)
+    channel_owner_id: Mapped[int] = mapped_column(BigInteger)
+    channel_id: Mapped[int] = mapped_column(BigInteger)
+    status: Mapped[str] = mapped_column(String(16))
+    created_at: Mapped[Optional[str]] = mapped_column(String(32))
+
+
+class TransactionRow(Base):
+    __tablename__ = "transactions"
+    __table_args__ = (
+        # tx_ids are time-ordered, so (user, tx_id) serves both history order and keyset cursors
+        Index("ix_transactions_from_user_tx_id", "from_user", "tx_id"),
+        Index("ix_transactions_to_user_tx_id", "to_user", "tx_id"),
+    )
+
+    tx_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    from_user: Mapped[int] = mapped_column(BigInteger)
+    to_user: Mapped[int] = mapped_column(BigInteger)
+    amount: Mapped[float] = mapped_column(Float)
+    tx_type: Mapped[str] = mapped_column(String(16))
+    status: Mapped[str] = mapped_column(String(16))
+    bounty_id: Mapped[Optional[str]] = mapped_column(String(64))
+    tx_hash: Mapped[Optional[str]] = mapped_column(String(128))
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    # The channel a payout was earned on, when known
+    channel_id: Mapped[Optional[int]] = mapped_column(BigInteger)
+
+
+class BalanceRow(Base):
+    """Running totals per user in integer nanoTON, updated in the same transaction as each transactions insert"""
+
+    __tablename__ = "balances"
+
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    deposited: Mapped[int] = mapped_column(BigInteger, default=0)
+    escrowed: Mapped[int] = mapped_column(BigInteger, default=0)
+    earned: Mapped[int] = mapped_column(BigInteger, default=0)
+    refunded: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+class SpendRollupRow(Base):
+    """Payout totals per advertiser, day, channel and niche, updated with each payout insert.
+
+    channel_id 0 holds payouts not attributed to a channel (Telegram channel ids are negative).
+    """
+
+    __tablename__ = "spend_rollups"
+
+    advertiser_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    channel_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    niche: Mapped[str] = mapped_column(String(64), primary_key=True)
+    spent: Mapped[int] = mapped_column(BigInteger, default=0)
+    payouts: Mapped[int] = mapped_column(BigInteger, default=0)
@@ -0,0 +1,39 @@
+"""
+AdBounty Backend - Keyset pagination helpers
+Cursors are the opaque, URL-safe encoding of the sort key of the last item on a page
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence, Tuple
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+def encode_cursor(key: Sequence) -> str:
+    """Encode a sort key; datetimes are tagged so they round-trip"""
+    values = [{"dt": v.isoformat()} if isinstance(v, datetime) else v for v in key]
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Inverse of encode_cursor; raises ValueError on anything it did not produce"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return tuple(datetime.fromisoformat(v["dt"]) if isinstance(v, dict) else v for v in values)
+
+
+def page_of(rows: List[dict], limit: int, key: Callable[[dict], Sequence]) -> Tuple[List[dict], Optional[str]]:
+    """Trim a `limit + 1` fetch to one page and build the cursor for the next one"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key(rows[-1]))
@@ -0,0 +1,179 @@
+"""
+AdBounty Backend - Sampling profiler
+Samples the event loop thread's stack from a background thread and aggregates collapsed stacks for flamegraphs
+"""
+
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from starlette.routing import Match
+
+# Bounds on what one profiling session may cost
+MAX_SECONDS = 600.0
+MIN_INTERVAL = 0.001
+# Root frame for window-mode samples taken outside any request (scheduler, journal, idle loop)
+OTHER = "(other)"
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Statistical profiler for the event loop thread, started and stopped at runtime.
+
+    A daemon thread wakes every `interval` seconds and walks the loop thread's
+    current stack (sys._current_frames), counting each distinct stack. Requests
+    are picked by ProfilerMiddleware, one in `every`. It registers the sampled
+    request's own frame, and a stack containing a registered frame is charged
+    to that request's route. With every == 1 (window mode) stacks outside any
+    request are kept too, under "(other)"; otherwise they are dropped.
+
+    Only time spent running on the loop is seen. A request waiting on the
+    database is not on the stack; the latency histograms on /metrics cover that.
+    Sessions end by themselves after `seconds`, and aggregation stops at
+    `max_stacks` distinct stacks.
+    """
+
+    def __init__(self, interval: float = 0.005, max_stacks: int = 20000, max_depth: int = 128):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+        # Read by ProfilerMiddleware on every request; the only cost while idle
+        self.sampling = False
+        self.every = 1
+        self.until = 0.0
+        self.samples = 0
+        self.dropped = 0
+        self._requests: Dict[object, Tuple[str, object]] = {}
+        self._stacks: Dict[Tuple, int] = {}
+        self._seen = 0
+        self._loop_thread = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, seconds: float, every: int = 1, interval: Optional[float] = None) -> None:
+        """Start a session on the calling thread's loop, discarding the previous session's stacks"""
+        if every < 1:
+            raise ValueError("every must be at least 1")
+        self.stop()
+        self.every = every
+        self.interval = max(MIN_INTERVAL, interval or self.interval)
+        self.until = time.monotonic() + min(seconds, MAX_SECONDS)
+        self.samples = self.dropped = self._seen = 0
+        self._stacks = {}
+        self._loop_thread = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self.sampling = True
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.sampling = False
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._requests.clear()
+
+    def should_sample(self) -> bool:
+        self._seen += 1
+        return self._seen % self.every == 0
+
+    def begin(self, frame, scope) -> None:
+        """Charge samples under `frame` to the request's route, matched now since routing has not run yet"""
+        endpoint = None
+        app = scope.get("app")
+        for route in app.routes if app is not None else ():
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                endpoint = child_scope.get("endpoint")
+                break
+        self._requests[frame] = (scope["method"], endpoint)
+
+    def end(self, frame) -> None:
+        self._requests.pop(frame, None)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            if time.monotonic() >= self.until:
+                break
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                self._sample(frame)
+            del frame
+        self.sampling = False
+
+    def _sample(self, frame) -> None:
+        codes = []
+        root = OTHER
+        requests = self._requests
+        while frame is not None:
+            route = requests.get(frame)
+            if route is not None:
+                root = route
+                break
+            if len(codes) < self.max_depth:
+                codes.append(frame.f_code)
+            frame = frame.f_back
+        if root is OTHER and self.every > 1:
+            return
+        key = (root, tuple(reversed(codes)))
+        stacks = self._stacks
+        if key in stacks:
+            stacks[key] += 1
+        elif len(stacks) < self.max_stacks:
+            stacks[key] = 1
+        else:
+            self.dropped += 1
+            return
+        self.samples += 1
+
+    def collapsed(self, routes) -> str:
+        """Stacks in the collapsed format flamegraph.pl and speedscope read: "route;outer;...;inner count" per line"""
+        paths = {route.endpoint: route.path for route in routes if hasattr(route, "endpoint")}
+        merged: Dict[str, int] = {}
+        # list() copies the items in one step, while the sampler thread may still be adding stacks
+        for (root, codes), count in list(self._stacks.items()):
+            label = root if root is OTHER else f"{root[0]} {paths.get(root[1], '-')}"
+            line = ";".join([label] + [_frame_label(code).replace(";", ":") for code in codes])
+            merged[line] = merged.get(line, 0) + count
+        return "".join(f"{line} {count}\n" for line, count in sorted(merged.items()))
+
+    def status(self) -> dict:
+        return {
+            "sampling": self.sampling,
+            "every": self.every,
+            "interval": self.interval,
+            "seconds_left": round(max(0.0, self.until - time.monotonic()), 3) if self.sampling else 0.0,
+            "samples": self.samples,
+            "stacks": len(self._stacks),
+            "dropped": self.dropped,
+        }
+
+
+class ProfilerMiddleware:
+    """Marks one request in `profiler.every` for the sampler while a session runs.
+
+    Only installed when admin endpoints are enabled; outside a session a
+    request pays for one attribute check.
+    """
+
+    def __init__(self, app, profiler: SamplingProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        profiler = self.profiler
+        if not profiler.sampling or scope["type"] != "http" or not profiler.should_sample():
+            await self.app(scope, receive, send)
+            return
+        frame = sys._getframe()
+        profiler.begin(frame, scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.end(frame)
@@ -0,0 +1,229 @@
+"""
+AdBounty Backend - Admission control
+Per-user and per-IP token buckets checked by an ASGI middleware before any handler runs
+"""
+
+import math
+import os
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+class Limit(NamedTuple):
+    rate: float  # tokens added per second
+    burst: int  # bucket size
+
+    @classmethod
+    def parse(cls, value: str) -> "Limit":
+        """"rate/burst", e.g. "5/20" for 5 requests a second with bursts of 20"""
+        rate, burst = value.split("/")
+        return cls(float(rate), int(burst))
+
+
+# Route class -> limit per user; IPs get ip_factor times as much, since users share NATs
+DEFAULT_LIMITS: Dict[str, Limit] = {
+    "read": Limit(20.0, 60),
+    "write": Limit(5.0, 20),
+    "create": Limit(1.0, 10),
+}
+# Routes with their own class; everything else is "read" for GET/HEAD and "write" otherwise
+ROUTE_CLASSES: Dict[Tuple[str, str], str] = {
+    ("POST", "/bounties/create"): "create",
+    ("POST", "/bounties/create/batch"): "create",
+}
+EXEMPT_PATHS = frozenset({"/health"})
+USER_HEADER = b"x-telegram-user-id"
+
+
+class TokenBuckets:
+    """Token buckets in a sharded dict that forgets idle buckets lazily.
+
+    A bucket is [tokens, updated_at, full_at]. A bucket that has refilled
+    completely is the same as no bucket, so when a shard outgrows its
+    threshold the buckets past their full_at are dropped. Sharding keeps each
+    sweep short; no request pays for scanning the whole table. No background
+    task is needed.
+    """
+
+    def __init__(self, shards: int = 64, max_per_shard: int = 2048):
+        if shards & (shards - 1):
+            raise ValueError("shards must be a power of two")
+        self._shards: List[Dict[tuple, list]] = [{} for _ in range(shards)]
+        self._thresholds = [max_per_shard] * shards
+        self._mask = shards - 1
+        self.max_per_shard = max_per_shard
+
+    def take(self, key: tuple, limit: Limit, now: float) -> float:
+        """Take one token from `key`'s bucket; returns 0 if one was available, else the seconds until one is"""
+        index = hash(key) & self._mask
+        shard = self._shards[index]
+        bucket = shard.get(key)
+        rate, burst = limit
+        if bucket is None:
+            if len(shard) >= self._thresholds[index]:
+                self._expire(index, now)
+            tokens = burst - 1.0
+            shard[key] = [tokens, now, now + 1.0 / rate]
+            return 0.0
+        tokens = bucket[0] + (now - bucket[1]) * rate
+        if tokens > burst:
+            tokens = burst
+        bucket[1] = now
+        if tokens >= 1.0:
+            tokens -= 1.0
+            bucket[0] = tokens
+            bucket[2] = now + (burst - tokens) / rate
+            return 0.0
+        bucket[0] = tokens
+        return (1.0 - tokens) / rate
+
+    def refund(self, key: tuple, limit: Limit) -> None:
+        """Give back the token take() just took, when a later check rejects the request anyway"""
+        bucket = self._shards[hash(key) & self._mask].get(key)
+        if bucket is not None:
+            rate, burst = limit
+            bucket[0] = min(float(burst), bucket[0] + 1.0)
+            bucket[2] = bucket[1] + (burst - bucket[0]) / rate
+
+    def _expire(self, index: int, now: float) -> None:
+        shard = self._shards[index]
+        for key in [key for key, bucket in shard.items() if bucket[2] <= now]:
+            del shard[key]
+        # If most buckets are still active, let the shard grow before sweeping again
+        self._thresholds[index] = max(self.max_per_shard, 2 * len(shard))
+
+    def clear(self) -> None:
+        for shard in self._shards:
+            shard.clear()
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+
+class RateLimiter:
+    """Decides per request whether the caller still has budget for its route class.
+
+    Requests naming a user (X-Telegram-User-Id) are charged to that user's
+    bucket and to their IP's bucket. Anonymous requests are charged to the IP
+    bucket only. The IP limit is `ip_factor` times the user limit. A request is
+    charged to both buckets or to neither.
+
+    With `trust_forwarded`, the client IP is read from X-Forwarded-For,
+    counting `trusted_hops` entries from the right. Each proxy appends the
+    address it saw, so entries further left are whatever the client sent.
+
+    The user header is not authenticated, so any caller can spend another
+    user's budget by sending their id. Only the IP bucket holds against a
+    hostile client, and only if the client address is the real one.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Limit]] = None,
+        ip_factor: float = 4.0,
+        trust_forwarded: bool = False,
+        trusted_hops: int = 1,
+        enabled: bool = True,
+        buckets: Optional[TokenBuckets] = None,
+    ):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.ip_limits = {name: Limit(limit.rate * ip_factor, int(limit.burst * ip_factor)) for name, limit in self.limits.items()}
+        self.trust_forwarded = trust_forwarded
+        if trusted_hops < 1:
+            raise ValueError("trusted_hops must be at least 1")
+        self.trusted_hops = trusted_hops
+        self.enabled = enabled
+        self.buckets = buckets or TokenBuckets()
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        """Off unless RATE_LIMIT_ENABLED=1.
+
+        Behind a proxy every request carries the proxy's address. Unless
+        RATE_LIMIT_TRUST_PROXY=1 makes the limiter read X-Forwarded-For, all
+        clients would share one IP bucket. RATE_LIMIT_TRUSTED_HOPS is the
+        number of proxies in front of the app (default 1).
+        """
+        limits = {
+            name: Limit.parse(os.environ[f"RATE_LIMIT_{name.upper()}"])
+            for name in DEFAULT_LIMITS
+            if os.getenv(f"RATE_LIMIT_{name.upper()}")
+        }
+        return cls(
+            limits,
+            ip_factor=float(os.getenv("RATE_LIMIT_IP_FACTOR", 4)),
+            trust_forwarded=os.getenv("RATE_LIMIT_TRUST_PROXY", "0") == "1",
+            trusted_hops=int(os.getenv("RATE_LIMIT_TRUSTED_HOPS", 1)),
+            enabled=os.getenv("RATE_LIMIT_ENABLED", "0") == "1",
+        )
+
+    def client_ip(self, scope) -> str:
+        """The caller's address, read the same way `check` reads it"""
+        forwarded: List[bytes] = []
+        if self.trust_forwarded:
+            for name, value in scope["headers"]:
+                if name == b"x-forwarded-for":
+                    forwarded.extend(value.split(b","))
+        return self._pick_ip(forwarded, scope)
+
+    def _pick_ip(self, forwarded: List[bytes], scope) -> str:
+        if len(forwarded) >= self.trusted_hops:
+            return forwarded[-self.trusted_hops].strip().decode("latin-1")
+        # Fewer entries than proxies: the request did not come through all of them
+        client = scope.get("client")
+        return client[0] if client else ""
+
+    def check(self, scope) -> float:
+        """0 to admit the request, otherwise the seconds the caller should wait"""
+        method, path = scope["method"], scope["path"]
+        if path in EXEMPT_PATHS or method == "OPTIONS":
+            return 0.0
+        route_class = ROUTE_CLASSES.get((method, path))
+        if route_class is None:
+            route_class = "read" if method in ("GET", "HEAD") else "write"
+
+        user = None
+        forwarded: List[bytes] = []
+        for name, value in scope["headers"]:
+            if name == USER_HEADER:
+                user = value
+            elif name == b"x-forwarded-for" and self.trust_forwarded:
+                # Repeated headers read as one comma-separated list, in order
+                forwarded.extend(value.split(b","))
+        ip = self._pick_ip(forwarded, scope)
+
+        now = time.monotonic()
+        # User ids stay bytes and IPs str, so the two kinds of key never collide
+        user_key = (route_class, user)
+        if user is not None:
+            wait = self.buckets.take(user_key, self.limits[route_class], now)
+            if wait:
+                return wait
+        wait = self.buckets.take((route_class, ip), self.ip_limits[route_class], now)
+        if wait and user is not None:
+            self.buckets.refund(user_key, self.limits[route_class])
+        return wait
+
+
+class RateLimitMiddleware:
+    """Answers 429 with Retry-After when the caller is over its rate limit"""
+
+    def __init__(self, app, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and self.limiter.enabled:
+            wait = self.limiter.check(scope)
+            if wait:
+                await send({
+                    "type": "http.response.start",
+                    "status": 429,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"retry-after", str(math.ceil(wait)).encode()),
+                    ],
+                })
+                await send({"type": "http.response.body", "body": b'{"detail":"Rate limit exceeded"}'})
+                return
+        await self.app(scope, receive, send)
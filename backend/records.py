@@ -0,0 +1,167 @@
+"""
+AdBounty Backend - Compact in-memory record types
+Slotted records replace per-entity dicts in MemoryStorage and are handed out as read-only mappings
+"""
+
+import sys
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Tuple
+
+from serialization import dumps
+
+BOUNTY_STATUSES = ("pending", "posted", "confirmed", "completed", "cancelled", "expired")
+BID_STATUSES = ("pending", "accepted", "rejected")
+TX_TYPES = ("deposit", "payout", "refund")
+TX_STATUSES = ("pending", "success", "failed")
+
+
+def _restore(cls, values):
+    record = cls.__new__(cls)
+    # Fields added since the record was pickled start out as None
+    values = tuple(values) + (None,) * (len(cls.__slots__) - len(values))
+    for name, value in zip(cls.__slots__, values):
+        setattr(record, name, value)
+    return record
+
+
+class Record(Mapping):
+    """Base for slotted records.
+
+    Subclasses list their fields in __slots__ (in API order). Fields named in
+    _ENUMS are stored as small ints indexing the given tuple of values, fields
+    in _ARRAYS as array('q'), and fields in _INTERNED as interned strings so
+    repeated values such as niches share one object.
+
+    Reading a record like a dict (record["status"]) returns the API value, so
+    storage callers can treat records and the SQL backend's dicts alike.
+    """
+
+    __slots__ = ()
+    _ENUMS: Dict[str, Tuple[str, ...]] = {}
+    _ARRAYS: Tuple[str, ...] = ()
+    _INTERNED: Tuple[str, ...] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._CODES = {field: {value: code for code, value in enumerate(values)} for field, values in cls._ENUMS.items()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Record":
+        record = cls.__new__(cls)
+        codes = cls._CODES
+        for name in cls.__slots__:
+            value = data.get(name)
+            if name in codes:
+                try:
+                    value = codes[name][value]
+                except KeyError:
+                    raise ValueError(f"Invalid {name}: {value!r}") from None
+            elif name in cls._ARRAYS:
+                value = array("q", value or ())
+            elif name in cls._INTERNED and value is not None:
+                value = sys.intern(value)
+            setattr(record, name, value)
+        return record
+
+    def to_dict(self) -> dict:
+        data = {}
+        enums = self._ENUMS
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if name in enums:
+                value = enums[name][value]
+            elif name in self._ARRAYS:
+                value = value.tolist()
+            data[name] = value
+        return data
+
+    def __getitem__(self, name: str):
+        if name not in self.__slots__:
+            raise KeyError(name)
+        value = getattr(self, name)
+        if name in self._ENUMS:
+            return self._ENUMS[name][value]
+        if name in self._ARRAYS:
+            return value.tolist()
+        return value
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def encoded(self) -> bytes:
+        """This record as JSON bytes"""
+        return dumps(self.to_dict())
+
+    def set_enum(self, name: str, value: str) -> None:
+        try:
+            setattr(self, name, self._CODES[name][value])
+        except KeyError:
+            raise ValueError(f"Invalid {name}: {value!r}") from None
+
+    def __reduce__(self):
+        # Pickle as a flat tuple: smaller snapshots and faster restores than slot dicts
+        return _restore, (type(self), tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class CachedRecord(Record):
+    """A record that keeps its JSON encoding after the first read.
+
+    Used for entities that are read far more often than they change; the cache
+    is dropped on mutation and is never pickled into snapshots. Bulk history
+    (transactions, bids) is not cached so memory stays proportional to the data.
+    """
+
+    __slots__ = ("_encoded",)
+
+    def encoded(self) -> bytes:
+        try:
+            return self._encoded
+        except AttributeError:
+            self._encoded = encoded = dumps(self.to_dict())
+            return encoded
+
+    def set_enum(self, name: str, value: str) -> None:
+        super().set_enum(name, value)
+        try:
+            del self._encoded
+        except AttributeError:
+            pass
+
+
+class UserRecord(CachedRecord):
+    __slots__ = ("telegram_id", "username", "wallet_address", "created_at")
+
+
+class ChannelRecord(CachedRecord):
+    __slots__ = ("channel_id", "channel_name", "subscribers", "niche", "verified", "owner_id", "created_at")
+    _INTERNED = ("niche",)
+
+
+class BountyRecord(CachedRecord):
+    __slots__ = (
+        "bounty_id", "advertiser_id", "ton_amount", "ad_text", "ad_link", "target_channels",
+        "status", "escrow_address", "created_at", "deadline",
+    )
+    _ENUMS = {"status": BOUNTY_STATUSES}
+    _ARRAYS = ("target_channels",)
+
+
+class BidRecord(Record):
+    __slots__ = ("bid_id", "bounty_id", "channel_owner_id", "channel_id", "status", "created_at")
+    _ENUMS = {"status": BID_STATUSES}
+
+
+class TransactionRecord(Record):
+    __slots__ = (
+        "tx_id", "from_user", "to_user", "amount", "tx_type", "status", "bounty_id", "tx_hash", "created_at",
+        "channel_id",
+    )
+    _ENUMS = {"tx_type": TX_TYPES, "status": TX_STATUSES}
+    _INTERNED = ("bounty_id",)
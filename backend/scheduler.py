@@ -0,0 +1,104 @@
+"""
+AdBounty Backend - Bounty deadline expiry
+An in-process min-heap of deadlines; due bounties are expired and refunded in batches
+"""
+
+import asyncio
+import heapq
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiryScheduler:
+    """Expires pending bounties at their deadline and refunds their escrow.
+
+    Deadlines sit in a min-heap, so finding what is due never touches the store.
+    The loop sleeps until the earliest deadline (woken early when an earlier one
+    is scheduled), then hands due bounty ids to Storage.expire_bounties in
+    batches of `batch_size`, yielding to the event loop between batches.
+    Entries for bounties that were confirmed or cancelled in the meantime are
+    skipped by the store's status check, so they are never removed from the heap.
+    """
+
+    def __init__(self, store: Storage, batch_size: int = 200, max_sleep: float = 60.0, retry_delay: float = 5.0):
+        self.store = store
+        self.batch_size = batch_size
+        self.max_sleep = max_sleep
+        self.retry_delay = retry_delay
+        self._heap: List[Tuple[datetime, str]] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Load the pending deadlines from the store and start the expiry loop"""
+        self._heap = [entry async for entry in self.store.iter_pending_deadlines()]
+        heapq.heapify(self._heap)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info("Expiry scheduler started with %s pending deadlines", len(self._heap))
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def schedule(self, bounty_id: str, deadline: Optional[datetime]) -> None:
+        if deadline is None:
+            return
+        heapq.heappush(self._heap, (deadline, bounty_id))
+        if self._heap[0][1] == bounty_id:
+            self._wakeup.set()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    async def expire_due(self, now: Optional[datetime] = None) -> int:
+        """Expire one batch of bounties due at `now`; returns the number refunded"""
+        now = now or datetime.utcnow()
+        heap = self._heap
+        batch = []
+        while heap and heap[0][0] <= now and len(batch) < self.batch_size:
+            batch.append(heapq.heappop(heap))
+        if not batch:
+            return 0
+        try:
+            refunds = await self.store.expire_bounties([bounty_id for _, bounty_id in batch], now)
+        except Exception:
+            for entry in batch:
+                heapq.heappush(heap, entry)
+            raise
+        return len(refunds)
+
+    async def _run(self) -> None:
+        while True:
+            now = datetime.utcnow()
+            if self._heap and self._heap[0][0] <= now:
+                try:
+                    refunded = await self.expire_due(now)
+                except Exception as e:
+                    logger.error("Bounty expiry error: %s", e)
+                    await asyncio.sleep(self.retry_delay)
+                    continue
+                if refunded:
+                    logger.info("Expired %s bounties", refunded)
+                # Let requests run between batches
+                await asyncio.sleep(0)
+                continue
+
+            timeout = self.max_sleep
+            if self._heap:
+                timeout = min(timeout, (self._heap[0][0] - now).total_seconds())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,71 @@
+"""
+AdBounty Backend - Response serialization
+Encode each response once, straight to bytes: orjson when installed, the stdlib json module otherwise
+"""
+
+import json
+from array import array
+from datetime import date, datetime
+from typing import Any
+
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only where orjson is missing
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, array):
+        return value.tolist()
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+if orjson is not None:
+    def dumps(value: Any) -> bytes:
+        """Encode a JSON document to UTF-8 bytes"""
+        # NON_STR_KEYS admits str subclasses such as the column names of SQL rows
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    _encoder = json.JSONEncoder(default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+
+    def dumps(value: Any) -> bytes:
+        """Encode a JSON document to UTF-8 bytes"""
+        return _encoder.encode(value).encode()
+
+
+def _encode_value(value: Any) -> bytes:
+    # Records carry their own (possibly cached) encoding; splice it in rather than re-encode
+    encoded = getattr(value, "encoded", None)
+    if encoded is not None:
+        return encoded()
+    if isinstance(value, list) and value and hasattr(value[0], "encoded"):
+        return b"[" + b",".join(_encode_value(item) for item in value) + b"]"
+    return dumps(value)
+
+
+def encode(body: dict) -> bytes:
+    """Encode a response envelope such as {"status": ..., "bounty": record}.
+
+    Top-level values, and the items of top-level lists, that are records are
+    written from their `encoded()` bytes; everything else goes through dumps().
+    """
+    return b"{" + b",".join(dumps(key) + b":" + _encode_value(value) for key, value in body.items()) + b"}"
+
+
+class FastJSONResponse(Response):
+    """JSON response rendered by encode(); handlers return it to skip FastAPI's jsonable_encoder pass"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        if isinstance(content, dict):
+            return encode(content)
+        return dumps(content)
@@ -0,0 +1,554 @@
+"""
+AdBounty Backend - Async SQLAlchemy storage backend
+Supports PostgreSQL (asyncpg) and SQLite (aiosqlite); the schema lives in models.py
+"""
+
+import os
+from datetime import date, datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, bindparam, event, func, or_, select, union_all, update
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+
+from analytics import UNKNOWN_NICHE, is_spend, spend_entries, stats_from_entries
+from ledger import BALANCE_FIELDS, balance_deltas, balance_of
+from models import (
+    BalanceRow, Base, BidRow, BountyRow, BountyTargetRow, ChannelRow, SpendRollupRow, TransactionRow, UserRow,
+)
+from storage import StatusConflict, Storage, refund_transaction
+from versions import CHANNELS, VersionCounters
+
+DEFAULT_DATABASE_URL = "sqlite+aiosqlite:///./adbounty.db"
+
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+users = UserRow.__table__
+channels = ChannelRow.__table__
+bounties = BountyRow.__table__
+bounty_targets = BountyTargetRow.__table__
+bids = BidRow.__table__
+transactions = TransactionRow.__table__
+balances = BalanceRow.__table__
+spend_rollups = SpendRollupRow.__table__
+# spend_rollups.channel_id for payouts without a channel
+NO_CHANNEL = 0
+
+TABLES = {
+    "users": users,
+    "channels": channels,
+    "bounties": bounties,
+    "bids": bids,
+    "transactions": transactions,
+}
+
+# Statements are built once so SQLAlchemy's compiled cache and the driver's
+# prepared statement cache both see the same objects on every request.
+_GET_USER = select(users).where(users.c.telegram_id == bindparam("telegram_id"))
+_GET_CHANNEL = select(channels).where(channels.c.channel_id == bindparam("channel_id"))
+_GET_BALANCE = select(*(balances.c[field] for field in BALANCE_FIELDS)).where(
+    balances.c.user_id == bindparam("user_id")
+)
+_CHANNEL_NICHES = select(channels.c.channel_id, channels.c.niche).where(
+    channels.c.channel_id.in_(bindparam("channel_ids", expanding=True))
+)
+_ADVERTISER_SPEND = select(
+    spend_rollups.c.day, spend_rollups.c.channel_id, spend_rollups.c.niche, spend_rollups.c.spent, spend_rollups.c.payouts
+).where(
+    spend_rollups.c.advertiser_id == bindparam("advertiser_id"),
+    spend_rollups.c.day >= bindparam("since"),
+    spend_rollups.c.day <= bindparam("until"),
+)
+_GET_BOUNTY = select(bounties).where(bounties.c.bounty_id == bindparam("bounty_id"))
+_SET_BOUNTY_STATUS = (
+    update(bounties).where(bounties.c.bounty_id == bindparam("b_id")).values(status=bindparam("status"))
+)
+# Compare-and-set: the row only changes if nobody moved it out of the expected status first
+_SWAP_BOUNTY_STATUS = _SET_BOUNTY_STATUS.where(bounties.c.status == bindparam("expected"))
+
+_VERIFIED_ORDER = {
+    "subscribers": (channels.c.subscribers.desc(), channels.c.channel_id),
+    "created_at": (channels.c.created_at, channels.c.channel_id),
+}
+# Keyset predicates matching indexes.channel_sort_key: rows strictly after the cursor key
+_VERIFIED_AFTER = {
+    "subscribers": or_(
+        channels.c.subscribers < -bindparam("after_0"),
+        and_(channels.c.subscribers == -bindparam("after_0"), channels.c.channel_id > bindparam("after_1")),
+    ),
+    "created_at": or_(
+        channels.c.created_at > bindparam("after_0"),
+        and_(channels.c.created_at == bindparam("after_0"), channels.c.channel_id > bindparam("after_1")),
+    ),
+}
+_VERIFIED_NICHE = channels.c.niche == bindparam("niche")
+_VERIFIED = {
+    (sort_by, with_niche, with_after): select(channels)
+    .where(
+        channels.c.verified.is_(True),
+        *([_VERIFIED_NICHE] if with_niche else []),
+        *([_VERIFIED_AFTER[sort_by]] if with_after else []),
+    )
+    .order_by(*order)
+    for sort_by, order in _VERIFIED_ORDER.items()
+    for with_niche in (False, True)
+    for with_after in (False, True)
+}
+_COUNT_VERIFIED = {
+    with_niche: select(func.count())
+    .select_from(channels)
+    .where(channels.c.verified.is_(True), *([_VERIFIED_NICHE] if with_niche else []))
+    for with_niche in (False, True)
+}
+
+
+# Open bounties on a channel: pending and before their deadline, reached through bounty_targets
+_OPEN_ON_CHANNEL = (
+    bounty_targets.c.channel_id == bindparam("channel_id"),
+    bounties.c.status == "pending",
+    or_(bounties.c.deadline.is_(None), bounties.c.deadline > bindparam("now")),
+)
+_PENDING_DEADLINES = select(bounties.c.deadline, bounties.c.bounty_id).where(
+    bounties.c.status == "pending", bounties.c.deadline.is_not(None)
+)
+# The status check makes expiry a compare-and-set, so several workers' schedulers
+# may race on the same bounty and only one refund is ever written
+_EXPIRE = (
+    update(bounties)
+    .where(
+        bounties.c.bounty_id.in_(bindparam("bounty_ids", expanding=True)),
+        bounties.c.status == "pending",
+        bounties.c.deadline <= bindparam("now"),
+    )
+    .values(status="expired")
+    .returning(bounties.c.bounty_id, bounties.c.advertiser_id, bounties.c.ton_amount)
+)
+_CHANNEL_BOUNTIES = {
+    with_after: select(bounties)
+    .join(bounty_targets, bounty_targets.c.bounty_id == bounties.c.bounty_id)
+    .where(*_OPEN_ON_CHANNEL, *([bounties.c.bounty_id > bindparam("after")] if with_after else []))
+    .order_by(bounties.c.bounty_id)
+    for with_after in (False, True)
+}
+_COUNT_CHANNEL_BOUNTIES = (
+    select(func.count())
+    .select_from(bounty_targets.join(bounties, bounty_targets.c.bounty_id == bounties.c.bounty_id))
+    .where(*_OPEN_ON_CHANNEL)
+)
+
+
+def _user_transactions(with_after: bool):
+    """Both sides of a user's history, each served by its (user, tx_id) index.
+
+    OR across two columns defeats both indexes, so the two sides are unioned instead.
+    """
+    after = [transactions.c.tx_id > bindparam("after")] if with_after else []
+    sent = select(transactions).where(transactions.c.from_user == bindparam("user_id"), *after)
+    received = select(transactions).where(
+        transactions.c.to_user == bindparam("user_id"), transactions.c.from_user != bindparam("user_id"), *after
+    )
+    history = union_all(sent, received).subquery()
+    return select(history).order_by(history.c.tx_id)
+
+
+_USER_TRANSACTIONS = {with_after: _user_transactions(with_after) for with_after in (False, True)}
+_COUNT_USER_TRANSACTIONS = select(func.count()).select_from(
+    union_all(
+        select(transactions.c.tx_id).where(transactions.c.from_user == bindparam("user_id")),
+        select(transactions.c.tx_id).where(
+            transactions.c.to_user == bindparam("user_id"), transactions.c.from_user != bindparam("user_id")
+        ),
+    ).subquery()
+)
+
+_COUNT = {name: select(func.count()).select_from(table) for name, table in TABLES.items()}
+
+
+def database_url(url: Optional[str] = None) -> str:
+    """Resolve DATABASE_URL and swap sync driver names for their async counterparts"""
+    url = url or os.getenv("DATABASE_URL") or DEFAULT_DATABASE_URL
+    scheme, sep, rest = url.partition("://")
+    return _ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+class SQLStorage(Storage):
+    """Storage backed by an async SQLAlchemy engine with a tuned connection pool"""
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        *,
+        pool_size: int = 10,
+        max_overflow: int = 20,
+        pool_timeout: float = 30.0,
+        pool_recycle: int = 1800,
+        statement_cache_size: int = 500,
+        sqlite_mmap_size: int = 256 * 1024 * 1024,
+        sqlite_busy_timeout_ms: int = 5000,
+        echo: bool = False,
+        track_versions: bool = True,
+    ):
+        self.url = database_url(url)
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_timeout = pool_timeout
+        self.pool_recycle = pool_recycle
+        self.statement_cache_size = statement_cache_size
+        self.sqlite_mmap_size = sqlite_mmap_size
+        self.sqlite_busy_timeout_ms = sqlite_busy_timeout_ms
+        self.echo = echo
+        self._engine: Optional[AsyncEngine] = None
+        self._upserts: Dict[str, object] = {}
+        # Counters only see this process's writes; off when several workers share the database
+        self.versions = VersionCounters() if track_versions else None
+
+    @classmethod
+    def from_env(cls) -> "SQLStorage":
+        return cls(
+            os.getenv("DATABASE_URL"),
+            pool_size=int(os.getenv("DB_POOL_SIZE", 10)),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 20)),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", 30)),
+            pool_recycle=int(os.getenv("DB_POOL_RECYCLE", 1800)),
+            statement_cache_size=int(os.getenv("DB_STATEMENT_CACHE_SIZE", 500)),
+            sqlite_mmap_size=int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+            sqlite_busy_timeout_ms=int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+            echo=os.getenv("DB_ECHO", "").lower() in ("1", "true"),
+            track_versions=int(os.getenv("WEB_CONCURRENCY", 1)) <= 1,
+        )
+
+    @property
+    def dialect(self) -> str:
+        return self.url.split("+", 1)[0].split(":", 1)[0]
+
+    def _engine_options(self) -> dict:
+        options: dict = {"echo": self.echo, "query_cache_size": self.statement_cache_size}
+        if self.dialect == "sqlite":
+            if not self.is_sqlite_file:
+                # A private in-memory database only exists on a single connection
+                options["poolclass"] = StaticPool
+            else:
+                # aiosqlite defaults to NullPool, which reopens the file on every checkout
+                options.update(
+                    poolclass=AsyncAdaptedQueuePool, pool_size=self.pool_size, max_overflow=self.max_overflow
+                )
+            return options
+
+        options.update(
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+            pool_timeout=self.pool_timeout,
+            pool_recycle=self.pool_recycle,
+            pool_pre_ping=True,
+        )
+        if self.url.startswith("postgresql+asyncpg"):
+            options["connect_args"] = {"prepared_statement_cache_size": self.statement_cache_size}
+        return options
+
+    @property
+    def is_sqlite_file(self) -> bool:
+        return self.dialect == "sqlite" and ":memory:" not in self.url and not self.url.endswith("://")
+
+    def _sqlite_pragmas(self) -> List[str]:
+        """Per-connection settings that let several worker processes share one SQLite file.
+
+        WAL lets readers run alongside the single writer, busy_timeout makes
+        writers queue instead of failing with SQLITE_BUSY, and mmap serves reads
+        straight from the shared page cache.
+        """
+        pragmas = [f"PRAGMA busy_timeout={self.sqlite_busy_timeout_ms}", "PRAGMA foreign_keys=ON"]
+        if self.is_sqlite_file:
+            pragmas += [
+                "PRAGMA journal_mode=WAL",
+                "PRAGMA synchronous=NORMAL",
+                f"PRAGMA mmap_size={self.sqlite_mmap_size}",
+            ]
+        return pragmas
+
+    @property
+    def engine(self) -> AsyncEngine:
+        if self._engine is None:
+            self._engine = create_async_engine(self.url, **self._engine_options())
+            if self.dialect == "sqlite":
+                pragmas = self._sqlite_pragmas()
+
+                @event.listens_for(self._engine.sync_engine, "connect")
+                def _configure_sqlite(dbapi_connection, connection_record):
+                    cursor = dbapi_connection.cursor()
+                    for pragma in pragmas:
+                        cursor.execute(pragma)
+                    cursor.close()
+        return self._engine
+
+    async def open(self) -> None:
+        self.engine
+
+    async def close(self) -> None:
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
+
+    async def create_schema(self) -> None:
+        """Create all tables directly; deployments should run `alembic upgrade head` instead"""
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    def _upsert(self, table, key, accumulate: bool = False):
+        """INSERT ... ON CONFLICT DO UPDATE for the engine's dialect, built once per table.
+
+        With `accumulate` the conflicting row's columns are incremented by the new values
+        instead of replaced, in one statement so concurrent writers cannot lose updates.
+        `key` is a column name, or a sequence of them for a composite key.
+        """
+        stmt = self._upserts.get(table.name)
+        if stmt is None:
+            if self.dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(table)
+            keys = [key] if isinstance(key, str) else list(key)
+            columns = [col for col in table.c if col.name not in keys]
+            if accumulate:
+                set_ = {col.name: col + stmt.excluded[col.name] for col in columns}
+            else:
+                set_ = {col.name: stmt.excluded[col.name] for col in columns}
+            stmt = self._upserts[table.name] = stmt.on_conflict_do_update(index_elements=keys, set_=set_)
+        return stmt
+
+    async def _fetch_one(self, stmt, params: dict) -> Optional[dict]:
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(stmt, params)).first()
+        return dict(row._mapping) if row is not None else None
+
+    async def _insert(self, table, values: dict) -> None:
+        async with self.engine.begin() as conn:
+            await conn.execute(table.insert(), values)
+
+    async def _record_transactions(self, conn, transaction_list: Sequence[dict]) -> None:
+        """Insert transactions and apply them to the balances ledger on the caller's connection"""
+        await conn.execute(transactions.insert(), transaction_list)
+        deltas = [balance_of(user_id, delta) for user_id, delta in balance_deltas(transaction_list).items()]
+        if deltas:
+            await conn.execute(self._upsert(balances, "user_id", accumulate=True), deltas)
+        spend = [tx for tx in transaction_list if is_spend(tx)]
+        if spend:
+            channel_ids = list({tx.get("channel_id") for tx in spend} - {None})
+            niches = dict((await conn.execute(_CHANNEL_NICHES, {"channel_ids": channel_ids})).all()) if channel_ids else {}
+            rollups = [
+                {
+                    "advertiser_id": advertiser_id,
+                    "day": date.fromordinal(day),
+                    "channel_id": NO_CHANNEL if channel_id is None else channel_id,
+                    "niche": niche,
+                    "spent": spent,
+                    "payouts": payouts,
+                }
+                for (advertiser_id, day, channel_id, niche), (spent, payouts)
+                in spend_entries(spend, lambda channel_id: niches.get(channel_id, UNKNOWN_NICHE)).items()
+            ]
+            await conn.execute(
+                self._upsert(spend_rollups, ("advertiser_id", "day", "channel_id", "niche"), accumulate=True), rollups
+            )
+
+    # Users
+
+    async def get_user(self, telegram_id: int) -> Optional[dict]:
+        return await self._fetch_one(_GET_USER, {"telegram_id": telegram_id})
+
+    async def add_user(self, user: dict) -> None:
+        await self._insert(users, user)
+
+    # Channels
+
+    async def get_channel(self, channel_id: int) -> Optional[dict]:
+        return await self._fetch_one(_GET_CHANNEL, {"channel_id": channel_id})
+
+    async def put_channel(self, channel: dict) -> None:
+        await self.put_channels([channel])
+
+    async def put_channels(self, channel_list: List[dict]) -> None:
+        if not channel_list:
+            return
+        async with self.engine.begin() as conn:
+            await conn.execute(self._upsert(channels, "channel_id"), channel_list)
+        if self.versions is not None:
+            self.versions.bump(CHANNELS)
+
+    async def list_verified_channels(
+        self,
+        sort_by: str = "created_at",
+        niche: Optional[str] = None,
+        limit: Optional[int] = None,
+        after: Optional[tuple] = None,
+    ) -> Tuple[List[dict], int]:
+        stmt = _VERIFIED[(sort_by, niche is not None, after is not None)]
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        params: Dict[str, object] = {} if niche is None else {"niche": niche}
+        if after is not None:
+            params["after_0"], params["after_1"] = after
+        async with self.engine.connect() as conn:
+            page = [dict(row._mapping) for row in await conn.execute(stmt, params)]
+            total = (await conn.execute(_COUNT_VERIFIED[niche is not None], params)).scalar_one()
+        return page, total
+
+    async def search_channels(
+        self,
+        niches: Optional[List[str]] = None,
+        min_subscribers: Optional[int] = None,
+        max_subscribers: Optional[int] = None,
+        verified: Optional[bool] = None,
+        limit: Optional[int] = None,
+        after: Optional[tuple] = None,
+    ) -> Tuple[List[dict], int]:
+        # Facets vary per request, so the WHERE clause is assembled here; the compiled
+        # cache still keys on its shape, not on the values
+        where = []
+        if niches:
+            where.append(channels.c.niche.in_(niches))
+        if min_subscribers is not None:
+            where.append(channels.c.subscribers >= min_subscribers)
+        if max_subscribers is not None:
+            where.append(channels.c.subscribers <= max_subscribers)
+        if verified is not None:
+            where.append(channels.c.verified.is_(verified))
+        stmt = select(channels).where(*where)
+        if after is not None:
+            stmt = stmt.where(_VERIFIED_AFTER["subscribers"])
+        stmt = stmt.order_by(*_VERIFIED_ORDER["subscribers"])
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        params: Dict[str, object] = {}
+        if after is not None:
+            params["after_0"], params["after_1"] = after
+        async with self.engine.connect() as conn:
+            page = [dict(row._mapping) for row in await conn.execute(stmt, params)]
+            total = (await conn.execute(select(func.count()).select_from(channels).where(*where))).scalar_one()
+        return page, total
+
+    # Bounties and bids
+
+    async def add_bounty(self, bounty: dict, transaction: Optional[dict] = None) -> None:
+        await self.add_bounties([bounty], [transaction] if transaction is not None else ())
+
+    async def add_bounties(self, bounty_list: List[dict], transaction_list: Sequence[dict] = ()) -> None:
+        if not bounty_list:
+            return
+        targets = [
+            {"channel_id": channel_id, "bounty_id": bounty["bounty_id"]}
+            for bounty in bounty_list
+            for channel_id in dict.fromkeys(bounty.get("target_channels") or ())
+        ]
+        async with self.engine.begin() as conn:
+            await conn.execute(bounties.insert(), bounty_list)
+            if targets:
+                await conn.execute(bounty_targets.insert(), targets)
+            if transaction_list:
+                await self._record_transactions(conn, transaction_list)
+        if self.versions is not None:
+            self.versions.bump_many(("bounty", bounty["bounty_id"]) for bounty in bounty_list)
+
+    async def get_bounty(self, bounty_id: str) -> Optional[dict]:
+        return await self._fetch_one(_GET_BOUNTY, {"bounty_id": bounty_id})
+
+    async def set_bounty_status(
+        self, bounty_id: str, status: str, transaction: Optional[dict] = None, expected: Optional[str] = None
+    ) -> Optional[dict]:
+        async with self.engine.begin() as conn:
+            if expected is None:
+                result = await conn.execute(_SET_BOUNTY_STATUS, {"b_id": bounty_id, "status": status})
+            else:
+                result = await conn.execute(
+                    _SWAP_BOUNTY_STATUS, {"b_id": bounty_id, "status": status, "expected": expected}
+                )
+            if result.rowcount == 0:
+                row = (await conn.execute(_GET_BOUNTY, {"bounty_id": bounty_id})).first()
+                if row is None or expected is None:
+                    return None
+                raise StatusConflict(bounty_id, expected, row.status)
+            if transaction is not None:
+                await self._record_transactions(conn, [transaction])
+            row = (await conn.execute(_GET_BOUNTY, {"bounty_id": bounty_id})).first()
+        if self.versions is not None:
+            self.versions.bump(("bounty", bounty_id))
+        return dict(row._mapping)
+
+    async def list_channel_bounties(
+        self, channel_id: int, limit: Optional[int] = None, after: Optional[str] = None
+    ) -> Tuple[List[dict], int]:
+        stmt = _CHANNEL_BOUNTIES[after is not None]
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        params = {"channel_id": channel_id, "now": datetime.utcnow(), "after": after}
+        async with self.engine.connect() as conn:
+            page = [dict(row._mapping) for row in await conn.execute(stmt, params)]
+            total = (await conn.execute(_COUNT_CHANNEL_BOUNTIES, params)).scalar_one()
+        return page, total
+
+    async def expire_bounties(self, bounty_ids: Iterable[str], now: datetime) -> List[dict]:
+        bounty_ids = list(bounty_ids)
+        if not bounty_ids:
+            return []
+        async with self.engine.begin() as conn:
+            expired = await conn.execute(_EXPIRE, {"bounty_ids": bounty_ids, "now": now})
+            refunds = [refund_transaction(row._mapping, now) for row in expired]
+            if refunds:
+                await self._record_transactions(conn, refunds)
+        if self.versions is not None:
+            self.versions.bump_many(("bounty", refund["bounty_id"]) for refund in refunds)
+        return refunds
+
+    async def iter_pending_deadlines(self) -> AsyncIterator[Tuple[datetime, str]]:
+        async with self.engine.connect() as conn:
+            result = await conn.stream(_PENDING_DEADLINES)
+            async for deadline, bounty_id in result:
+                yield deadline, bounty_id
+
+    async def add_bid(self, bid: dict) -> None:
+        await self._insert(bids, bid)
+
+    # Transactions
+
+    async def add_transaction(self, transaction: dict) -> None:
+        async with self.engine.begin() as conn:
+            await self._record_transactions(conn, [transaction])
+
+    async def list_user_transactions(
+        self, user_id: int, limit: Optional[int] = None, after: Optional[str] = None
+    ) -> Tuple[List[dict], int]:
+        stmt = _USER_TRANSACTIONS[after is not None]
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        params = {"user_id": user_id, "after": after}
+        async with self.engine.connect() as conn:
+            page = [dict(row._mapping) for row in await conn.execute(stmt, params)]
+            total = (await conn.execute(_COUNT_USER_TRANSACTIONS, params)).scalar_one()
+        return page, total
+
+    async def get_advertiser_stats(
+        self, advertiser_id: int, since: Optional[date] = None, until: Optional[date] = None
+    ) -> dict:
+        params = {"advertiser_id": advertiser_id, "since": since or date.min, "until": until or date.max}
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(_ADVERTISER_SPEND, params)).all()
+        return stats_from_entries(advertiser_id, (
+            (day.toordinal(), None if channel_id == NO_CHANNEL else channel_id, niche, spent, payouts)
+            for day, channel_id, niche, spent, payouts in rows
+        ))
+
+    async def get_balance(self, user_id: int) -> dict:
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(_GET_BALANCE, {"user_id": user_id})).first()
+        return balance_of(user_id, row if row is not None else (0, 0, 0, 0))
+
+    # Introspection
+
+    async def count(self, table: str) -> int:
+        async with self.engine.connect() as conn:
+            return (await conn.execute(_COUNT[table])).scalar_one()
@@ -0,0 +1,526 @@
+"""
+AdBounty Backend - Storage interface
+Handlers depend on Storage; the concrete backend is chosen from the environment
+"""
+
+import os
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from typing import AsyncIterator, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from analytics import UNKNOWN_NICHE, SpendRollups
+from ids import new_id
+from indexes import ChannelSearchIndex, OpenBountyIndex, TransactionIndex, VerifiedChannelIndex
+from journal import Journal
+from ledger import BalanceLedger
+from records import BidRecord, BountyRecord, ChannelRecord, TransactionRecord, UserRecord
+from versions import CHANNELS, VersionCounters
+
+
+def deposit_transaction(bounty: Mapping, now: datetime) -> dict:
+    """The transaction moving a new bounty's budget into its advertiser's escrow"""
+    return {
+        "tx_id": new_id("tx"),
+        "from_user": bounty["advertiser_id"],
+        "to_user": bounty["advertiser_id"],
+        "amount": bounty["ton_amount"],
+        "tx_type": "deposit",
+        "status": "success",
+        "bounty_id": bounty["bounty_id"],
+        "tx_hash": None,
+        "created_at": now,
+        "channel_id": None,
+    }
+
+
+def refund_transaction(bounty: Mapping, now: datetime) -> dict:
+    """The transaction returning an expired bounty's escrow to its advertiser"""
+    return {
+        "tx_id": new_id("tx"),
+        "from_user": bounty["advertiser_id"],
+        "to_user": bounty["advertiser_id"],
+        "amount": bounty["ton_amount"],
+        "tx_type": "refund",
+        "status": "success",
+        "bounty_id": bounty["bounty_id"],
+        "tx_hash": None,
+        "created_at": now,
+        "channel_id": None,
+    }
+
+
+class StatusConflict(Exception):
+    """A compare-and-set status change found the bounty in a different status"""
+
+    def __init__(self, bounty_id: str, expected: str, current: str):
+        super().__init__(f"Bounty {bounty_id} is {current}, expected {expected}")
+        self.bounty_id = bounty_id
+        self.expected = expected
+        self.current = current
+
+
+class Storage(ABC):
+    """Async persistence API used by the endpoint handlers.
+
+    Writers take plain dicts. Readers return read-only mappings: dicts from the
+    SQL backend, records (see records.py) from the memory backend.
+
+    Backends that see every write set `versions`, bumping ("bounty", bounty_id)
+    and CHANNELS on each bounty and channel write, for ETags on polled reads.
+    """
+
+    versions: Optional[VersionCounters] = None
+
+    async def open(self) -> None:
+        """Acquire resources (connection pools, files); called on app startup"""
+
+    async def close(self) -> None:
+        """Release resources; called on app shutdown"""
+
+    # Users
+
+    @abstractmethod
+    async def get_user(self, telegram_id: int) -> Optional[Mapping]:
+        ...
+
+    @abstractmethod
+    async def add_user(self, user: dict) -> None:
+        ...
+
+    # Channels
+
+    @abstractmethod
+    async def get_channel(self, channel_id: int) -> Optional[Mapping]:
+        ...
+
+    @abstractmethod
+    async def put_channel(self, channel: dict) -> None:
+        """Insert or replace a channel"""
+
+    @abstractmethod
+    async def put_channels(self, channels: List[dict]) -> None:
+        """Insert or replace several channels as one unit of work"""
+
+    @abstractmethod
+    async def list_verified_channels(
+        self,
+        sort_by: str = "created_at",
+        niche: Optional[str] = None,
+        limit: Optional[int] = None,
+        after: Optional[tuple] = None,
+    ) -> Tuple[List[Mapping], int]:
+        """Return one slice of verified channels and the total number that match.
+
+        `after` is the channel_sort_key of the last channel on the previous page.
+        """
+
+    @abstractmethod
+    async def search_channels(
+        self,
+        niches: Optional[List[str]] = None,
+        min_subscribers: Optional[int] = None,
+        max_subscribers: Optional[int] = None,
+        verified: Optional[bool] = None,
+        limit: Optional[int] = None,
+        after: Optional[tuple] = None,
+    ) -> Tuple[List[Mapping], int]:
+        """Return channels matching every given facet, most subscribed first, and the total.
+
+        A facet left as None is not filtered on; `niches` matches any of the listed
+        niches. `after` is the "subscribers" channel_sort_key of the last channel served.
+        """
+
+    # Bounties and bids
+
+    @abstractmethod
+    async def add_bounty(self, bounty: dict, transaction: Optional[dict] = None) -> None:
+        """Insert a bounty, recording `transaction` (its escrow deposit) in the same unit of work"""
+
+    @abstractmethod
+    async def add_bounties(self, bounties: List[dict], transactions: Sequence[dict] = ()) -> None:
+        """Insert several bounties and their `transactions` as one unit of work"""
+
+    @abstractmethod
+    async def get_bounty(self, bounty_id: str) -> Optional[Mapping]:
+        ...
+
+    @abstractmethod
+    async def set_bounty_status(
+        self, bounty_id: str, status: str, transaction: Optional[dict] = None, expected: Optional[str] = None
+    ) -> Optional[Mapping]:
+        """Change a bounty's status, recording `transaction` in the same unit of work.
+
+        With `expected`, the change is a compare-and-set: it only happens if the bounty
+        is still in that status, and StatusConflict is raised (with nothing recorded)
+        otherwise. Returns the updated bounty, or None if it does not exist.
+        """
+
+    @abstractmethod
+    async def list_channel_bounties(
+        self, channel_id: int, limit: Optional[int] = None, after: Optional[str] = None
+    ) -> Tuple[List[Mapping], int]:
+        """Return the pending, unexpired bounties targeting a channel in bounty_id (time)
+        order after the `after` id, and how many there are in all"""
+
+    @abstractmethod
+    async def expire_bounties(self, bounty_ids: Iterable[str], now: datetime) -> List[dict]:
+        """Move those of `bounty_ids` that are still pending with a deadline at or before
+        `now` to "expired", recording a refund for each in the same unit of work.
+
+        Returns the refund transactions; bounties that changed status meanwhile are skipped.
+        """
+
+    @abstractmethod
+    def iter_pending_deadlines(self) -> AsyncIterator[Tuple[datetime, str]]:
+        """Yield (deadline, bounty_id) for every pending bounty that has a deadline"""
+
+    @abstractmethod
+    async def add_bid(self, bid: dict) -> None:
+        ...
+
+    # Transactions
+
+    @abstractmethod
+    async def add_transaction(self, transaction: dict) -> None:
+        ...
+
+    @abstractmethod
+    async def list_user_transactions(
+        self, user_id: int, limit: Optional[int] = None, after: Optional[str] = None
+    ) -> Tuple[List[Mapping], int]:
+        """Return the user's sent and received transactions in tx_id (time) order after
+        the `after` id, and the size of their whole history"""
+
+    async def iter_user_transactions(self, user_id: int, chunk_size: int = 500) -> AsyncIterator[Mapping]:
+        """Yield the user's whole history one keyset page at a time, holding one page in memory"""
+        after = None
+        while True:
+            page, _ = await self.list_user_transactions(user_id, chunk_size, after)
+            for transaction in page:
+                yield transaction
+            if len(page) < chunk_size:
+                return
+            after = page[-1]["tx_id"]
+
+    @abstractmethod
+    async def get_advertiser_stats(
+        self, advertiser_id: int, since: Optional[date] = None, until: Optional[date] = None
+    ) -> dict:
+        """The advertiser's payout spend in nanoTON between `since` and `until` (inclusive UTC days),
+        overall and broken down by niche, channel and day, from rollups kept up to date on write"""
+
+    @abstractmethod
+    async def get_balance(self, user_id: int) -> Mapping:
+        """The user's running totals in nanoTON (see ledger.py), kept up to date by every
+        transaction write; all zero for a user with no transactions"""
+
+    # Introspection
+
+    @abstractmethod
+    async def count(self, table: str) -> int:
+        """Number of records in one of: users, channels, bounties, bids, transactions"""
+
+    def memory_structures(self) -> Dict[str, object]:
+        """The process-memory structures this backend keeps, by name, for memory attribution"""
+        return {} if self.versions is None else {"versions": self.versions}
+
+
+class MemoryStorage(Storage):
+    """Process-local stores with secondary indexes; the default, and the test backend.
+
+    Entities are kept as compact slotted records (see records.py), which readers
+    get back as they are; callers must not mutate them.
+    With a Journal attached every mutation is logged before the handler returns,
+    and open() restores the stores from the latest snapshot plus the journal tail.
+    """
+
+    TABLES = ("users", "channels", "bounties", "bids", "transactions")
+    # Indexes are snapshotted with the stores so a restart does not rebuild them record by record
+    INDEXES = ("transactions_by_user", "verified_channels", "channel_search", "open_bounties", "balances", "spend")
+
+    def __init__(self, journal: Optional[Journal] = None):
+        self.users: Dict[int, UserRecord] = {}
+        self.channels: Dict[int, ChannelRecord] = {}
+        self.bounties: Dict[str, BountyRecord] = {}
+        self.bids: Dict[str, BidRecord] = {}
+        self.transactions: Dict[str, TransactionRecord] = {}
+
+        # Secondary indexes, kept in step with the stores above by every writer
+        self.transactions_by_user = TransactionIndex()
+        self.verified_channels = VerifiedChannelIndex()
+        self.channel_search = ChannelSearchIndex()
+        self.open_bounties = OpenBountyIndex()
+        self.balances = BalanceLedger()
+        self.spend = SpendRollups()
+
+        self.versions = VersionCounters()
+        self.journal = journal
+
+    async def open(self) -> None:
+        if self.journal is None:
+            return
+        state, ops = self.journal.recover()
+        self._restore(state, ops)
+        await self.journal.start(replay_journal)
+
+    async def close(self) -> None:
+        if self.journal is not None:
+            await self.journal.close()
+
+    def _dump_state(self) -> dict:
+        return {name: getattr(self, name) for name in self.TABLES + self.INDEXES}
+
+    def _load_state(self, state: dict) -> None:
+        for name in self.TABLES + self.INDEXES:
+            setattr(self, name, state[name])
+
+    def _restore(self, state: Optional[dict], ops: Iterable[tuple]) -> None:
+        if state is not None:
+            self._load_state(state)
+        for op in ops:
+            self._APPLY[op[0]](self, *op[1:])
+
+    async def _log(self, *op) -> None:
+        """Wait for a mutation that was already applied in memory to become durable"""
+        if self.journal is not None:
+            await self.journal.append(op)
+
+    # Mutations are applied through these so live writes and journal replay share one code path
+
+    def _apply_user(self, user: dict) -> None:
+        self.users[user["telegram_id"]] = UserRecord.from_dict(user)
+
+    def _apply_channel(self, channel: dict) -> None:
+        self.channels[channel["channel_id"]] = ChannelRecord.from_dict(channel)
+        self.verified_channels.add(channel)
+        self.channel_search.add(channel)
+        self.versions.bump(CHANNELS)
+
+    def _apply_channels(self, channels: List[dict]) -> None:
+        for channel in channels:
+            self.channels[channel["channel_id"]] = ChannelRecord.from_dict(channel)
+            self.verified_channels.add(channel)
+        # One bitmap rewrite per facet for the whole batch
+        self.channel_search.add_many(channels)
+        self.versions.bump(CHANNELS)
+
+    def _apply_bounty(self, bounty: dict, transaction: Optional[dict] = None) -> None:
+        self.bounties[bounty["bounty_id"]] = BountyRecord.from_dict(bounty)
+        self.open_bounties.add(bounty)
+        self.versions.bump(("bounty", bounty["bounty_id"]))
+        if transaction is not None:
+            self._apply_transaction(transaction)
+
+    def _apply_bounties(self, bounties: List[dict], transactions: Sequence[dict] = ()) -> None:
+        # Build every record before storing any, so a bad item leaves nothing behind
+        records = [BountyRecord.from_dict(bounty) for bounty in bounties]
+        tx_records = [TransactionRecord.from_dict(transaction) for transaction in transactions]
+        for record, bounty in zip(records, bounties):
+            self.bounties[record.bounty_id] = record
+            self.open_bounties.add(bounty)
+        self.versions.bump_many(("bounty", record.bounty_id) for record in records)
+        for record, transaction in zip(tx_records, transactions):
+            self.transactions[record.tx_id] = record
+            self.transactions_by_user.add(transaction)
+            self.spend.add_transaction(transaction, self._niche_of)
+        self.balances.apply(transactions)
+
+    def _apply_bounty_status(self, bounty_id: str, status: str, transaction: Optional[dict]) -> None:
+        bounty = self.bounties[bounty_id]
+        bounty.set_enum("status", status)
+        self.open_bounties.add(bounty)
+        self.versions.bump(("bounty", bounty_id))
+        if transaction is not None:
+            self._apply_transaction(transaction)
+
+    def _apply_expiry(self, refunds: List[dict]) -> None:
+        for refund in refunds:
+            self.bounties[refund["bounty_id"]].set_enum("status", "expired")
+            self.versions.bump(("bounty", refund["bounty_id"]))
+            self._apply_transaction(refund)
+        self.open_bounties.remove_many(refund["bounty_id"] for refund in refunds)
+
+    def _apply_bid(self, bid: dict) -> None:
+        self.bids[bid["bid_id"]] = BidRecord.from_dict(bid)
+
+    def _apply_transaction(self, transaction: dict) -> None:
+        """Store a transaction and update its per-user index"""
+        self.transactions[transaction["tx_id"]] = TransactionRecord.from_dict(transaction)
+        self.transactions_by_user.add(transaction)
+        self.balances.apply((transaction,))
+        self.spend.add_transaction(transaction, self._niche_of)
+
+    def _niche_of(self, channel_id: Optional[int]) -> str:
+        channel = self.channels.get(channel_id)
+        return channel.niche if channel is not None else UNKNOWN_NICHE
+
+    def rebuild_spend(self) -> None:
+        """Recompute the advertiser spend rollups from the stored transactions in one bulk pass"""
+        self.spend.rebuild(self.transactions.values(), self._niche_of)
+
+    _APPLY = {
+        "user": _apply_user,
+        "channel": _apply_channel,
+        "channels": _apply_channels,
+        "bounty": _apply_bounty,
+        "bounties": _apply_bounties,
+        "bounty_status": _apply_bounty_status,
+        "expiry": _apply_expiry,
+        "bid": _apply_bid,
+        "transaction": _apply_transaction,
+    }
+
+    async def get_user(self, telegram_id: int) -> Optional[UserRecord]:
+        return self.users.get(telegram_id)
+
+    async def add_user(self, user: dict) -> None:
+        self._apply_user(user)
+        await self._log("user", user)
+
+    async def get_channel(self, channel_id: int) -> Optional[ChannelRecord]:
+        return self.channels.get(channel_id)
+
+    async def put_channel(self, channel: dict) -> None:
+        self._apply_channel(channel)
+        await self._log("channel", channel)
+
+    async def put_channels(self, channels: List[dict]) -> None:
+        self._apply_channels(channels)
+        await self._log("channels", channels)
+
+    async def list_verified_channels(
+        self,
+        sort_by: str = "created_at",
+        niche: Optional[str] = None,
+        limit: Optional[int] = None,
+        after: Optional[tuple] = None,
+    ) -> Tuple[List[ChannelRecord], int]:
+        channels = self.channels
+        page = [channels[ch_id] for ch_id in self.verified_channels.ids(sort_by, niche, limit, after)]
+        return page, self.verified_channels.count(niche)
+
+    async def search_channels(
+        self,
+        niches: Optional[List[str]] = None,
+        min_subscribers: Optional[int] = None,
+        max_subscribers: Optional[int] = None,
+        verified: Optional[bool] = None,
+        limit: Optional[int] = None,
+        after: Optional[tuple] = None,
+    ) -> Tuple[List[ChannelRecord], int]:
+        ids, total = self.channel_search.search(niches, min_subscribers, max_subscribers, verified, limit, after)
+        channels = self.channels
+        return [channels[ch_id] for ch_id in ids], total
+
+    async def add_bounty(self, bounty: dict, transaction: Optional[dict] = None) -> None:
+        self._apply_bounty(bounty, transaction)
+        await self._log("bounty", bounty, transaction)
+
+    async def add_bounties(self, bounties: List[dict], transactions: Sequence[dict] = ()) -> None:
+        self._apply_bounties(bounties, transactions)
+        await self._log("bounties", bounties, transactions)
+
+    async def get_bounty(self, bounty_id: str) -> Optional[BountyRecord]:
+        return self.bounties.get(bounty_id)
+
+    async def set_bounty_status(
+        self, bounty_id: str, status: str, transaction: Optional[dict] = None, expected: Optional[str] = None
+    ) -> Optional[BountyRecord]:
+        bounty = self.bounties.get(bounty_id)
+        if bounty is None:
+            return None
+        # Check and apply with no await in between, so the check still holds
+        if expected is not None and bounty["status"] != expected:
+            raise StatusConflict(bounty_id, expected, bounty["status"])
+        self._apply_bounty_status(bounty_id, status, transaction)
+        await self._log("bounty_status", bounty_id, status, transaction)
+        return self.bounties[bounty_id]
+
+    async def list_channel_bounties(
+        self, channel_id: int, limit: Optional[int] = None, after: Optional[str] = None
+    ) -> Tuple[List[BountyRecord], int]:
+        ids, total = self.open_bounties.ids_for_channel(channel_id, after, limit)
+        bounties = self.bounties
+        return [bounties[bounty_id] for bounty_id in ids], total
+
+    async def expire_bounties(self, bounty_ids: Iterable[str], now: datetime) -> List[dict]:
+        refunds = []
+        for bounty_id in bounty_ids:
+            bounty = self.bounties.get(bounty_id)
+            if bounty is None or bounty["status"] != "pending" or bounty.deadline is None or bounty.deadline > now:
+                continue
+            refunds.append(refund_transaction(bounty, now))
+        if refunds:
+            # One journal entry for the whole batch
+            self._apply_expiry(refunds)
+            await self._log("expiry", refunds)
+        return refunds
+
+    async def iter_pending_deadlines(self) -> AsyncIterator[Tuple[datetime, str]]:
+        for deadline, bounty_id in list(self.open_bounties.deadlines()):
+            yield deadline, bounty_id
+
+    async def add_bid(self, bid: dict) -> None:
+        self._apply_bid(bid)
+        await self._log("bid", bid)
+
+    async def add_transaction(self, transaction: dict) -> None:
+        self._apply_transaction(transaction)
+        await self._log("transaction", transaction)
+
+    async def list_user_transactions(
+        self, user_id: int, limit: Optional[int] = None, after: Optional[str] = None
+    ) -> Tuple[List[TransactionRecord], int]:
+        transactions = self.transactions
+        index = self.transactions_by_user
+        page = [transactions[tx_id] for tx_id in index.ids_for_user(user_id, after, limit)]
+        return page, index.count(user_id)
+
+    async def get_balance(self, user_id: int) -> dict:
+        return self.balances.get(user_id)
+
+    async def get_advertiser_stats(
+        self, advertiser_id: int, since: Optional[date] = None, until: Optional[date] = None
+    ) -> dict:
+        return self.spend.stats(advertiser_id, since, until)
+
+    async def count(self, table: str) -> int:
+        return len(getattr(self, table))
+
+    def memory_structures(self) -> Dict[str, object]:
+        # Stores first, so the indexes are only charged for what they add on top of the records
+        structures = {name: getattr(self, name) for name in self.TABLES + self.INDEXES}
+        structures.update(super().memory_structures())
+        return structures
+
+
+def replay_journal(state: Optional[dict], ops: Iterable[tuple]) -> dict:
+    """MemoryStorage state after replaying `ops` on a snapshot's `state`; the journal's compaction step"""
+    store = MemoryStorage()
+    store._restore(state, ops)
+    return store._dump_state()
+
+
+def create_storage() -> Storage:
+    """Build the backend selected by STORAGE_BACKEND (memory or sql).
+
+    The memory backend is journaled to JOURNAL_DIR when that is set.
+    """
+    backend = os.getenv("STORAGE_BACKEND", "memory").lower()
+    workers = int(os.getenv("WEB_CONCURRENCY", 1))
+    if backend == "memory":
+        if workers > 1:
+            # Each worker would silently serve its own private copy of the data
+            raise ValueError(
+                f"WEB_CONCURRENCY={workers} needs shared state; set STORAGE_BACKEND=sql "
+                "(e.g. DATABASE_URL=sqlite:///./adbounty.db for a single host)"
+            )
+        journal_dir = os.getenv("JOURNAL_DIR")
+        if not journal_dir:
+            return MemoryStorage()
+        return MemoryStorage(Journal(journal_dir, snapshot_interval=float(os.getenv("SNAPSHOT_INTERVAL", 300))))
+    if backend == "sql":
+        from sql_storage import SQLStorage
+
+        return SQLStorage.from_env()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
@@ -2,11 +2,43 @@
 Unit tests for AdBounty API
 """
 
+import asyncio
+import atexit
+import io
+import json
+import logging
+import os
+import pickle
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta, timezone
+
+import httpx
+import analytics
 import pytest
 from fastapi.testclient import TestClient
-from main import app, users_db, channels_db, bounties_db
+import main
+from main import app, rate_limiter, storage, get_storage
+from idempotency import IdempotencyCache
+from ids import id_timestamp, new_id
+from indexes import ChannelSearchIndex, OpenBountyIndex
+from journal import Journal
+from ledger import to_nano
+from logconfig import AccessLog, JSONFormatter, RouteSampler, configure_logging
+from memtrace import deep_size, deep_sizes
+from metrics import Histogram, InstrumentationMiddleware, LoopLagMonitor
+from profiling import ProfilerMiddleware, SamplingProfiler
+from ratelimit import Limit, RateLimiter, RateLimitMiddleware, TokenBuckets
+from records import BountyRecord
+from scheduler import ExpiryScheduler
+from sql_storage import SQLStorage
+from storage import MemoryStorage, StatusConflict, create_storage
 
 client = TestClient(app)
+# The suite fires thousands of requests from one client; TestRateLimiting covers the limiter
+rate_limiter.enabled = False
 
 
 class TestHealth:
@@ -87,6 +119,139 @@ class TestChannels:
         data = response.json()
         assert data["status"] == "success"
         assert data["count"] > 0
+    
+    def test_verified_channels_sorted_and_filtered(self):
+        for channel_id, subscribers in ((-1002000000001, 1200), (-1002000000002, 98000), (-1002000000003, 5400)):
+            client.post(
+                "/channels/verify",
+                params={
+                    "channel_id": channel_id,
+                    "channel_name": "Gaming",
+                    "owner_id": 123456789,
+                    "subscribers": subscribers,
+                    "niche": "gaming"
+                }
+            )
+        
+        response = client.get("/channels/verified", params={"niche": "gaming", "sort_by": "subscribers"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["count"] == 3
+        assert [ch["subscribers"] for ch in data["channels"]] == [98000, 5400, 1200]
+        
+        response = client.get("/channels/verified", params={"niche": "gaming", "sort_by": "subscribers", "limit": 1})
+        first_page = response.json()
+        assert [ch["channel_id"] for ch in first_page["channels"]] == [-1002000000002]
+        
+        response = client.get(
+            "/channels/verified",
+            params={"niche": "gaming", "sort_by": "subscribers", "limit": 2, "cursor": first_page["next_cursor"]}
+        )
+        second_page = response.json()
+        assert [ch["subscribers"] for ch in second_page["channels"]] == [5400, 1200]
+        assert second_page["next_cursor"] is None
+    
+    def test_reverify_channel_replaces_index_entry(self):
+        for subscribers in (100, 200):
+            client.post(
+                "/channels/verify",
+                params={
+                    "channel_id": -1002000000010,
+                    "channel_name": "Cooking",
+                    "owner_id": 123456789,
+                    "subscribers": subscribers,
+                    "niche": "cooking"
+                }
+            )
+        
+        data = client.get("/channels/verified", params={"niche": "cooking"}).json()
+        assert data["count"] == 1
+        assert data["channels"][0]["subscribers"] == 200
+
+    
+    def test_verify_channels_batch(self):
+        items = [
+            {"channel_id": -1005000000000 - n, "channel_name": f"Batch {n}", "owner_id": 5, "subscribers": 100 + n, "niche": "batch"}
+            for n in range(3)
+        ]
+        response = client.post("/channels/verify/batch", json=items)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["count"] == 3
+        assert [r["index"] for r in data["results"]] == [0, 1, 2]
+        assert all(r["status"] == "verified" and r["channel"]["verified"] for r in data["results"])
+        assert client.get("/channels/verified", params={"niche": "batch"}).json()["count"] == 3
+    
+    def test_search_channels_by_facets(self):
+        for channel_id, subscribers, niche in (
+            (-1003000000001, 900, "travel"),
+            (-1003000000002, 25000, "travel"),
+            (-1003000000003, 250000, "travel"),
+            (-1003000000004, 40000, "food"),
+        ):
+            client.post(
+                "/channels/verify",
+                params={
+                    "channel_id": channel_id,
+                    "channel_name": "Search",
+                    "owner_id": 123456789,
+                    "subscribers": subscribers,
+                    "niche": niche
+                }
+            )
+        
+        params = {"niche": ["travel", "food"], "min_subscribers": 1000, "max_subscribers": 100000}
+        data = client.get("/channels/search", params=params).json()
+        assert data["count"] == 2
+        assert [ch["channel_id"] for ch in data["channels"]] == [-1003000000004, -1003000000002]
+        
+        first_page = client.get("/channels/search", params=dict(params, limit=1)).json()
+        assert first_page["next_cursor"] is not None
+        second_page = client.get(
+            "/channels/search", params=dict(params, limit=1, cursor=first_page["next_cursor"])
+        ).json()
+        assert [ch["channel_id"] for ch in second_page["channels"]] == [-1003000000002]
+        assert second_page["next_cursor"] is None
+    
+    def test_search_index_matches_a_full_scan(self):
+        rng = random.Random(7)
+        channels = [
+            {
+                "channel_id": n,
+                "subscribers": rng.choice((0, 99, 100, 150, 5000, 19999, 20000, 77777, 2000000)),
+                "niche": rng.choice(("a", "b", "c")),
+                "verified": rng.random() < 0.8,
+            }
+            for n in range(3000)
+        ]
+        bulk, incremental, batched = ChannelSearchIndex(), ChannelSearchIndex(), ChannelSearchIndex()
+        bulk.load(channels)
+        for channel in channels:
+            incremental.add(dict(channel, subscribers=1))  # then re-verified with the real count
+            incremental.add(channel)
+        # Batches of new and refreshed channels, with repeats inside a batch (the last copy wins)
+        batched.add_many(dict(channel, subscribers=1, niche="z", verified=True) for channel in channels[:2000])
+        batched.add_many(channels[1000:1500] + [dict(channel, niche="z") for channel in channels[2500:]])
+        batched.add_many(channels[:1000] + [dict(channel, verified=not channel["verified"]) for channel in channels[:5]])
+        batched.add_many(channels[:5] + channels[1500:])
+        
+        for _ in range(200):
+            niches = rng.choice((None, ["a"], ["b", "c"], ["missing"]))
+            low = rng.choice((None, 0, 100, 150, 20000))
+            high = rng.choice((None, 99, 100, 19999, 80000))
+            verified = rng.choice((None, True, False))
+            limit = rng.choice((None, 1, 10, 500))
+            expected = sorted(
+                ((-ch["subscribers"], ch["channel_id"]) for ch in channels
+                 if (not niches or ch["niche"] in niches)
+                 and (low is None or ch["subscribers"] >= low)
+                 and (high is None or ch["subscribers"] <= high)
+                 and (verified is None or ch["verified"] == verified))
+            )
+            after = expected[len(expected) // 3] if expected and rng.random() < 0.5 else None
+            page = [key[1] for key in expected if after is None or key > after][:limit]
+            for index in (bulk, incremental, batched):
+                assert index.search(niches, low, high, verified, limit, after) == (page, len(expected))
 
 
 class TestBounties:
@@ -135,6 +300,105 @@ class TestBounties:
     def test_get_nonexistent_bounty(self):
         response = client.get("/bounties/nonexistent_bounty")
         assert response.status_code == 404
+    
+    def test_create_bounties_batch(self):
+        items = [
+            {
+                "advertiser_id": 555,
+                "ton_amount": 1.0 + n,
+                "ad_text": "Batch ad",
+                "ad_link": "https://test.com",
+                "target_channels": [-1005100000000]
+            }
+            for n in range(3)
+        ]
+        response = client.post("/bounties/create/batch", json=items)
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [r["bounty"]["ton_amount"] for r in results] == [1.0, 2.0, 3.0]
+        for result in results:
+            assert client.get(f"/bounties/{result['bounty']['bounty_id']}").status_code == 200
+        assert client.get("/channels/-1005100000000/bounties").json()["count"] == 3
+    
+    def test_bounty_batch_is_all_or_nothing(self):
+        good = {"advertiser_id": 556, "ton_amount": 1.0, "ad_text": "a", "ad_link": "b", "target_channels": [-1005200000000]}
+        response = client.post("/bounties/create/batch", json=[good, {"advertiser_id": "x"}, good, {}])
+        assert response.status_code == 400
+        results = response.json()["detail"]["results"]
+        assert [r["index"] for r in results] == [1, 3]
+        assert results[0]["errors"][0]["loc"] == ["advertiser_id"]
+        assert client.get("/channels/-1005200000000/bounties").json()["count"] == 0
+        
+        assert client.post("/bounties/create/batch", json=[]).status_code == 400
+    
+    def test_cached_bounty_reflects_status_change(self):
+        create_response = client.post(
+            "/bounties/create",
+            json={
+                "advertiser_id": 123456789,
+                "ton_amount": 5.0,
+                "ad_text": "Test ad",
+                "ad_link": "https://test.com",
+                "target_channels": [-1001234567890],
+                "deadline_days": 7
+            }
+        )
+        bounty_id = create_response.json()["bounty"]["bounty_id"]
+        
+        first = client.get(f"/bounties/{bounty_id}")
+        assert first.headers["content-type"] == "application/json"
+        assert first.json()["bounty"]["status"] == "pending"
+        client.post("/bot/post-ad", params={"bounty_id": bounty_id, "channel_id": -1001234567890})
+        assert client.get(f"/bounties/{bounty_id}").json()["bounty"]["status"] == "posted"
+
+    
+    def test_channel_bounty_feed(self):
+        channel_id = -1004000000001
+        
+        def create(deadline_days):
+            return client.post(
+                "/bounties/create",
+                json={
+                    "advertiser_id": 123456789,
+                    "ton_amount": 5.0,
+                    "ad_text": "Feed ad",
+                    "ad_link": "https://test.com",
+                    "target_channels": [channel_id, -1004000000002],
+                    "deadline_days": deadline_days
+                }
+            ).json()["bounty"]["bounty_id"]
+        
+        first, second, third = create(7), create(7), create(7)
+        create(-1)  # already past its deadline
+        client.post(f"/bounties/{second}/confirm-views", json={"bounty_id": second, "channel_owner_id": 1})
+        
+        page = client.get(f"/channels/{channel_id}/bounties", params={"limit": 1}).json()
+        assert page["count"] == 2
+        assert [b["bounty_id"] for b in page["bounties"]] == [first]
+        rest = client.get(f"/channels/{channel_id}/bounties", params={"cursor": page["next_cursor"]}).json()
+        assert [b["bounty_id"] for b in rest["bounties"]] == [third]
+        assert rest["next_cursor"] is None
+    
+    def test_open_bounty_index_drops_expired(self):
+        index = OpenBountyIndex()
+        now = datetime(2026, 1, 1)
+        for n, days in enumerate((1, 3, None)):
+            index.add({
+                "bounty_id": f"bounty_{n}",
+                "status": "pending",
+                "target_channels": [7, 7],
+                "deadline": now + timedelta(days=days) if days else None,
+            })
+        assert index.ids_for_channel(7, now=now) == (["bounty_0", "bounty_1", "bounty_2"], 3)
+        assert index.ids_for_channel(7, now=now + timedelta(days=2)) == (["bounty_1", "bounty_2"], 2)
+        assert index.ids_for_channel(7, now=now + timedelta(days=9)) == (["bounty_2"], 1)
+        # Hidden from the feed, but still pending until the expiry scheduler settles them
+        assert sorted(index.deadlines()) == [(now + timedelta(days=1), "bounty_0"), (now + timedelta(days=3), "bounty_1")]
+        index.add({"bounty_id": "bounty_2", "status": "cancelled", "target_channels": [7]})
+        for bounty_id in ("bounty_0", "bounty_1"):
+            index.add({"bounty_id": bounty_id, "status": "expired", "target_channels": [7]})
+        assert index.ids_for_channel(7, now=now) == ([], 0)
+        assert len(index) == 0
 
 
 class TestBids:
@@ -214,6 +478,117 @@ class TestConfirmViews:
         assert "transaction" in data
 
 
+    def test_pending_bounty_past_deadline_is_not_paid(self):
+        bounty_id = new_id("bounty")
+        now = datetime.utcnow()
+        # Past its deadline, but the expiry scheduler has not reached it: still pending
+        asyncio.run(storage.add_bounty({
+            "bounty_id": bounty_id,
+            "advertiser_id": 123450017,
+            "ton_amount": 2.0,
+            "ad_text": "Late ad",
+            "ad_link": "https://test.com",
+            "target_channels": [-1001234567890],
+            "status": "pending",
+            "escrow_address": None,
+            "created_at": now - timedelta(days=8),
+            "deadline": now - timedelta(minutes=1),
+        }))
+        response = client.post(
+            f"/bounties/{bounty_id}/confirm-views",
+            json={"bounty_id": bounty_id, "channel_owner_id": 987650017}
+        )
+        assert response.status_code == 409
+        assert client.get(f"/bounties/{bounty_id}").json()["bounty"]["status"] == "pending"
+        assert client.get("/transactions/987650017").json()["count"] == 0
+
+
+class TestIdempotency:
+    """Idempotency-Key replay for retried POSTs"""
+    
+    BOUNTY = {
+        "advertiser_id": 123456789,
+        "ton_amount": 3.0,
+        "ad_text": "Retried ad",
+        "ad_link": "https://test.com",
+        "target_channels": [-1001234567890],
+        "deadline_days": 7
+    }
+    
+    def test_retried_create_returns_first_bounty(self):
+        key = {"Idempotency-Key": new_id("key")}
+        first = client.post("/bounties/create", json=self.BOUNTY, headers=key)
+        retry = client.post("/bounties/create", json=self.BOUNTY, headers=key)
+        assert first.status_code == retry.status_code == 200
+        assert retry.json() == first.json()
+        assert retry.headers["idempotent-replayed"] == "true"
+        assert "idempotent-replayed" not in first.headers
+        
+        # Without a key, or with a fresh one, the request runs again
+        assert client.post("/bounties/create", json=self.BOUNTY).json()["bounty"]["bounty_id"] != first.json()["bounty"]["bounty_id"]
+        # Reusing a key for a different request is refused
+        other = client.post("/bounties/create", json={**self.BOUNTY, "ton_amount": 4.0}, headers=key)
+        assert other.status_code == 422
+    
+    def test_retried_confirm_views_pays_out_once(self):
+        owner_id = random.randint(10**9, 2 * 10**9)
+        bounty_id = client.post("/bounties/create", json=self.BOUNTY).json()["bounty"]["bounty_id"]
+        key = {"Idempotency-Key": new_id("key")}
+        payload = {"bounty_id": bounty_id, "channel_owner_id": owner_id}
+        responses = [client.post(f"/bounties/{bounty_id}/confirm-views", json=payload, headers=key) for _ in range(3)]
+        assert {r.status_code for r in responses} == {200}
+        assert len({r.json()["transaction"]["tx_id"] for r in responses}) == 1
+        assert client.get(f"/transactions/{owner_id}").json()["count"] == 1
+    
+    def test_concurrent_retries_run_once(self):
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+                key = {"Idempotency-Key": new_id("key")}
+                return await asyncio.gather(*[
+                    ac.post("/bounties/create", json=self.BOUNTY, headers=key) for _ in range(5)
+                ])
+        responses = asyncio.run(run())
+        assert len({r.json()["bounty"]["bounty_id"] for r in responses}) == 1
+        assert sum(r.headers.get("idempotent-replayed") == "true" for r in responses) == 4
+    
+    def test_cache_is_bounded_and_expires(self):
+        cache = IdempotencyCache(max_entries=2, ttl=10.0)
+        response = (200, [], b"{}")
+        cache.put(("a", "/p"), b"f", response, now=0.0)
+        cache.put(("b", "/p"), b"f", response, now=1.0)
+        assert cache.get(("a", "/p"), now=2.0) == (b"f", response)  # "a" is now most recent
+        cache.put(("c", "/p"), b"f", response, now=3.0)
+        assert cache.get(("b", "/p"), now=3.0) is None
+        assert cache.get(("a", "/p"), now=9.0) is not None
+        assert cache.get(("a", "/p"), now=10.0) is None
+        assert len(cache) == 1
+
+    def test_cache_is_bounded_by_body_bytes(self):
+        cache = IdempotencyCache(max_entries=100, ttl=10.0, max_bytes=10)
+        cache.put(("a", "/p"), b"f", (200, [], b"1234"), now=0.0)
+        cache.put(("b", "/p"), b"f", (200, [], b"1234"), now=0.0)
+        cache.put(("c", "/p"), b"f", (200, [], b"1234"), now=0.0)
+        assert cache.get(("a", "/p"), now=1.0) is None
+        assert cache.cached_bytes == 8
+        cache.put(("b", "/p"), b"f", (200, [], b"1"), now=1.0)  # replacing an entry releases its bytes
+        assert cache.cached_bytes == 5
+        cache.put(("d", "/p"), b"f", (200, [], b"x" * 11), now=1.0)  # too big to cache at all
+        assert cache.get(("d", "/p"), now=1.0) is None
+        assert len(cache) == 2 and cache.cached_bytes == 5
+
+    def test_key_is_scoped_to_the_caller(self):
+        key = new_id("key")
+        alice = client.post("/bounties/create", json=self.BOUNTY, headers={"Idempotency-Key": key, "X-Telegram-User-Id": "1"})
+        bob = client.post("/bounties/create", json=self.BOUNTY, headers={"Idempotency-Key": key, "X-Telegram-User-Id": "2"})
+        anonymous = client.post("/bounties/create", json=self.BOUNTY, headers={"Idempotency-Key": key})
+        ids = {r.json()["bounty"]["bounty_id"] for r in (alice, bob, anonymous)}
+        assert len(ids) == 3
+        assert not any("idempotent-replayed" in r.headers for r in (alice, bob, anonymous))
+        retry = client.post("/bounties/create", json=self.BOUNTY, headers={"Idempotency-Key": key, "X-Telegram-User-Id": "2"})
+        assert retry.json() == bob.json()
+
+
 class TestTransactions:
     """Transaction history tests"""
     
@@ -223,6 +598,663 @@ class TestTransactions:
         data = response.json()
         assert data["status"] == "success"
         assert "transactions" in data
+    
+    def test_transactions_indexed_for_both_parties(self):
+        bounty_response = client.post(
+            "/bounties/create",
+            json={
+                "advertiser_id": 555000111,
+                "ton_amount": 3.0,
+                "ad_text": "Test ad",
+                "ad_link": "https://test.com",
+                "target_channels": [-1001234567890],
+                "deadline_days": 7
+            }
+        )
+        bounty_id = bounty_response.json()["bounty"]["bounty_id"]
+        client.post(
+            f"/bounties/{bounty_id}/confirm-views",
+            json={"bounty_id": bounty_id, "channel_owner_id": 555000222}
+        )
+        
+        # The advertiser has the escrow deposit and the payout, the owner just the payout
+        for user_id, tx_types in ((555000111, ["deposit", "payout"]), (555000222, ["payout"])):
+            data = client.get(f"/transactions/{user_id}").json()
+            assert data["count"] == len(tx_types)
+            assert [tx["tx_type"] for tx in data["transactions"]] == tx_types
+            assert {tx["bounty_id"] for tx in data["transactions"]} == {bounty_id}
+        
+        assert client.get("/transactions/555000333").json()["count"] == 0
+    
+    def test_transactions_keyset_pagination(self):
+        bounty_ids = []
+        for _ in range(5):
+            bounty_response = client.post(
+                "/bounties/create",
+                json={
+                    "advertiser_id": 555000444,
+                    "ton_amount": 1.0,
+                    "ad_text": "Test ad",
+                    "ad_link": "https://test.com",
+                    "target_channels": [-1001234567890],
+                    "deadline_days": 7
+                }
+            )
+            bounty_id = bounty_response.json()["bounty"]["bounty_id"]
+            client.post(
+                f"/bounties/{bounty_id}/confirm-views",
+                json={"bounty_id": bounty_id, "channel_owner_id": 555000555}
+            )
+            bounty_ids.append(bounty_id)
+        
+        seen = []
+        cursor = None
+        while True:
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            data = client.get("/transactions/555000444", params=params).json()
+            assert data["count"] == 10
+            assert len(data["transactions"]) <= 2
+            seen += [tx["bounty_id"] for tx in data["transactions"]]
+            cursor = data["next_cursor"]
+            if cursor is None:
+                break
+        # Each bounty's deposit, then its payout
+        assert seen == [bounty_id for bounty_id in bounty_ids for _ in range(2)]
+    
+    def test_export_streams_full_history(self):
+        for _ in range(3):
+            bounty_response = client.post(
+                "/bounties/create",
+                json={
+                    "advertiser_id": 555000666,
+                    "ton_amount": 2.0,
+                    "ad_text": "Test ad",
+                    "ad_link": "https://test.com",
+                    "target_channels": [-1001234567890],
+                    "deadline_days": 7
+                }
+            )
+            bounty_id = bounty_response.json()["bounty"]["bounty_id"]
+            client.post(
+                f"/bounties/{bounty_id}/confirm-views",
+                json={"bounty_id": bounty_id, "channel_owner_id": 555000777}
+            )
+        
+        response = client.get("/transactions/555000666/export")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert len(rows) == 6
+        assert [row["tx_id"] for row in rows] == sorted(row["tx_id"] for row in rows)
+        
+        response = client.get("/transactions/555000777/export", params={"format": "csv"})
+        assert response.headers["content-type"].startswith("text/csv")
+        lines = response.text.splitlines()
+        assert lines[0].startswith("tx_id,from_user,to_user,amount")
+        assert len(lines) == 4
+    
+    def test_iter_user_transactions_pages_through_history(self):
+        async def collect():
+            store = MemoryStorage()
+            for n in range(7):
+                await store.add_transaction({
+                    "tx_id": new_id("tx"),
+                    "from_user": 1,
+                    "to_user": 2,
+                    "amount": 1.0,
+                    "tx_type": "payout",
+                    "status": "success",
+                    "bounty_id": None,
+                    "tx_hash": None,
+                    "created_at": None
+                })
+            return [tx["tx_id"] async for tx in store.iter_user_transactions(1, chunk_size=3)]
+        
+        ids = asyncio.run(collect())
+        assert len(ids) == 7
+        assert ids == sorted(ids)
+    
+    def test_invalid_cursor_is_rejected(self):
+        response = client.get("/transactions/555000444", params={"cursor": "not-a-cursor"})
+        assert response.status_code == 400
+
+
+class TestBalances:
+    """Per-user balance ledger"""
+    
+    def test_balance_follows_bounty_lifecycle(self):
+        advertiser, owner = 555000888, 555000999
+        created = [
+            client.post("/bounties/create", json={
+                "advertiser_id": advertiser,
+                "ton_amount": amount,
+                "ad_text": "Ledger ad",
+                "ad_link": "https://test.com",
+                "target_channels": [-1001234567890],
+                "deadline_days": 7
+            }).json()
+            for amount in (0.1, 0.2)
+        ]
+        assert created[0]["transaction"]["tx_type"] == "deposit"
+        balance = client.get(f"/users/{advertiser}/balance").json()
+        assert balance["unit"] == "nanoTON"
+        # 0.1 + 0.2 adds up exactly in nanoTON
+        assert balance["balance"]["deposited"] == balance["balance"]["escrowed"] == 300_000_000
+        
+        bounty_id = created[1]["bounty"]["bounty_id"]
+        client.post(f"/bounties/{bounty_id}/confirm-views", json={"bounty_id": bounty_id, "channel_owner_id": owner})
+        assert client.get(f"/users/{advertiser}/balance").json()["balance"] == {
+            "user_id": advertiser, "deposited": 300_000_000, "escrowed": 100_000_000, "earned": 0, "refunded": 0
+        }
+        assert client.get(f"/users/{owner}/balance").json()["balance"]["earned"] == 200_000_000
+        assert client.get("/users/555000000/balance").json()["balance"]["deposited"] == 0
+    
+    def test_refunds_release_escrow(self):
+        async def run():
+            store = MemoryStorage()
+            now = datetime.utcnow()
+            bounty = TestExpiry._bounty(1, now - timedelta(minutes=1))
+            await store.add_bounty(bounty, {
+                "tx_id": new_id("tx"), "from_user": 101, "to_user": 101, "amount": 2.0, "tx_type": "deposit",
+                "status": "success", "bounty_id": bounty["bounty_id"], "tx_hash": None, "created_at": now,
+            })
+            await store.expire_bounties([bounty["bounty_id"]], now)
+            return await store.get_balance(101)
+        balance = asyncio.run(run())
+        assert (balance["deposited"], balance["escrowed"], balance["refunded"]) == (2 * 10**9, 0, 2 * 10**9)
+    
+    def test_to_nano_is_exact(self):
+        assert to_nano(0.1) + to_nano(0.2) == to_nano(0.3) == 300_000_000
+        assert to_nano(1e-9) == 1
+        assert to_nano("12.345678901") == 12_345_678_901
+
+
+class TestAdvertiserStats:
+    """Spend rollups by niche, channel and day"""
+    
+    def test_stats_by_niche_channel_and_day(self):
+        advertiser = 556000111
+        for channel_id, niche in ((-556000001, "tech"), (-556000002, "gaming")):
+            client.post("/channels/verify", params={
+                "channel_id": channel_id, "channel_name": "Stats", "owner_id": 1, "subscribers": 10, "niche": niche
+            })
+        
+        def pay(amount, target_channels, channel_id=None):
+            bounty_id = client.post("/bounties/create", json={
+                "advertiser_id": advertiser,
+                "ton_amount": amount,
+                "ad_text": "Stats ad",
+                "ad_link": "https://test.com",
+                "target_channels": target_channels,
+                "deadline_days": 7
+            }).json()["bounty"]["bounty_id"]
+            payload = {"bounty_id": bounty_id, "channel_owner_id": 1}
+            if channel_id is not None:
+                payload["channel_id"] = channel_id
+            return client.post(f"/bounties/{bounty_id}/confirm-views", json=payload)
+        
+        both = [-556000001, -556000002]
+        assert pay(1.0, both, -556000002).status_code == 200
+        assert pay(2.0, both, -556000001).status_code == 200
+        assert pay(0.5, [-556000001]).json()["transaction"]["channel_id"] == -556000001
+        assert pay(0.25, both).status_code == 200  # unattributed
+        assert pay(1.0, both, -1).status_code == 400
+        
+        response = client.get(f"/advertisers/{advertiser}/stats")
+        assert response.status_code == 200
+        stats = response.json()["stats"]
+        assert (stats["spent"], stats["payouts"]) == (3_750_000_000, 4)
+        assert stats["by_niche"] == [
+            {"niche": "tech", "spent": 2_500_000_000, "payouts": 2},
+            {"niche": "gaming", "spent": 1_000_000_000, "payouts": 1},
+            {"niche": "unknown", "spent": 250_000_000, "payouts": 1},
+        ]
+        assert [row["channel_id"] for row in stats["by_channel"]] == [-556000001, -556000002, None]
+        today = datetime.utcnow().date()
+        assert stats["by_day"] == [{"day": today.isoformat(), "spent": 3_750_000_000, "payouts": 4}]
+        
+        later = client.get(f"/advertisers/{advertiser}/stats", params={"since": (today + timedelta(days=1)).isoformat()})
+        assert later.json()["stats"]["payouts"] == 0 and later.json()["stats"]["by_niche"] == []
+    
+    @staticmethod
+    def _payouts(count, seed=18):
+        rng = random.Random(seed)
+        start = datetime(2026, 1, 1)
+        return [
+            {
+                "tx_id": new_id("tx"),
+                "from_user": rng.randrange(5),
+                "to_user": 99,
+                "amount": rng.choice([0.1, 0.25, 1.0, 3.3]),
+                "tx_type": rng.choice(["payout", "payout", "deposit"]),
+                "status": "success",
+                "bounty_id": None,
+                "tx_hash": None,
+                "created_at": start + timedelta(days=rng.randrange(60), hours=rng.randrange(24)),
+                "channel_id": rng.choice([None, -1, -2, -3]),
+            }
+            for _ in range(count)
+        ]
+    
+    def test_bulk_rebuild_matches_incremental_rollups(self, monkeypatch):
+        async def stats_of(store):
+            windows = [(None, None), (date(2026, 1, 10), date(2026, 2, 3)), (date(2026, 2, 1), None)]
+            return [await store.get_advertiser_stats(advertiser, *window) for advertiser in range(5) for window in windows]
+        
+        async def run():
+            store = MemoryStorage()
+            for channel_id, niche in ((-1, "tech"), (-2, "tech"), (-3, "art")):
+                await store.put_channel({
+                    "channel_id": channel_id, "niche": niche, "subscribers": 1, "verified": True, "created_at": None
+                })
+            for tx in payouts:
+                await store.add_transaction(tx)
+            incremental = await stats_of(store)
+            store.rebuild_spend()
+            assert await stats_of(store) == incremental
+            monkeypatch.setattr(analytics, "np", None)
+            store.rebuild_spend()
+            assert await stats_of(store) == incremental
+            return incremental
+        
+        payouts = self._payouts(2000)
+        # Sub-nanoTON digits and amounts past 2**53 nanoTON, where scaling the float would round differently
+        for n, amount in enumerate((1.0000000005, 2.0000000015, 12345678.123456789, 98765432.987654321)):
+            payouts.append(dict(payouts[0], tx_id=new_id("tx"), tx_type="payout", from_user=n, amount=amount))
+        stats = asyncio.run(run())
+        assert sum(row["payouts"] for row in stats[::3]) == sum(tx["tx_type"] == "payout" for tx in payouts)
+        assert stats[0]["spent"] == sum(to_nano(tx["amount"]) for tx in payouts if tx["tx_type"] == "payout" and tx["from_user"] == 0)
+
+
+class TestRateLimiting:
+    """Token-bucket admission control"""
+    
+    @staticmethod
+    def _requests(limiter, requests):
+        async def run():
+            transport = httpx.ASGITransport(app=RateLimitMiddleware(app, limiter))
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+                return [await ac.request(method, path, headers=headers) for method, path, headers in requests]
+        return [response.status_code for response in asyncio.run(run())]
+    
+    def test_buckets_per_user_and_route_class(self):
+        limiter = RateLimiter({"read": Limit(0.001, 3), "create": Limit(0.001, 1)}, ip_factor=2)
+        alice, bob = {"X-Telegram-User-Id": "1"}, {"X-Telegram-User-Id": "2"}
+        codes = self._requests(limiter, [
+            *[("GET", "/channels/verified", alice)] * 4,
+            ("GET", "/channels/verified", bob),
+            ("POST", "/bounties/create", alice),  # its own bucket: reads did not use it up
+            ("POST", "/bounties/create", alice),
+            ("GET", "/health", alice),
+        ])
+        assert codes == [200, 200, 200, 429, 200, 422, 429, 200]
+        
+        # Anonymous callers share their IP's bucket, ip_factor times the user limit
+        codes = self._requests(RateLimiter({"read": Limit(0.001, 3)}, ip_factor=2), [("GET", "/", {})] * 7)
+        assert codes == [200] * 6 + [429]
+    
+    def test_retry_after_and_refill(self):
+        buckets = TokenBuckets(shards=4)
+        limit = Limit(2.0, 2)
+        assert [buckets.take(("read", b"1"), limit, 0.0) for _ in range(2)] == [0.0, 0.0]
+        assert buckets.take(("read", b"1"), limit, 0.0) == 0.5
+        assert buckets.take(("read", b"1"), limit, 0.5) == 0.0
+        
+        limiter = RateLimiter({"write": Limit(0.5, 1)}, ip_factor=1)
+        limiter.check({"method": "POST", "path": "/x", "headers": [], "client": ("1.2.3.4", 1)})
+        response = asyncio.run(self._raw(RateLimitMiddleware(app, limiter)))
+        assert response.status_code == 429 and response.headers["retry-after"] == "2"
+    
+    @staticmethod
+    async def _raw(asgi_app):
+        transport = httpx.ASGITransport(app=asgi_app, client=("1.2.3.4", 1))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            return await ac.post("/x")
+    
+    def test_idle_buckets_expire_lazily(self):
+        buckets = TokenBuckets(shards=1, max_per_shard=100)
+        limit = Limit(10.0, 5)
+        for n in range(100):
+            buckets.take(("read", n), limit, 0.0)
+        assert len(buckets) == 100
+        # Every bucket has refilled by t=1, so the next insert sweeps them all
+        buckets.take(("read", "new"), limit, 1.0)
+        assert len(buckets) == 1
+    
+    def test_forwarded_ip_is_read_from_the_right(self):
+        limiter = RateLimiter({"read": Limit(0.001, 1)}, ip_factor=1, trust_forwarded=True)
+        # The client controls everything left of what the proxy appended
+        codes = self._requests(limiter, [
+            ("GET", "/", {"X-Forwarded-For": "10.0.0.1, 203.0.113.7"}),
+            ("GET", "/", {"X-Forwarded-For": "10.0.0.2, 203.0.113.7"}),
+            ("GET", "/", {"X-Forwarded-For": "203.0.113.8"}),
+        ])
+        assert codes == [200, 429, 200]
+        
+        two_proxies = RateLimiter({"read": Limit(0.001, 1)}, ip_factor=1, trust_forwarded=True, trusted_hops=2)
+        codes = self._requests(two_proxies, [
+            ("GET", "/", {"X-Forwarded-For": "10.0.0.1, 203.0.113.7, 198.51.100.1"}),
+            ("GET", "/", {"X-Forwarded-For": "10.0.0.2, 203.0.113.7, 198.51.100.2"}),
+        ])
+        assert codes == [200, 429]
+    
+    def test_ip_rejection_leaves_the_user_bucket_alone(self):
+        limiter = RateLimiter({"read": Limit(0.001, 2)}, ip_factor=1)
+        noisy = [("GET", "/", {})] * 2
+        alice = [("GET", "/", {"X-Telegram-User-Id": "1"})] * 3
+        assert self._requests(limiter, noisy + alice) == [200, 200, 429, 429, 429]
+        # Requests the IP bucket turned away left alice her whole burst
+        now = time.monotonic()
+        assert [limiter.buckets.take(("read", b"1"), limiter.limits["read"], now) for _ in range(2)] == [0.0, 0.0]
+    
+    def test_off_unless_enabled(self, monkeypatch):
+        monkeypatch.delenv("RATE_LIMIT_ENABLED", raising=False)
+        monkeypatch.delenv("RATE_LIMIT_TRUST_PROXY", raising=False)
+        limiter = RateLimiter.from_env()
+        assert not limiter.enabled and not limiter.trust_forwarded
+        monkeypatch.setenv("RATE_LIMIT_ENABLED", "1")
+        monkeypatch.setenv("RATE_LIMIT_TRUST_PROXY", "1")
+        limiter = RateLimiter.from_env()
+        assert limiter.enabled and limiter.trust_forwarded
+
+
+class TestETags:
+    """Conditional GETs answered from version counters"""
+    
+    def _create(self):
+        return client.post("/bounties/create", json={
+            "advertiser_id": 557000111,
+            "ton_amount": 1.0,
+            "ad_text": "ETag ad",
+            "ad_link": "https://test.com",
+            "target_channels": [-1001234567890],
+        }).json()["bounty"]["bounty_id"]
+    
+    def test_bounty_revalidates_until_it_changes(self):
+        bounty_id = self._create()
+        first = client.get(f"/bounties/{bounty_id}")
+        etag = first.headers["etag"]
+        
+        for header in (etag, f"W/{etag}", f'"stale", {etag}'):
+            unchanged = client.get(f"/bounties/{bounty_id}", headers={"If-None-Match": header})
+            assert unchanged.status_code == 304
+            assert unchanged.content == b"" and unchanged.headers["etag"] == etag
+        assert client.get(f"/bounties/{bounty_id}", headers={"If-None-Match": "*"}).status_code == 200
+        
+        client.post(f"/bounties/{bounty_id}/confirm-views", json={"bounty_id": bounty_id, "channel_owner_id": 557000222})
+        changed = client.get(f"/bounties/{bounty_id}", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.json()["bounty"]["status"] == "confirmed"
+        assert changed.headers["etag"] != etag
+        # Other bounties keep their ETags
+        other = self._create()
+        other_etag = client.get(f"/bounties/{other}").headers["etag"]
+        self._create()
+        assert client.get(f"/bounties/{other}", headers={"If-None-Match": other_etag}).status_code == 304
+    
+    def test_unwritten_version_never_revalidates_a_missing_bounty(self):
+        unwritten = storage.versions.etag(("bounty", "bounty_missing"))
+        response = client.get("/bounties/bounty_missing", headers={"If-None-Match": unwritten})
+        assert response.status_code == 404
+    
+    def test_verified_channels_change_with_any_channel_write(self):
+        etag = client.get("/channels/verified").headers["etag"]
+        assert client.get("/channels/verified", headers={"If-None-Match": etag}).status_code == 304
+        client.post("/channels/verify", params={
+            "channel_id": -557000001, "channel_name": "ETag", "owner_id": 1, "subscribers": 10, "niche": "tech"
+        })
+        changed = client.get("/channels/verified", headers={"If-None-Match": etag})
+        assert changed.status_code == 200 and changed.headers["etag"] != etag
+    
+    def test_versions_are_off_for_multiple_workers(self, monkeypatch):
+        monkeypatch.setenv("WEB_CONCURRENCY", "4")
+        assert SQLStorage.from_env().versions is None
+        monkeypatch.setenv("WEB_CONCURRENCY", "1")
+        assert SQLStorage.from_env().versions is not None
+
+
+class TestLogging:
+    """Queued JSON logging and the sampled access log"""
+    
+    def test_records_are_written_as_json_lines_off_thread(self):
+        root = logging.getLogger()
+        handlers, level = root.handlers[:], root.level
+        stream = io.StringIO()
+        listener = configure_logging("INFO", stream=stream)
+        try:
+            log = logging.getLogger("adbounty.test")
+            log.info("Bounty created: %s", "bounty_1", extra={"route": "POST /bounties/create"})
+            log.debug("dropped %s", "below level")
+            try:
+                raise ValueError("boom")
+            except ValueError:
+                log.exception("Failed %s", "op")
+        finally:
+            listener.stop()
+            atexit.unregister(listener.stop)
+            root.handlers[:] = handlers
+            root.setLevel(level)
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert [line["msg"] for line in lines] == ["Bounty created: bounty_1", "Failed op"]
+        assert lines[0]["route"] == "POST /bounties/create" and lines[0]["level"] == "INFO"
+        assert "ValueError: boom" in lines[1]["exc"]
+    
+    def test_access_log_samples_per_route(self):
+        records = []
+        
+        class Collect(logging.Handler):
+            def emit(self, record):
+                records.append(record)
+        
+        access = logging.getLogger("adbounty.test.access")
+        access.addHandler(Collect())
+        access.propagate = False
+        sampler = RouteSampler({"GET /bounties/{bounty_id}": 0.25, "GET /nowhere": 0})
+        
+        async def run():
+            transport = httpx.ASGITransport(app=InstrumentationMiddleware(app, [AccessLog(sampler, access).record]))
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+                for n in range(8):
+                    await ac.get(f"/bounties/sampled_{n}")
+                await ac.get("/health")
+                await ac.get("/nowhere")
+        asyncio.run(run())
+        assert [record.route for record in records] == ["GET /bounties/{bounty_id}"] * 2 + ["GET /health", "GET -"]
+        assert records[0].getMessage().startswith("GET /bounties/sampled_3 404 ")
+        assert records[2].status == 200
+        formatted = json.loads(JSONFormatter().format(records[2]))
+        assert formatted["route"] == "GET /health" and formatted["duration_ms"] >= 0
+    
+    def test_sample_rates_parse_over_defaults(self):
+        sampler = RouteSampler.parse("GET /channels/verified=1, GET /bounties/{bounty_id}=0.5")
+        assert all(sampler.keep("GET /channels/verified") for _ in range(5))
+        assert [sampler.keep("GET /bounties/{bounty_id}") for _ in range(4)] == [False, True, False, True]
+        assert sum(sampler.keep("GET /channels/search") for _ in range(100)) == 10
+
+
+class TestMetrics:
+    """Prometheus exposition on /metrics"""
+    
+    @staticmethod
+    def _samples():
+        response = client.get("/metrics")
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        samples = {}
+        for line in response.text.splitlines():
+            if not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                samples[name] = float(value)
+        return samples
+    
+    def test_route_counters_and_histograms(self):
+        route = 'method="GET",route="/bounties/{bounty_id}"'
+        before = self._samples()
+        for n in range(3):
+            client.get(f"/bounties/metrics_{n}")
+        client.get("/no/such/route")
+        after = self._samples()
+        
+        requests = f'adbounty_http_requests_total{{{route},status="404"}}'
+        assert after[requests] - before.get(requests, 0) == 3
+        assert after['adbounty_http_requests_total{method="GET",route="-",status="404"}'] >= 1
+        buckets = [value for name, value in after.items() if name.startswith(f"adbounty_http_request_duration_seconds_bucket{{{route},")]
+        assert buckets == sorted(buckets) and len(buckets) == 14
+        assert buckets[-1] == after[f"adbounty_http_request_duration_seconds_count{{{route}}}"]
+        assert after['adbounty_store_records{store="bounties"}'] == len(storage.bounties)
+        assert "adbounty_event_loop_lag_seconds" in after
+    
+    def test_histogram_buckets_are_inclusive(self):
+        histogram = Histogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 1.0, 3.0):
+            histogram.observe(value)
+        lines = histogram.samples("h", {"route": 'say "hi"'})
+        assert lines[:3] == [
+            'h_bucket{route="say \\"hi\\"",le="0.1"} 2',
+            'h_bucket{route="say \\"hi\\"",le="1.0"} 4',
+            'h_bucket{route="say \\"hi\\"",le="+Inf"} 5',
+        ]
+        assert lines[-1] == 'h_count{route="say \\"hi\\""} 5'
+    
+    def test_loop_lag_sees_blocking_calls(self):
+        async def run():
+            monitor = LoopLagMonitor(interval=0.01)
+            await monitor.start()
+            await asyncio.sleep(0.02)
+            time.sleep(0.06)
+            await asyncio.sleep(0.02)
+            await monitor.close()
+            return monitor
+        monitor = asyncio.run(run())
+        assert monitor.histogram.sum >= 0.04
+        assert sum(monitor.histogram.counts[3:]) >= 1
+
+
+def burn_a(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def burn_b(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class TestProfiler:
+    """Admin-only sampling profiler"""
+    
+    @staticmethod
+    async def _burn_app(scope, receive, send):
+        scope["endpoint"] = TestProfiler._burn_app
+        (burn_a if scope["path"] == "/a" else burn_b)(0.05)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+    
+    @staticmethod
+    async def _request(asgi_app, path):
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+        
+        async def send(message):
+            pass
+        
+        await asgi_app({"type": "http", "method": "GET", "path": path, "headers": []}, receive, send)
+    
+    def test_one_in_n_requests_are_profiled(self):
+        profiler = SamplingProfiler()
+        
+        async def run():
+            wrapped = ProfilerMiddleware(self._burn_app, profiler)
+            profiler.start(seconds=10, every=2, interval=0.001)
+            for path in ("/a", "/b", "/a", "/b"):
+                await self._request(wrapped, path)
+            burn_a(0.05)
+            profiler.stop()
+        asyncio.run(run())
+        
+        lines = profiler.collapsed([]).splitlines()
+        assert lines and profiler.status()["samples"] == sum(int(line.rsplit(" ", 1)[1]) for line in lines)
+        # Only the second and fourth requests were picked, and nothing outside requests is kept
+        assert all(line.startswith("GET -;") and "burn_b (test_api.py:" in line for line in lines)
+        assert profiler.status()["sampling"] is False and not profiler._requests
+    
+    def test_window_mode_samples_the_whole_loop(self):
+        profiler = SamplingProfiler()
+        
+        async def run():
+            profiler.start(seconds=0.2, every=1, interval=0.001)
+            await self._request(ProfilerMiddleware(self._burn_app, profiler), "/a")
+            burn_b(0.05)
+            await asyncio.sleep(0.3)
+            return profiler.sampling
+        assert asyncio.run(run()) is False
+        
+        collapsed = profiler.collapsed([])
+        assert any(line.startswith("GET -;") and "burn_a" in line for line in collapsed.splitlines())
+        assert any(line.startswith("(other);") and "burn_b" in line for line in collapsed.splitlines())
+    
+    def test_admin_endpoints_need_the_token(self, monkeypatch):
+        assert client.get("/admin/profile").status_code == 404
+        monkeypatch.setattr(main, "ADMIN_TOKEN", "s3cret")
+        assert client.get("/admin/profile").status_code == 403
+        assert client.get("/admin/profile", headers={"X-Admin-Token": "wrong"}).status_code == 403
+        status = client.get("/admin/profile", params={"format": "status"}, headers={"X-Admin-Token": "s3cret"})
+        assert status.status_code == 200 and status.json()["profile"]["sampling"] is False
+        # The test app was built without ADMIN_TOKEN, so requests are never marked
+        started = client.post("/admin/profile/start", headers={"X-Admin-Token": "s3cret"})
+        assert started.status_code == 409
+
+
+class TestMemory:
+    """Deep sizes and tracemalloc diffs on /admin/memory"""
+    
+    ADMIN = {"X-Admin-Token": "s3cret"}
+    
+    def test_deep_size_counts_shared_objects_once(self):
+        record = BountyRecord.from_dict({
+            "bounty_id": new_id("bounty"), "advertiser_id": 1, "ton_amount": 1.0, "ad_text": "x" * 1000,
+            "ad_link": "https://test.com", "target_channels": [-1, -2], "status": "pending",
+            "escrow_address": None, "created_at": datetime.utcnow(), "deadline": None,
+        })
+        alone, _ = deep_size(record)
+        assert alone > sys.getsizeof(record) + 1000
+        store, index = {record.bounty_id: record}, [record, record]
+        sizes = deep_sizes({"store": store, "index": index})
+        assert sizes["index"]["bytes"] > alone
+        # The index only adds its own list: the record was charged to the store
+        assert sizes["index"]["new_bytes"] == sys.getsizeof(index)
+        assert sizes["store"]["items"] == 1
+    
+    def test_memory_report_covers_stores_and_indexes(self, monkeypatch):
+        monkeypatch.setattr(main, "ADMIN_TOKEN", "s3cret")
+        assert client.get("/admin/memory").status_code == 403
+        report = client.get("/admin/memory", headers=self.ADMIN).json()
+        structures = report["structures"]
+        for name in MemoryStorage.TABLES + MemoryStorage.INDEXES + ("versions", "rate_limit_buckets", "http_metrics"):
+            assert structures[name]["bytes"] >= structures[name]["new_bytes"] >= 0
+        assert structures["bounties"]["items"] == len(storage.bounties)
+        assert report["total_bytes"] == sum(entry["new_bytes"] for entry in structures.values())
+        assert report["max_rss_bytes"] > report["total_bytes"]
+    
+    def test_trace_diffs_against_the_baseline(self, monkeypatch):
+        monkeypatch.setattr(main, "ADMIN_TOKEN", "s3cret")
+        assert client.get("/admin/memory/trace", headers=self.ADMIN).status_code == 409
+        try:
+            assert client.post("/admin/memory/trace/start", headers=self.ADMIN).status_code == 200
+            TestMemory.leak = ["leak %d" % n for n in range(20000)]
+            trace = client.get("/admin/memory/trace", params={"limit": 5}, headers=self.ADMIN).json()["trace"]
+            assert trace["traced_bytes"] > 0 and len(trace["top"]) <= 5
+            grown = max(trace["growth"], key=lambda entry: entry["blocks_diff"])
+            assert grown["where"][0].split(":")[0].endswith("test_api.py") and grown["blocks_diff"] >= 20000
+            bad = client.get("/admin/memory/trace", params={"group_by": "module"}, headers=self.ADMIN)
+            assert bad.status_code == 422
+        finally:
+            assert client.post("/admin/memory/trace/stop", headers=self.ADMIN).status_code == 200
+            del TestMemory.leak
+        assert not tracemalloc.is_tracing()
 
 
 class TestBotEndpoints:
@@ -254,6 +1286,491 @@ class TestBotEndpoints:
         assert response.status_code == 200
         data = response.json()
         assert data["status"] == "success"
+    
+    def test_post_ad_after_payout_conflicts(self):
+        advertiser_id, owner_id = 123450016, 987650016
+        bounty_id = client.post(
+            "/bounties/create",
+            json={
+                "advertiser_id": advertiser_id,
+                "ton_amount": 2.0,
+                "ad_text": "Test ad",
+                "ad_link": "https://test.com",
+                "target_channels": [-1001234567890],
+                "deadline_days": 7
+            }
+        ).json()["bounty"]["bounty_id"]
+        confirm = {"bounty_id": bounty_id, "channel_owner_id": owner_id}
+        assert client.post(f"/bounties/{bounty_id}/confirm-views", json=confirm).status_code == 200
+        
+        # Posting a paid-out bounty must not reopen it for a second payout
+        response = client.post("/bot/post-ad", params={"bounty_id": bounty_id, "channel_id": -1001234567890})
+        assert response.status_code == 409
+        assert client.get(f"/bounties/{bounty_id}").json()["bounty"]["status"] == "confirmed"
+        assert client.post(f"/bounties/{bounty_id}/confirm-views", json=confirm).status_code == 409
+        
+        payouts = [
+            tx for tx in client.get(f"/transactions/{owner_id}").json()["transactions"] if tx["tx_type"] == "payout"
+        ]
+        assert len(payouts) == 1
+    
+    def test_post_ad_unknown_bounty(self):
+        response = client.post("/bot/post-ad", params={"bounty_id": "bounty_missing", "channel_id": -1001234567890})
+        assert response.status_code == 404
+
+
+class TestIds:
+    """Time-ordered record ids"""
+    
+    def test_ids_are_unique_and_sorted(self):
+        ids = [new_id("tx") for _ in range(10000)]
+        assert len(set(ids)) == len(ids)
+        assert ids == sorted(ids)
+    
+    def test_id_embeds_creation_time(self):
+        before = datetime.now(timezone.utc) - timedelta(seconds=1)
+        record_id = new_id("bounty")
+        assert record_id.startswith("bounty_")
+        assert before <= id_timestamp(record_id) <= datetime.now(timezone.utc)
+    
+    def test_bounty_ids_do_not_depend_on_store_size(self):
+        payload = {
+            "advertiser_id": 123456789,
+            "ton_amount": 1.0,
+            "ad_text": "Test ad",
+            "ad_link": "https://test.com",
+            "target_channels": [-1001234567890],
+            "deadline_days": 7
+        }
+        first = client.post("/bounties/create", json=payload).json()["bounty"]["bounty_id"]
+        second = client.post("/bounties/create", json=payload).json()["bounty"]["bounty_id"]
+        assert first < second
+
+
+class TestRecords:
+    """Compact slotted records behind MemoryStorage"""
+    
+    def test_bounty_record_round_trip(self):
+        bounty = {
+            "bounty_id": new_id("bounty"),
+            "advertiser_id": 123456789,
+            "ton_amount": 5.0,
+            "ad_text": "Test ad",
+            "ad_link": "https://test.com",
+            "target_channels": [-1001234567890, -1009876543210],
+            "status": "posted",
+            "escrow_address": None,
+            "created_at": datetime.now(),
+            "deadline": None,
+        }
+        record = BountyRecord.from_dict(bounty)
+        assert not hasattr(record, "__dict__")
+        assert record.status == 1
+        assert record.target_channels.typecode == "q"
+        assert record.to_dict() == bounty
+        assert pickle.loads(pickle.dumps(record)).to_dict() == bounty
+    
+    def test_unknown_status_is_rejected(self):
+        bounty = {"bounty_id": "bounty_x", "status": "pending", "target_channels": []}
+        record = BountyRecord.from_dict(bounty)
+        with pytest.raises(ValueError):
+            record.set_enum("status", "lost")
+        with pytest.raises(ValueError):
+            BountyRecord.from_dict(dict(bounty, status="lost"))
+        assert record.to_dict()["status"] == "pending"
+
+
+class TestSQLStorage:
+    """The same API flows against the SQLAlchemy backend on a SQLite file"""
+    
+    async def _run_flow(self, db_path):
+        sql = SQLStorage(f"sqlite:///{db_path}")
+        await sql.create_schema()
+        app.dependency_overrides[get_storage] = lambda: sql
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+                await ac.post("/auth/telegram", params={"telegram_id": 1, "username": "sql"})
+                again = await ac.post("/auth/telegram", params={"telegram_id": 1, "username": "sql"})
+                assert again.json()["message"] == "User already exists"
+                
+                for channel_id, subscribers in ((-1, 10), (-2, 30), (-3, 20)):
+                    await ac.post(
+                        "/channels/verify",
+                        params={
+                            "channel_id": channel_id,
+                            "channel_name": "SQL",
+                            "owner_id": 1,
+                            "subscribers": subscribers,
+                            "niche": "tech"
+                        }
+                    )
+                channels = (await ac.get("/channels/verified", params={"sort_by": "subscribers", "limit": 2})).json()
+                assert channels["count"] == 3
+                assert [ch["channel_id"] for ch in channels["channels"]] == [-2, -3]
+                rest = (await ac.get(
+                    "/channels/verified",
+                    params={"sort_by": "subscribers", "limit": 2, "cursor": channels["next_cursor"]}
+                )).json()
+                assert [ch["channel_id"] for ch in rest["channels"]] == [-1]
+                by_age = (await ac.get("/channels/verified", params={"limit": 1})).json()
+                rest = (await ac.get("/channels/verified", params={"limit": 5, "cursor": by_age["next_cursor"]})).json()
+                assert [ch["channel_id"] for ch in by_age["channels"] + rest["channels"]] == [-1, -2, -3]
+                found = (await ac.get(
+                    "/channels/search", params={"niche": ["tech", "art"], "min_subscribers": 15, "limit": 1}
+                )).json()
+                assert found["count"] == 2
+                assert [ch["channel_id"] for ch in found["channels"]] == [-2]
+                rest = (await ac.get(
+                    "/channels/search",
+                    params={"niche": ["tech", "art"], "min_subscribers": 15, "cursor": found["next_cursor"]}
+                )).json()
+                assert [ch["channel_id"] for ch in rest["channels"]] == [-3]
+                
+                created = await ac.post(
+                    "/bounties/create",
+                    json={
+                        "advertiser_id": 1,
+                        "ton_amount": 2.5,
+                        "ad_text": "SQL ad",
+                        "ad_link": "https://test.com",
+                        "target_channels": [-1, -2],
+                        "deadline_days": 3
+                    }
+                )
+                bounty_id = created.json()["bounty"]["bounty_id"]
+                fetched = await ac.get(f"/bounties/{bounty_id}")
+                assert fetched.json()["bounty"]["target_channels"] == [-1, -2]
+                etag = fetched.headers["etag"]
+                unchanged = await ac.get(f"/bounties/{bounty_id}", headers={"If-None-Match": etag})
+                assert unchanged.status_code == 304
+                feed = (await ac.get("/channels/-2/bounties")).json()
+                assert [b["bounty_id"] for b in feed["bounties"]] == [bounty_id] and feed["count"] == 1
+                
+                batch = await ac.post("/bounties/create/batch", json=[
+                    {"advertiser_id": 1, "ton_amount": 1.0, "ad_text": "SQL", "ad_link": "x", "target_channels": [-3]}
+                ] * 3)
+                assert batch.json()["count"] == 3
+                assert (await ac.get("/channels/-3/bounties")).json()["count"] == 3
+                renamed = await ac.post("/channels/verify/batch", json=[
+                    {"channel_id": -3, "channel_name": "Renamed", "owner_id": 1, "subscribers": 20, "niche": "tech"},
+                    {"channel_id": -4, "channel_name": "New", "owner_id": 1, "subscribers": 5, "niche": "tech"},
+                ])
+                assert renamed.status_code == 200
+                assert (await ac.get("/channels/verified")).json()["count"] == 4
+                
+                bid = await ac.post(
+                    f"/bounties/{bounty_id}/bid",
+                    json={"bounty_id": bounty_id, "channel_owner_id": 2, "channel_id": -1}
+                )
+                assert bid.status_code == 200
+                
+                confirmed = await ac.post(
+                    f"/bounties/{bounty_id}/confirm-views",
+                    json={"bounty_id": bounty_id, "channel_owner_id": 2}
+                )
+                assert confirmed.json()["bounty"]["status"] == "confirmed"
+                refetched = await ac.get(f"/bounties/{bounty_id}", headers={"If-None-Match": etag})
+                assert refetched.status_code == 200 and refetched.headers["etag"] != etag
+                feed = (await ac.get("/channels/-1/bounties")).json()
+                assert feed["count"] == 0 and feed["bounties"] == []
+                
+                # Advertiser 1: four escrow deposits and a payout; owner 2: the payout
+                for user_id, count in ((1, 5), (2, 1)):
+                    history = (await ac.get(f"/transactions/{user_id}")).json()
+                    assert history["count"] == count
+                stats = (await ac.get("/advertisers/1/stats")).json()["stats"]
+                assert stats["by_channel"] == [{"channel_id": None, "spent": 2_500_000_000, "payouts": 1}]
+                balance = (await ac.get("/users/1/balance")).json()["balance"]
+                assert balance == {
+                    "user_id": 1, "deposited": 5_500_000_000, "escrowed": 3_000_000_000, "earned": 0, "refunded": 0
+                }
+                assert (await ac.get("/users/2/balance")).json()["balance"]["earned"] == 2_500_000_000
+                
+                second = (await ac.post(
+                    "/bounties/create",
+                    json={
+                        "advertiser_id": 1,
+                        "ton_amount": 1.0,
+                        "ad_text": "SQL ad",
+                        "ad_link": "https://test.com",
+                        "target_channels": [-3]
+                    }
+                )).json()["bounty"]["bounty_id"]
+                await ac.post(
+                    f"/bounties/{second}/confirm-views",
+                    json={"bounty_id": second, "channel_owner_id": 3}
+                )
+                page = (await ac.get("/transactions/1", params={"limit": 5})).json()
+                assert page["count"] == 7
+                assert page["transactions"][0]["bounty_id"] == bounty_id
+                page = (await ac.get("/transactions/1", params={"limit": 5, "cursor": page["next_cursor"]})).json()
+                assert [tx["bounty_id"] for tx in page["transactions"]] == [second, second]
+                assert page["next_cursor"] is None
+                
+                missing = await ac.get("/bounties/missing")
+                assert missing.status_code == 404
+        finally:
+            app.dependency_overrides.clear()
+            await sql.close()
+    
+    def test_api_flow_on_sqlite(self, tmp_path):
+        asyncio.run(self._run_flow(tmp_path / "adbounty.db"))
+    
+    def test_sqlite_file_uses_wal_for_shared_workers(self, tmp_path):
+        async def pragmas():
+            sql = SQLStorage(f"sqlite:///{tmp_path / 'shared.db'}")
+            try:
+                async with sql.engine.connect() as conn:
+                    journal_mode = (await conn.exec_driver_sql("PRAGMA journal_mode")).scalar()
+                    busy_timeout = (await conn.exec_driver_sql("PRAGMA busy_timeout")).scalar()
+                return journal_mode, busy_timeout
+            finally:
+                await sql.close()
+        
+        assert asyncio.run(pragmas()) == ("wal", 5000)
+    
+    def test_memory_backend_refuses_multiple_workers(self, monkeypatch):
+        monkeypatch.setenv("STORAGE_BACKEND", "memory")
+        monkeypatch.setenv("WEB_CONCURRENCY", "4")
+        with pytest.raises(ValueError):
+            create_storage()
+
+
+class TestConcurrentConfirmations:
+    """Parallel confirm-views requests pay each bounty out exactly once"""
+    
+    async def _stress(self, store, bounties, attempts):
+        app.dependency_overrides[get_storage] = lambda: store
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as ac:
+                created = await asyncio.gather(*[
+                    ac.post("/bounties/create", json={
+                        "advertiser_id": 5000 + n,
+                        "ton_amount": 1.0,
+                        "ad_text": "Contended ad",
+                        "ad_link": "https://test.com",
+                        "target_channels": [-77],
+                        "deadline_days": 7
+                    }) for n in range(bounties)
+                ])
+                ids = [r.json()["bounty"]["bounty_id"] for r in created]
+                requests = [
+                    (bounty_id, {"bounty_id": bounty_id, "channel_owner_id": 9000 + attempt})
+                    for attempt in range(attempts) for bounty_id in ids
+                ]
+                random.Random(16).shuffle(requests)
+                responses = await asyncio.gather(*[
+                    ac.post(f"/bounties/{bounty_id}/confirm-views", json=payload) for bounty_id, payload in requests
+                ])
+        finally:
+            app.dependency_overrides.clear()
+        
+        codes = [r.status_code for r in responses]
+        assert codes.count(200) == bounties and codes.count(409) == bounties * (attempts - 1)
+        for n, bounty_id in enumerate(ids):
+            txs = (await store.list_user_transactions(5000 + n))[0]
+            assert [tx["bounty_id"] for tx in txs if tx["tx_type"] == "payout"] == [bounty_id]
+            assert (await store.get_bounty(bounty_id))["status"] == "confirmed"
+    
+    def test_memory_store(self):
+        asyncio.run(self._stress(MemoryStorage(), bounties=200, attempts=10))
+    
+    def test_sql_store(self, tmp_path):
+        async def run():
+            sql = SQLStorage(f"sqlite:///{tmp_path / 'confirm.db'}")
+            await sql.create_schema()
+            try:
+                await self._stress(sql, bounties=20, attempts=10)
+            finally:
+                await sql.close()
+        asyncio.run(run())
+    
+    async def _compare_and_set(self, store):
+        bounty = TestExpiry._bounty(1, datetime.utcnow() + timedelta(days=1))
+        await store.add_bounty(bounty)
+        payout = {
+            "tx_id": "tx_cas", "from_user": 101, "to_user": 7, "amount": 2.0, "tx_type": "payout",
+            "status": "success", "bounty_id": bounty["bounty_id"], "tx_hash": None, "created_at": datetime.utcnow(),
+        }
+        with pytest.raises(StatusConflict):
+            await store.set_bounty_status(bounty["bounty_id"], "confirmed", payout, expected="posted")
+        assert (await store.list_user_transactions(7))[1] == 0
+        assert await store.set_bounty_status("bounty_none", "confirmed", expected="pending") is None
+        bounty = await store.set_bounty_status(bounty["bounty_id"], "confirmed", payout, expected="pending")
+        assert bounty["status"] == "confirmed"
+        assert (await store.list_user_transactions(7))[1] == 1
+    
+    def test_compare_and_set(self, tmp_path):
+        async def run():
+            await self._compare_and_set(MemoryStorage())
+            sql = SQLStorage(f"sqlite:///{tmp_path / 'cas.db'}")
+            await sql.create_schema()
+            try:
+                await self._compare_and_set(sql)
+            finally:
+                await sql.close()
+        asyncio.run(run())
+
+
+class TestJournal:
+    """Journal replay and snapshot recovery for the in-memory stores"""
+    
+    def _transaction(self, n):
+        return {
+            "tx_id": f"tx_{n}",
+            "from_user": 1,
+            "to_user": 2,
+            "amount": 1.0,
+            "tx_type": "payout",
+            "status": "success",
+            "bounty_id": "bounty_1",
+            "tx_hash": None,
+            "created_at": None
+        }
+    
+    async def _reopen(self, directory):
+        store = MemoryStorage(Journal(str(directory), snapshot_interval=0))
+        await store.open()
+        return store
+    
+    def test_restart_replays_journal_and_snapshot(self, tmp_path):
+        async def scenario():
+            store = await self._reopen(tmp_path)
+            await store.add_bounty({"bounty_id": "bounty_1", "status": "pending", "advertiser_id": 1})
+            await asyncio.gather(*(store.add_transaction(self._transaction(n)) for n in range(10)))
+            await store.journal.snapshot()
+            await store.set_bounty_status("bounty_1", "confirmed", self._transaction(10))
+            # Simulate a crash: the journal tail is durable but no final snapshot is written
+            await store.journal.close(snapshot=False)
+            
+            restored = await self._reopen(tmp_path)
+            assert restored.bounties["bounty_1"].to_dict()["status"] == "confirmed"
+            _, total = await restored.list_user_transactions(2)
+            assert total == 11
+            assert (await restored.get_balance(2))["earned"] == 11 * 10**9
+            await restored.close()
+            
+            compacted = await self._reopen(tmp_path)
+            assert [name for name in sorted(tmp_path.iterdir()) if name.name.startswith("journal-")] == [
+                tmp_path / "journal-00000002.log"
+            ]
+            assert len(compacted.transactions) == 11
+            await compacted.close()
+        
+        asyncio.run(scenario())
+    
+    def test_snapshot_replays_segments_without_forking(self, tmp_path, monkeypatch):
+        def no_fork():
+            raise AssertionError("snapshots must not fork the server")
+        monkeypatch.setattr(os, "fork", no_fork)
+        
+        async def scenario():
+            store = await self._reopen(tmp_path)
+            await asyncio.gather(*(store.add_transaction(self._transaction(n)) for n in range(5)))
+            await store.journal.snapshot()
+            await store.add_transaction(self._transaction(5))
+            await store.journal.snapshot()
+            # Written to memory only, never journaled: a snapshot built from the journal leaves it out
+            store._apply_transaction(self._transaction(6))
+            await store.journal.close(snapshot=False)
+            assert [name.name for name in tmp_path.iterdir() if name.name.startswith("journal-")] == ["journal-00000002.log"]
+            
+            restored = await self._reopen(tmp_path)
+            assert sorted(restored.transactions) == [f"tx_{n}" for n in range(6)]
+            assert (await restored.get_balance(2))["earned"] == 6 * 10**9
+            await restored.close()
+        
+        asyncio.run(scenario())
+    
+    def test_torn_tail_is_discarded(self, tmp_path):
+        async def scenario():
+            store = await self._reopen(tmp_path)
+            await store.add_transaction(self._transaction(1))
+            await store.journal.close(snapshot=False)
+            with open(tmp_path / "journal-00000000.log", "ab") as f:
+                f.write(b"\xff\x00\x00\x00partial")
+            
+            restored = await self._reopen(tmp_path)
+            assert list(restored.transactions) == ["tx_1"]
+            await restored.close()
+        
+        asyncio.run(scenario())
+
+
+class TestExpiry:
+    """Deadline expiry and escrow refunds"""
+    
+    @staticmethod
+    def _bounty(n, deadline):
+        return {
+            "bounty_id": f"bounty_{n:04d}",
+            "advertiser_id": 100 + n % 3,
+            "ton_amount": 2.0,
+            "ad_text": "Expiring ad",
+            "ad_link": "https://test.com",
+            "target_channels": [-5],
+            "status": "pending",
+            "escrow_address": None,
+            "created_at": deadline - timedelta(days=7),
+            "deadline": deadline,
+        }
+    
+    async def _expire_in_batches(self, store):
+        now = datetime.utcnow()
+        for n in range(25):
+            await store.add_bounty(self._bounty(n, now - timedelta(minutes=n)))
+        await store.add_bounty(self._bounty(99, now + timedelta(days=1)))
+        await store.set_bounty_status("bounty_0003", "confirmed")
+        
+        scheduler = ExpiryScheduler(store, batch_size=10)
+        await scheduler.start()
+        await scheduler.close()  # drive it by hand below
+        # A stale entry for a bounty that is no longer pending is skipped, not refunded
+        scheduler.schedule("bounty_0003", now - timedelta(minutes=3))
+        assert len(scheduler) == 26
+        assert [await scheduler.expire_due(now) for _ in range(4)] == [10, 10, 4, 0]
+        assert len(scheduler) == 1
+        
+        assert (await store.get_bounty("bounty_0003"))["status"] == "confirmed"
+        assert (await store.get_bounty("bounty_0010"))["status"] == "expired"
+        assert (await store.get_bounty("bounty_0099"))["status"] == "pending"
+        refunds = [tx for user in (100, 101, 102) for tx in (await store.list_user_transactions(user))[0]]
+        assert len(refunds) == 24 and {tx["tx_type"] for tx in refunds} == {"refund"}
+        assert await store.expire_bounties(["bounty_0010"], now) == []
+        assert (await store.list_channel_bounties(-5))[1] == 1
+    
+    def test_expire_memory_store(self):
+        asyncio.run(self._expire_in_batches(MemoryStorage()))
+    
+    def test_expire_sql_store(self, tmp_path):
+        async def run():
+            sql = SQLStorage(f"sqlite:///{tmp_path / 'expiry.db'}")
+            await sql.create_schema()
+            try:
+                await self._expire_in_batches(sql)
+            finally:
+                await sql.close()
+        asyncio.run(run())
+    
+    def test_loop_wakes_for_an_earlier_deadline(self):
+        async def run():
+            store = MemoryStorage()
+            scheduler = ExpiryScheduler(store)
+            await scheduler.start()
+            try:
+                bounty = self._bounty(1, datetime.utcnow() + timedelta(milliseconds=50))
+                await store.add_bounty(bounty)
+                scheduler.schedule(bounty["bounty_id"], bounty["deadline"])
+                for _ in range(100):
+                    await asyncio.sleep(0.01)
+                    if (await store.get_bounty(bounty["bounty_id"]))["status"] == "expired":
+                        break
+                assert (await store.get_bounty(bounty["bounty_id"]))["status"] == "expired"
+            finally:
+                await scheduler.close()
+        asyncio.run(run())
 
 
 if __name__ == "__main__":
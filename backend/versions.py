@@ -0,0 +1,57 @@
+"""
+AdBounty Backend - Version counters for conditional GETs
+Stores bump a counter per entity or collection on every write; handlers expose them as ETags
+"""
+
+import secrets
+from typing import Dict, Hashable, Iterable, Optional
+
+# Counter keys for collections; entities use (kind, id) tuples such as ("bounty", bounty_id)
+CHANNELS = "channels"
+
+
+class VersionCounters:
+    """Monotonic per-key write counters, valid within one process.
+
+    ETags combine the counter with a random epoch drawn at startup, so a
+    restart (which resets the counters) never revalidates a stale copy.
+    Counters only see writes made through this process's store, so they must
+    not be used when several processes write to the same database.
+    """
+
+    def __init__(self):
+        self.epoch = secrets.token_hex(4)
+        self._versions: Dict[Hashable, int] = {}
+
+    def bump(self, key: Hashable) -> None:
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+    def bump_many(self, keys: Iterable[Hashable]) -> None:
+        versions = self._versions
+        for key in keys:
+            versions[key] = versions.get(key, 0) + 1
+
+    def get(self, key: Hashable) -> int:
+        return self._versions.get(key, 0)
+
+    def etag(self, key: Hashable) -> str:
+        return f'"{self.epoch}-{self._versions.get(key, 0)}"'
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against our ETag, as RFC 9110 asks for GETs.
+
+    "*" is not honoured: the counters cannot tell whether the resource exists.
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
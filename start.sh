@@ -9,7 +9,7 @@ serve -s public -l 3000 &
 echo "✅ Mini App rodando na porta 3000"
 
 # Inicia o backend FastAPI na porta $PORT (definida pelo Railway)
-uvicorn backend.main:app --host 0.0.0.0 --port $PORT &
+uvicorn main:app --app-dir backend --host 0.0.0.0 --port $PORT &
 echo "✅ Backend rodando na porta $PORT"
 
 # Inicia o bot